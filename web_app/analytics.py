@@ -0,0 +1,467 @@
+# web_app/analytics.py
+# Pure pandas computations behind the pages. Nothing here imports streamlit:
+# every function takes the dataset frame (or a date-range slice of it from
+# utils.slice_date_range) plus plain parameters and returns frames, series,
+# dicts or scalars, so results can be cached, benchmarked or served elsewhere.
+# Each computation is recorded as a perf span named 'analytics.<function>'.
+#
+# Functions taking `sketches` (a sketches.ColumnSketches for the same rows,
+# see PartitionedDataset.sketches) use it for distinct counts and quantiles
+# instead of scanning the columns; without it the results are exact.
+import numpy as np
+import pandas as pd
+
+import inventory_policy
+from perf import timed
+
+DEMAND_LABELS = ['Low', 'Medium', 'High']
+
+
+def revenue(df):
+    """Per-row revenue after discount"""
+    return df['Units Sold'] * df['Price'] * (1 - df['Discount'] / 100)
+
+
+def demand_levels(values, sketches=None):
+    """Split values into equal-count Low/Medium/High demand levels"""
+    if sketches is None:
+        return pd.qcut(values, q=3, labels=DEMAND_LABELS)
+    # Approximate tercile edges instead of sorting the whole column
+    edges = [-np.inf, sketches.quantile(values.name, 1 / 3), sketches.quantile(values.name, 2 / 3), np.inf]
+    return pd.cut(values, bins=edges, labels=DEMAND_LABELS)
+
+
+def distinct_count(df, column, sketches=None):
+    """Number of distinct values in `column`, estimated when `sketches` are given"""
+    if sketches is None:
+        return df[column].nunique()
+    return sketches.distinct(column)
+
+
+def column_quantile(df, column, q, sketches=None):
+    """Quantile `q` of `column`, estimated when `sketches` are given"""
+    if sketches is None:
+        return df[column].quantile(q)
+    return sketches.quantile(column, q)
+
+
+# ---------------------------------------------------------------------- #
+# Dashboard
+# ---------------------------------------------------------------------- #
+@timed()
+def kpis(df, sketches=None):
+    """Headline business metrics"""
+    return {
+        'total_units_sold': df['Units Sold'].sum(),
+        'avg_daily_sales': df.groupby('Date')['Units Sold'].sum().mean(),
+        'total_revenue': revenue(df).sum(),
+        'unique_products': distinct_count(df, 'Product ID', sketches),
+    }
+
+
+@timed()
+def category_sales(df):
+    """Total units sold per category"""
+    return df.groupby('Category')['Units Sold'].sum().reset_index()
+
+
+@timed()
+def category_average_sales(df):
+    """Average units sold per record for each category, highest first"""
+    return df.groupby('Category')['Units Sold'].mean().reset_index().sort_values('Units Sold', ascending=False)
+
+
+@timed()
+def region_sales(df):
+    """Total units sold per region"""
+    return df.groupby('Region')['Units Sold'].sum().reset_index()
+
+
+@timed()
+def store_sales(df):
+    """Total units sold per store, highest first"""
+    return df.groupby('Store ID')['Units Sold'].sum().reset_index().sort_values('Units Sold', ascending=False)
+
+
+@timed()
+def region_category_matrix(df):
+    """Units sold with categories as rows and regions as columns"""
+    region_category = df.groupby(['Region', 'Category'])['Units Sold'].sum().reset_index()
+    return region_category.pivot(index='Category', columns='Region', values='Units Sold')
+
+
+@timed()
+def daily_sales(df):
+    """Total units sold per day"""
+    return df.groupby('Date')['Units Sold'].sum().reset_index()
+
+
+@timed()
+def monthly_sales(df):
+    """Total units sold per calendar month ('YYYY-MM')"""
+    month = df['Date'].dt.to_period('M').astype(str).rename('Month')
+    return df.groupby(month)['Units Sold'].sum().reset_index()
+
+
+@timed()
+def seasonal_sales(df):
+    """Total units sold per season"""
+    return df.groupby('Seasonality')['Units Sold'].sum().reset_index()
+
+
+@timed()
+def inventory_sample(df, n=5000):
+    """Random sample of at most `n` rows for scatter plots"""
+    return df.sample(min(n, len(df)))
+
+
+@timed()
+def demand_breakdown(df, sketches=None):
+    """Demand level counts overall and per category.
+
+    Levels are equal-count terciles of `Units Ordered`. Returns the overall
+    distribution and the per-category counts in long form.
+    """
+    levels = demand_levels(df['Units Ordered'], sketches).rename('Demand_Level')
+    distribution = levels.value_counts().reset_index()
+    distribution.columns = ['Demand Level', 'Count']
+    by_category = pd.crosstab(df['Category'], levels)
+    by_category = by_category.reset_index().melt(id_vars='Category', var_name='Demand Level', value_name='Count')
+    return distribution, by_category
+
+
+@timed()
+def business_insights(df):
+    """Figures for the Key Business Insights section"""
+    seasonal_avg = df.groupby('Seasonality')['Units Sold'].mean()
+    return {
+        'top_categories': df.groupby('Category')['Units Sold'].sum().sort_values(ascending=False).head(3),
+        'top_regions': df.groupby('Region')['Units Sold'].sum().sort_values(ascending=False),
+        'seasonal_avg': seasonal_avg,
+        'best_season': seasonal_avg.idxmax(),
+        'worst_season': seasonal_avg.idxmin(),
+        'avg_price': df['Price'].mean(),
+        'avg_discount': df['Discount'].mean(),
+        'discounted_share': (df['Discount'] > 0).sum() / len(df) * 100,
+    }
+
+
+def predict_demand(category, price, discount, inventory, holiday):
+    """Rule-based demand level for the sidebar prediction tool.
+
+    Returns the level ('HIGH', 'MEDIUM' or 'LOW') and the factors that
+    contributed to it.
+    """
+    score = 0
+    factors = []
+    if price < 40:
+        score += 2
+        factors.append("✓ Competitive pricing attracts more customers")
+    if discount > 15:
+        score += 2
+        factors.append("✓ Strong discount driving high demand")
+    if holiday:
+        score += 1
+        factors.append("✓ Holiday/promotion period increases sales")
+    if category in ["Electronics", "Toys"]:
+        score += 1
+        factors.append("✓ Popular category with high demand")
+    if inventory < 150:
+        score += 1
+        factors.append("✓ Low inventory may indicate high demand")
+
+    if score >= 4:
+        return "HIGH", factors
+    elif score >= 2:
+        return "MEDIUM", factors
+    else:
+        return "LOW", factors
+
+
+# ---------------------------------------------------------------------- #
+# Alerts
+# ---------------------------------------------------------------------- #
+@timed()
+def alert_thresholds(df, sketches=None):
+    """Low stock (bottom 20% inventory) and high demand (top 20% ordered) cut-offs"""
+    return {
+        'low_stock': column_quantile(df, 'Inventory Level', 0.2, sketches),
+        'high_demand': column_quantile(df, 'Units Ordered', 0.8, sketches),
+    }
+
+
+@timed()
+def low_stock_alerts(df, threshold, top=10):
+    """Number of rows below `threshold` and the lowest product/store averages"""
+    low_stock = df[df['Inventory Level'] < threshold]
+    summary = low_stock.groupby(['Product ID', 'Category', 'Store ID']).agg({
+        'Inventory Level': 'mean',
+        'Units Sold': 'mean',
+        'Price': 'mean'
+    }).reset_index()
+    return len(low_stock), summary.sort_values('Inventory Level').head(top)
+
+
+@timed()
+def high_demand_alerts(df, threshold, top=10):
+    """Number of rows above `threshold` units ordered and the highest product/region averages"""
+    high_demand = df[df['Units Ordered'] > threshold]
+    summary = high_demand.groupby(['Product ID', 'Category', 'Region']).agg({
+        'Units Ordered': 'mean',
+        'Inventory Level': 'mean',
+        'Price': 'mean',
+        'Discount': 'mean'
+    }).reset_index()
+    return len(high_demand), summary.sort_values('Units Ordered', ascending=False).head(top)
+
+
+@timed()
+def discount_alerts(df, top=10, sketches=None):
+    """Rows with a >15% discount but bottom-30% sales, summarized per product"""
+    flagged = df[(df['Discount'] > 15) & (df['Units Sold'] < column_quantile(df, 'Units Sold', 0.3, sketches))]
+    summary = flagged.groupby(['Product ID', 'Category']).agg({
+        'Discount': 'mean',
+        'Units Sold': 'mean',
+        'Price': 'mean'
+    }).reset_index()
+    return len(flagged), summary.sort_values('Discount', ascending=False).head(top)
+
+
+@timed()
+def competitor_price_alerts(df, markup=1.2, top=10):
+    """Rows priced above `markup` times competitor pricing, summarized per product"""
+    flagged = df[df['Price'] > df['Competitor Pricing'] * markup]
+    summary = flagged.groupby(['Product ID', 'Category']).agg({
+        'Price': 'mean',
+        'Competitor Pricing': 'mean',
+        'Units Sold': 'mean'
+    }).reset_index()
+    summary['Price Difference'] = summary['Price'] - summary['Competitor Pricing']
+    return len(flagged), summary.sort_values('Price Difference', ascending=False).head(top)
+
+
+@timed()
+def underperforming_stores(df, ratio=0.8):
+    """Stores whose total sales are below `ratio` times the store average"""
+    store_performance = df.groupby('Store ID').agg({
+        'Units Sold': 'sum',
+        'Inventory Level': 'mean'
+    }).reset_index()
+    store_performance = store_performance.sort_values('Units Sold')
+    avg_sales = store_performance['Units Sold'].mean()
+    return store_performance[store_performance['Units Sold'] < avg_sales * ratio]
+
+
+@timed()
+def stockout_risk(df):
+    """Categories in the top quartile of units ordered minus units sold"""
+    category_performance = df.groupby('Category').agg({
+        'Units Sold': 'sum',
+        'Inventory Level': 'mean',
+        'Units Ordered': 'sum'
+    }).reset_index()
+    category_performance['Demand vs Supply'] = category_performance['Units Ordered'] - category_performance['Units Sold']
+    gap = category_performance['Demand vs Supply']
+    at_risk = category_performance[gap > gap.quantile(0.75)]
+    return at_risk.sort_values('Demand vs Supply', ascending=False)
+
+
+@timed()
+def alert_snapshot(df, sketches=None):
+    """Every alert set for a frame, as computed by the Alerts page"""
+    thresholds = alert_thresholds(df, sketches)
+    low_stock_count, low_stock = low_stock_alerts(df, thresholds['low_stock'])
+    high_demand_count, high_demand = high_demand_alerts(df, thresholds['high_demand'])
+    discount_count, discount = discount_alerts(df, sketches=sketches)
+    competitor_count, competitor = competitor_price_alerts(df)
+    policy = inventory_policy.reorder_policy(df)
+    return {
+        'thresholds': thresholds,
+        'low_stock': {'count': low_stock_count, 'table': low_stock},
+        'reorder': {
+            'count': int(policy['Reorder'].sum()),
+            'table': inventory_policy.reorder_recommendations(policy, top=10),
+        },
+        'high_demand': {'count': high_demand_count, 'table': high_demand},
+        'discount': {'count': discount_count, 'table': discount},
+        'competitor_price': {'count': competitor_count, 'table': competitor},
+        'underperforming_stores': underperforming_stores(df),
+        'stockout_risk': stockout_risk(df),
+    }
+
+
+@timed()
+def filter_records(df, categories=None, regions=None, stores=None):
+    """Rows matching the selected categories, regions and stores (empty = all)"""
+    if categories:
+        df = df[df['Category'].isin(categories)]
+    if regions:
+        df = df[df['Region'].isin(regions)]
+    if stores:
+        df = df[df['Store ID'].isin(stores)]
+    return df
+
+
+# ---------------------------------------------------------------------- #
+# Products
+# ---------------------------------------------------------------------- #
+@timed()
+def product_summary(df):
+    """One row per product with inventory, sales, pricing and demand level"""
+    summary = df.groupby(['Product ID', 'Category']).agg({
+        'Inventory Level': 'mean',
+        'Units Sold': 'sum',
+        'Units Ordered': 'sum',
+        'Price': 'mean',
+        'Discount': 'mean',
+        'Store ID': 'nunique',
+        'Region': lambda x: ', '.join(x.unique()[:3])  # Show first 3 regions
+    }).reset_index()
+    summary.columns = [
+        'Product ID', 'Category', 'Avg Inventory', 'Total Units Sold',
+        'Total Units Ordered', 'Avg Price', 'Avg Discount', 'Stores', 'Regions'
+    ]
+    summary['Demand Level'] = demand_levels(summary['Total Units Ordered'])
+    return summary
+
+
+@timed()
+def product_totals(df):
+    """Summary metrics for the filtered product list"""
+    return {
+        'unique_products': df['Product ID'].nunique(),
+        'total_inventory': df['Inventory Level'].sum(),
+        'avg_price': df['Price'].mean(),
+        'total_sales': df['Units Sold'].sum(),
+    }
+
+
+@timed()
+def category_stats(df):
+    """Sales total, average inventory and average price per category"""
+    return df.groupby('Category').agg({
+        'Units Sold': 'sum',
+        'Inventory Level': 'mean',
+        'Price': 'mean'
+    }).reset_index()
+
+
+@timed()
+def store_stats(df):
+    """Sales total, product count and average inventory per store"""
+    stats = df.groupby('Store ID').agg({
+        'Units Sold': 'sum',
+        'Product ID': 'nunique',
+        'Inventory Level': 'mean'
+    }).reset_index()
+    stats.columns = ['Store ID', 'Total Sales', 'Unique Products', 'Avg Inventory']
+    return stats
+
+
+@timed()
+def price_analysis(df):
+    """Price range, discount and sales per category"""
+    analysis = df.groupby('Category').agg({
+        'Price': ['mean', 'min', 'max'],
+        'Discount': 'mean',
+        'Units Sold': 'sum'
+    }).reset_index()
+    analysis.columns = ['Category', 'Avg Price', 'Min Price', 'Max Price', 'Avg Discount', 'Total Sales']
+    return analysis
+
+
+@timed()
+def product_records(df, product_id):
+    """All rows for one product"""
+    return df[df['Product ID'] == product_id]
+
+
+@timed()
+def product_detail(records):
+    """Information and performance metrics for one product's rows"""
+    return {
+        'category': records['Category'].iloc[0],
+        'avg_price': records['Price'].mean(),
+        'avg_discount': records['Discount'].mean(),
+        'store_count': records['Store ID'].nunique(),
+        'regions': list(records['Region'].unique()),
+        'total_units_sold': records['Units Sold'].sum(),
+        'total_units_ordered': records['Units Ordered'].sum(),
+        'avg_inventory': records['Inventory Level'].mean(),
+        'total_revenue': revenue(records).sum(),
+    }
+
+
+@timed()
+def product_timeline(records):
+    """Daily sales, inventory and price for one product's rows"""
+    return records.groupby('Date').agg({
+        'Units Sold': 'sum',
+        'Inventory Level': 'mean',
+        'Price': 'mean'
+    }).reset_index().sort_values('Date')
+
+
+# ---------------------------------------------------------------------- #
+# Admin
+# ---------------------------------------------------------------------- #
+@timed()
+def system_statistics(df, sketches=None):
+    """Record, date span, store and product counts"""
+    return {
+        'total_records': len(df),
+        'date_range_days': (df['Date'].max() - df['Date'].min()).days,
+        'total_stores': distinct_count(df, 'Store ID', sketches),
+        'total_products': distinct_count(df, 'Product ID', sketches),
+    }
+
+
+@timed()
+def data_completeness(df):
+    """Counts of complete rows and missing values"""
+    return {
+        'Total Records': len(df),
+        'Complete Records': len(df.dropna()),
+        'Missing Values': df.isnull().sum().sum()
+    }
+
+
+@timed()
+def data_ranges(df, sketches=None):
+    """Date span and number of distinct categorical values"""
+    return {
+        'start_date': df['Date'].min(),
+        'end_date': df['Date'].max(),
+        'categories': distinct_count(df, 'Category', sketches),
+        'regions': distinct_count(df, 'Region', sketches),
+        'weather_conditions': distinct_count(df, 'Weather Condition', sketches),
+    }
+
+
+@timed()
+def sales_performance(df):
+    """Sales, revenue and average daily sales"""
+    return {
+        'total_sales': df['Units Sold'].sum(),
+        'total_revenue': revenue(df).sum(),
+        'avg_daily_sales': df.groupby('Date')['Units Sold'].sum().mean(),
+    }
+
+
+@timed()
+def inventory_performance(df):
+    """Inventory averages, value and turnover"""
+    total_sales = df['Units Sold'].sum()
+    avg_inventory = df['Inventory Level'].mean()
+    return {
+        'avg_inventory': avg_inventory,
+        'total_inventory': df['Inventory Level'].sum(),
+        'inventory_value': (df['Inventory Level'] * df['Price']).sum(),
+        'inventory_turnover': total_sales / avg_inventory if avg_inventory > 0 else 0,
+    }
+
+
+@timed()
+def record_counts(df, column):
+    """Number of records per value of `column`"""
+    return df[column].value_counts()
@@ -0,0 +1,319 @@
+# web_app/anomaly.py
+# Streaming sales anomaly detection. The daily Units Sold of every
+# store/product pair, and every store's daily total, feed exponentially
+# weighted estimates of the series' level and spread, overall and per
+# weekday. Each new day is scored against the estimates built from the days
+# before it and then folded in, so a day costs O(1) per series and history
+# is never replayed. Values more than Z_THRESHOLD spreads from the level
+# (or from the level for that weekday) are recorded as anomalies.
+#
+# The state lives in data/anomaly/state.npz with the checksums of the
+# partitions it has consumed: days added to the dataset are applied
+# incrementally, a change to days already consumed rebuilds the state.
+# No streamlit import, like analytics.
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datastore import frame_checksum
+from perf import span
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_PATH = os.path.join(ROOT_DIR, 'data', 'anomaly', 'state.npz')
+
+# Smoothing: ~20 days of memory for the level, ~10 weeks for each weekday
+LEVEL_ALPHA = 0.05
+WEEKDAY_ALPHA = 0.1
+# Observations before a series (or one of its weekdays) is scored
+WARMUP_DAYS = 14
+WARMUP_WEEKS = 8
+Z_THRESHOLD = 4.0
+# Spread floor in units, so near-constant series do not flag every wobble
+MIN_SPREAD = 1.0
+MAX_EVENTS = 100_000
+
+COLUMNS = ['Date', 'Store ID', 'Product ID', 'Units Sold']
+CHECKS = ('level', 'weekday')
+# Bumped when the state layout or the parameters above change the results
+STATE_FORMAT = [1, LEVEL_ALPHA, WEEKDAY_ALPHA, WARMUP_DAYS, WARMUP_WEEKS, Z_THRESHOLD, MIN_SPREAD]
+
+
+def _ewm_update(count, mean, var, x, alpha, warm, spread):
+    """Fold `x` into running means/variances; Welford-equivalent until 1/n drops below alpha.
+
+    Deviations of scored values are clipped at Z_THRESHOLD spreads, so an
+    outlier moves the estimates no more than a borderline value would.
+    """
+    weight = np.maximum(1.0 / (count + 1), alpha)
+    delta = x - mean
+    delta = np.where(warm, np.clip(delta, -Z_THRESHOLD * spread, Z_THRESHOLD * spread), delta)
+    mean = mean + weight * delta
+    var = (1 - weight) * (var + weight * delta ** 2)
+    return count + 1, mean, var
+
+
+class SeriesState:
+    """Running level and variance of many series, overall and by weekday"""
+
+    FIELDS = ('count', 'mean', 'var', 'weekday_count', 'weekday_mean', 'weekday_var')
+
+    def __init__(self, size=0):
+        self.count = np.zeros(size, dtype=np.int64)
+        self.mean = np.zeros(size)
+        self.var = np.zeros(size)
+        self.weekday_count = np.zeros((size, 7), dtype=np.int64)
+        self.weekday_mean = np.zeros((size, 7))
+        self.weekday_var = np.zeros((size, 7))
+
+    def __len__(self):
+        return len(self.count)
+
+    def grow(self, size):
+        """Add zeroed state for new series up to `size`"""
+        extra = size - len(self)
+        if extra <= 0:
+            return
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros((extra,) + array.shape[1:], dtype=array.dtype)]))
+
+    def observe(self, idx, x, weekday):
+        """Score one day's values `x` of series `idx`, then fold them in.
+
+        Returns (level, level_z, weekday_level, weekday_z); z-scores are NaN
+        while a series is still warming up.
+        """
+        count, mean, var = self.count[idx], self.mean[idx], self.var[idx]
+        spread = np.maximum(np.sqrt(var), MIN_SPREAD)
+        warm = count >= WARMUP_DAYS
+        level_z = np.where(warm, (x - mean) / spread, np.nan)
+        self.count[idx], self.mean[idx], self.var[idx] = _ewm_update(count, mean, var, x, LEVEL_ALPHA, warm, spread)
+
+        w_count = self.weekday_count[idx, weekday]
+        w_mean, w_var = self.weekday_mean[idx, weekday], self.weekday_var[idx, weekday]
+        w_spread = np.maximum(np.sqrt(w_var), MIN_SPREAD)
+        w_warm = w_count >= WARMUP_WEEKS
+        weekday_z = np.where(w_warm, (x - w_mean) / w_spread, np.nan)
+        (self.weekday_count[idx, weekday], self.weekday_mean[idx, weekday],
+         self.weekday_var[idx, weekday]) = _ewm_update(w_count, w_mean, w_var, x, WEEKDAY_ALPHA, w_warm, w_spread)
+        return mean, level_z, w_mean, weekday_z
+
+    def arrays(self, prefix):
+        return {f'{prefix}{name}': getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        state = cls()
+        for name in cls.FIELDS:
+            setattr(state, name, arrays[f'{prefix}{name}'])
+        return state
+
+
+def _key_index(keys, values):
+    """Positions of `values` (tuples or labels) in the ordered dict `keys`, adding new ones"""
+    codes, uniques = pd.factorize(values)
+    lookup = np.empty(len(uniques), dtype=np.intp)
+    for i, key in enumerate(uniques):
+        lookup[i] = keys.setdefault(key, len(keys))
+    return lookup[codes]
+
+
+class AnomalyDetector:
+    """Process-wide streaming detector over the partitioned dataset"""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        self.pairs = SeriesState()
+        self.stores = SeriesState()
+        self.pair_keys = {}
+        self.store_keys = {}
+        self.through = None
+        # month -> [partition checksum, checksum of the rows consumed from it]
+        self.months = {}
+        self._events = []
+
+    # ------------------------------------------------------------------ #
+    # Updates
+    # ------------------------------------------------------------------ #
+    def update(self, dataset):
+        """Consume the days added to `dataset` since the last update.
+
+        Returns {'days', 'anomalies', 'rebuilt'}; a dataset whose partitions
+        are unchanged costs one checksum comparison.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            checksums = dataset.checksums()
+            if checksums == {month: sums[0] for month, sums in self.months.items()}:
+                return {'days': 0, 'anomalies': 0, 'rebuilt': False}
+            with span('anomaly.update') as update_span:
+                rows, rebuilt = self._new_rows(dataset, checksums)
+                before = sum(len(events['series']) for events in self._events)
+                days = self._consume(rows)
+                for month, part in rows.groupby(rows['Date'].dt.strftime('%Y-%m'), sort=False):
+                    self.months[month] = [checksums[month], frame_checksum(part.reset_index(drop=True))]
+                update_span['rows'] = len(rows)
+                self._save()
+            anomalies = sum(len(events['series']) for events in self._events) - before
+            return {'days': days, 'anomalies': anomalies, 'rebuilt': rebuilt}
+
+    def _new_rows(self, dataset, checksums):
+        """Rows from the start of the last consumed month; resets the state when consumed rows changed"""
+        if self.through is not None:
+            through_month = f"{self.through:%Y-%m}"
+            changed = [month for month, sums in self.months.items() if checksums.get(month) != sums[0]]
+            if all(month == through_month for month in changed):
+                rows = dataset.read(start=f'{through_month}-01', columns=COLUMNS)
+                consumed = rows[rows['Date'] <= self.through].reset_index(drop=True)
+                if not changed or frame_checksum(consumed) == self.months[through_month][1]:
+                    return rows, False
+        self._reset()
+        return dataset.read(columns=COLUMNS), True
+
+    def _consume(self, rows):
+        """Score and fold in every day after `through`; returns the number of days consumed"""
+        if self.through is not None:
+            rows = rows[rows['Date'] > self.through]
+        if len(rows) == 0:
+            return 0
+        pair = _key_index(self.pair_keys, pd.MultiIndex.from_arrays([rows['Store ID'], rows['Product ID']]))
+        store = _key_index(self.store_keys, rows['Store ID'].to_numpy())
+        self.pairs.grow(len(self.pair_keys))
+        self.stores.grow(len(self.store_keys))
+        units = rows['Units Sold'].to_numpy(dtype=np.float64)
+        dates = rows['Date'].to_numpy().astype('datetime64[D]')
+        days, starts = np.unique(dates, return_index=True)
+        ends = np.append(starts[1:], len(dates))
+        # 1970-01-01 was a Thursday; 0 = Monday as in pandas
+        weekdays = (days.astype(np.int64) + 3) % 7
+        for day, weekday, lo, hi in zip(days, weekdays, starts, ends):
+            for kind, state, idx in (('pair', self.pairs, pair[lo:hi]), ('store', self.stores, store[lo:hi])):
+                # Several rows of a series on one day (and every row of a store) are summed
+                series, inverse = np.unique(idx, return_inverse=True)
+                x = np.bincount(inverse, weights=units[lo:hi], minlength=len(series))
+                self._flag(day, kind, series, x, *state.observe(series, x, weekday))
+        self.through = pd.Timestamp(days[-1])
+        return len(days)
+
+    def _flag(self, day, kind, series, x, level, level_z, weekday_level, weekday_z):
+        level_hit = np.abs(level_z) >= Z_THRESHOLD
+        weekday_hit = np.abs(weekday_z) >= Z_THRESHOLD
+        hit = level_hit | weekday_hit
+        if not hit.any():
+            return
+        # Report the check with the larger deviation
+        use_weekday = weekday_hit & ~(level_hit & (np.abs(level_z) >= np.abs(weekday_z)))
+        self._events.append({
+            'date': np.full(hit.sum(), day),
+            'kind': np.full(hit.sum(), kind == 'store', dtype=bool),
+            'series': series[hit],
+            'value': x[hit],
+            'expected': np.where(use_weekday, weekday_level, level)[hit],
+            'z': np.where(use_weekday, weekday_z, level_z)[hit],
+            'check': use_weekday[hit],
+        })
+        total = sum(len(events['series']) for events in self._events)
+        if total > MAX_EVENTS:
+            merged = self._merged_events()
+            self._events = [{name: values[-MAX_EVENTS:] for name, values in merged.items()}]
+
+    def _merged_events(self):
+        if not self._events:
+            return {
+                'date': np.array([], dtype='datetime64[D]'), 'kind': np.array([], dtype=bool),
+                'series': np.array([], dtype=np.intp), 'value': np.array([]), 'expected': np.array([]),
+                'z': np.array([]), 'check': np.array([], dtype=bool),
+            }
+        return {name: np.concatenate([events[name] for events in self._events]) for name in self._events[0]}
+
+    # ------------------------------------------------------------------ #
+    # Queries
+    # ------------------------------------------------------------------ #
+    def anomalies(self, kind='store', start=None, end=None):
+        """Anomalies of store totals ('store') or store/product pairs ('pair') between `start` and `end`.
+
+        Newest first, then by the size of the deviation.
+        """
+        with self._lock:
+            events = self._merged_events()
+            pair_keys = list(self.pair_keys)
+            store_keys = list(self.store_keys)
+        keep = events['kind'] == (kind == 'store')
+        if start is not None:
+            keep &= events['date'] >= np.datetime64(pd.Timestamp(start).date())
+        if end is not None:
+            keep &= events['date'] <= np.datetime64(pd.Timestamp(end).date())
+        events = {name: values[keep] for name, values in events.items()}
+        result = pd.DataFrame({'Date': pd.to_datetime(events['date'])})
+        if kind == 'store':
+            result['Store ID'] = [store_keys[i] for i in events['series']]
+        else:
+            result['Store ID'] = [pair_keys[i][0] for i in events['series']]
+            result['Product ID'] = [pair_keys[i][1] for i in events['series']]
+        result['Units Sold'] = events['value']
+        result['Expected'] = events['expected']
+        result['Z-Score'] = events['z']
+        result['Check'] = np.array(CHECKS)[events['check'].astype(np.intp)]
+        order = np.lexsort((-np.abs(result['Z-Score'].to_numpy()), -result['Date'].to_numpy().astype(np.int64)))
+        return result.iloc[order].reset_index(drop=True)
+
+    def status(self):
+        with self._lock:
+            return {
+                'through': None if self.through is None else str(self.through.date()),
+                'pairs': len(self.pair_keys),
+                'stores': len(self.store_keys),
+                'anomalies': sum(len(events['series']) for events in self._events),
+            }
+
+    # ------------------------------------------------------------------ #
+    # Storage (.npz, no pickled objects)
+    # ------------------------------------------------------------------ #
+    def _save(self):
+        events = self._merged_events()
+        self._events = [events] if len(events['series']) else []
+        header = {
+            'format': STATE_FORMAT,
+            'through': None if self.through is None else self.through.isoformat(),
+            'months': self.months,
+            'pair_keys': [list(key) for key in self.pair_keys],
+            'store_keys': list(self.store_keys),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp.npz'
+        np.savez(
+            tmp_path, header=np.array(json.dumps(header)),
+            **self.pairs.arrays('pair_'), **self.stores.arrays('store_'),
+            **{f'event_{name}': values for name, values in events.items()},
+        )
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        """Restore the stored state; a missing or outdated file leaves it empty (full rebuild)"""
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        with np.load(self.path, allow_pickle=False) as arrays:
+            header = json.loads(str(arrays['header']))
+            if header.get('format') != STATE_FORMAT:
+                return
+            self.pairs = SeriesState.from_arrays(arrays, 'pair_')
+            self.stores = SeriesState.from_arrays(arrays, 'store_')
+            events = {name[len('event_'):]: arrays[name] for name in arrays.files if name.startswith('event_')}
+        self.pair_keys = {tuple(key): i for i, key in enumerate(header['pair_keys'])}
+        self.store_keys = {key: i for i, key in enumerate(header['store_keys'])}
+        self.through = None if header['through'] is None else pd.Timestamp(header['through'])
+        self.months = header['months']
+        self._events = [events] if len(events.get('series', ())) else []
+
+
+DETECTOR = AnomalyDetector()
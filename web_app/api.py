@@ -0,0 +1,301 @@
+# web_app/api.py
+# JSON API serving the numbers behind the Dashboard, Alerts and Products
+# pages to other systems (replenishment, store handhelds). Built on
+# tornado, which already ships with streamlit. It reads the same
+# partitioned dataset, runs the same analytics functions and demand
+# predictor as the UI, and keeps a response cache keyed by the data version
+# of each requested date range.
+#
+#   python api.py --port 8600          # standalone server
+#   RETAIL_API_PORT=8600 streamlit run app.py   # inside the app process
+#
+# Endpoints (all GET unless noted; `start`/`end` = optional YYYY-MM-DD range):
+#   /api/health
+#   /api/kpis
+#   /api/rollups/<category|region|store|season|daily|monthly>
+#   /api/alerts
+#   /api/products/<product id>
+#   /api/predict  (GET query or POST JSON: category, price, discount, inventory, holiday)
+import argparse
+import asyncio
+import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import tornado.ioloop
+import tornado.web
+
+import analytics
+import perf
+from datastore import frame_version
+from utils import open_dataset, slice_date_range
+
+ROLLUPS = {
+    'category': analytics.category_sales,
+    'region': analytics.region_sales,
+    'store': analytics.store_sales,
+    'season': analytics.seasonal_sales,
+    'daily': analytics.daily_sales,
+    'monthly': analytics.monthly_sales,
+}
+
+
+def to_jsonable(value):
+    """Convert analytics results (frames, series, numpy scalars) to JSON types; NaN and ±inf become None"""
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso'))
+    if isinstance(value, pd.Series):
+        return json.loads(value.to_json(date_format='iso'))
+    if isinstance(value, dict):
+        return {str(key): to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(item) for item in value]
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    # Strict JSON has no NaN or Infinity (an empty range averages to NaN)
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+class DataService:
+    """Dataset frame and response cache shared by all API requests.
+
+    The frame is reloaded when the partitioned dataset's version changes
+    (checked at most every `refresh_seconds`), reading only the changed
+    months. Cached responses are keyed by the version of the date range
+    they cover, so a change only invalidates the ranges it touches; those
+    responses are dropped as soon as the change is seen.
+    """
+
+    def __init__(self, workers=4, cache_size=512, refresh_seconds=5.0):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self.cache_size = cache_size
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._df = None
+        self._version = None
+        self._checked_at = 0.0
+        self._responses = collections.OrderedDict()
+        self._inflight = {}
+
+    def frame(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._df is None or now - self._checked_at > self.refresh_seconds:
+                dataset = open_dataset()
+                version = dataset.version()
+                if version != self._version:
+                    with perf.span('api.load') as load_span:
+                        self._df = dataset.read() if self._df is None else dataset.reread(self._df)
+                        load_span['rows'] = len(self._df)
+                    self._version = version
+                    self._evict_stale(dataset)
+                self._checked_at = now
+            return self._df, self._version
+
+    def _evict_stale(self, dataset):
+        # Keys are (range version, name, start, end, ...)
+        for key in [key for key in self._responses if dataset.version(key[2], key[3]) != key[0]]:
+            del self._responses[key]
+
+    def view(self, start=None, end=None):
+        """Rows in the range and their data version"""
+        df, version = self.frame()
+        view = slice_date_range(df, start, end)
+        return view, frame_version(view) or version
+
+    async def cached(self, key, compute, start=None, end=None):
+        """Serialized JSON for `key` over a date range, computing it once in the worker pool on a miss"""
+        # Make sure the version in the key is current before looking it up
+        _, version = await asyncio.get_running_loop().run_in_executor(self.executor, self.view, start, end)
+        full_key = (version,) + key
+        with self._lock:
+            body = self._responses.get(full_key)
+            if body is not None:
+                self._responses.move_to_end(full_key)
+                return body
+            future = self._inflight.get(full_key)
+            if future is None:
+                # Concurrent identical requests share one computation
+                future = asyncio.get_running_loop().run_in_executor(self.executor, self._compute, compute)
+                self._inflight[full_key] = future
+        try:
+            body = await future
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+        with self._lock:
+            self._responses[full_key] = body
+            while len(self._responses) > self.cache_size:
+                self._responses.popitem(last=False)
+        return body
+
+    def _compute(self, compute):
+        return json.dumps(to_jsonable(compute()), allow_nan=False).encode()
+
+
+class BaseHandler(tornado.web.RequestHandler):
+
+    def initialize(self, service):
+        self.service = service
+
+    def date_range(self):
+        bounds = []
+        for name in ('start', 'end'):
+            value = self.get_query_argument(name, None)
+            if value is not None:
+                try:
+                    value = pd.Timestamp(value).strftime('%Y-%m-%d')
+                except ValueError:
+                    raise tornado.web.HTTPError(400, f"Invalid {name} date '{value}'")
+            bounds.append(value)
+        return tuple(bounds)
+
+    def write_json(self, body):
+        self.set_header('Content-Type', 'application/json')
+        self.write(body)
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header('Content-Type', 'application/json')
+        message = self._reason
+        if 'exc_info' in kwargs and isinstance(kwargs['exc_info'][1], tornado.web.HTTPError):
+            message = kwargs['exc_info'][1].log_message or message
+        self.finish(json.dumps({'error': message, 'status': status_code}))
+
+    async def respond(self, name, compute, *params):
+        start, end = self.date_range()
+        # Requests interleave on the event loop, so time them directly rather
+        # than with a (thread-local, nested) perf.span
+        started = time.perf_counter()
+        body = await self.service.cached(
+            (name, start, end) + params, lambda: compute(self.service.view(start, end)[0]), start, end
+        )
+        perf.record_sample(f'api.{name}', time.perf_counter() - started)
+        self.write_json(body)
+
+
+class HealthHandler(BaseHandler):
+    async def get(self):
+        df, version = await asyncio.get_running_loop().run_in_executor(self.service.executor, self.service.frame)
+        self.write_json(json.dumps({'status': 'ok', 'rows': len(df), 'version': version}).encode())
+
+
+class KpiHandler(BaseHandler):
+    async def get(self):
+        await self.respond('kpis', analytics.kpis)
+
+
+class RollupHandler(BaseHandler):
+    async def get(self, dimension):
+        rollup = ROLLUPS.get(dimension)
+        if rollup is None:
+            raise tornado.web.HTTPError(404, f"Unknown rollup '{dimension}'. Use one of: {', '.join(ROLLUPS)}")
+        await self.respond(f'rollups.{dimension}', rollup)
+
+
+class AlertHandler(BaseHandler):
+    async def get(self):
+        await self.respond('alerts', analytics.alert_snapshot)
+
+
+class ProductHandler(BaseHandler):
+    async def get(self, product_id):
+        def compute(df):
+            records = analytics.product_records(df, product_id)
+            if len(records) == 0:
+                # Raised in the worker and re-raised here, so it is never cached
+                raise tornado.web.HTTPError(404, f"Unknown product '{product_id}'")
+            return {
+                'product_id': product_id,
+                'detail': analytics.product_detail(records),
+                'timeline': analytics.product_timeline(records),
+            }
+
+        await self.respond('product', compute, product_id)
+
+
+class PredictHandler(BaseHandler):
+    def _inputs(self, source):
+        try:
+            return {
+                'category': str(source.get('category', 'Electronics')),
+                'price': float(source.get('price', 55.0)),
+                'discount': float(source.get('discount', 10)),
+                'inventory': float(source.get('inventory', 200)),
+                'holiday': str(source.get('holiday', 'false')).lower() in ('1', 'true', 'yes'),
+            }
+        except (TypeError, ValueError) as e:
+            raise tornado.web.HTTPError(400, f"Invalid prediction input: {e}")
+
+    def _predict(self, inputs):
+        with perf.span('api.predict', rows=1):
+            demand, factors = analytics.predict_demand(**inputs)
+        self.write_json(json.dumps(to_jsonable({'inputs': inputs, 'demand': demand, 'factors': factors}), allow_nan=False).encode())
+
+    def get(self):
+        self._predict(self._inputs({key: self.get_query_argument(key) for key in self.request.query_arguments}))
+
+    def post(self):
+        try:
+            payload = json.loads(self.request.body or b'{}')
+        except json.JSONDecodeError:
+            raise tornado.web.HTTPError(400, "Body must be JSON")
+        self._predict(self._inputs(payload))
+
+
+def make_app(service=None):
+    service = service or DataService()
+    handler_args = {'service': service}
+    return tornado.web.Application([
+        (r'/api/health', HealthHandler, handler_args),
+        (r'/api/kpis', KpiHandler, handler_args),
+        (r'/api/rollups/([a-z]+)', RollupHandler, handler_args),
+        (r'/api/alerts', AlertHandler, handler_args),
+        (r'/api/products/([^/]+)', ProductHandler, handler_args),
+        (r'/api/predict', PredictHandler, handler_args),
+    ])
+
+
+_background_server = None
+
+
+def start_in_background(port, address='127.0.0.1'):
+    """Serve the API from a daemon thread of the current process (once)"""
+    global _background_server
+    if _background_server is not None:
+        return _background_server
+    ready = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        make_app().listen(port, address=address)
+        ready.set()
+        tornado.ioloop.IOLoop.current().start()
+
+    _background_server = threading.Thread(target=run, name='retail-api', daemon=True)
+    _background_server.start()
+    ready.wait(timeout=5)
+    return _background_server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the retail analytics JSON API")
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--address', default='127.0.0.1')
+    parser.add_argument('--workers', type=int, default=4, help="Threads computing uncached responses")
+    args = parser.parse_args(argv)
+
+    make_app(DataService(workers=args.workers)).listen(args.port, address=args.address)
+    print(f"Retail API listening on http://{args.address}:{args.port}/api/")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
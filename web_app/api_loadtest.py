@@ -0,0 +1,103 @@
+# web_app/api_loadtest.py
+# Load test for the JSON API: keeps `--concurrency` requests in flight
+# against a running server for `--duration` seconds, cycling through a mix
+# of endpoints, and reports throughput and latency percentiles.
+#
+#   python api.py --port 8600 &
+#   python api_loadtest.py --url http://127.0.0.1:8600 --concurrency 32 --duration 20
+import argparse
+import asyncio
+import collections
+import json
+import sys
+import time
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError, HTTPRequest
+
+DEFAULT_PATHS = [
+    '/api/kpis',
+    '/api/rollups/category',
+    '/api/rollups/region',
+    '/api/rollups/store',
+    '/api/alerts',
+    '/api/predict?category=Toys&price=35&discount=15&inventory=120&holiday=1',
+]
+
+
+async def discover_products(client, base_url, limit=20):
+    """A few product detail endpoints, using products named in the alert snapshot"""
+    try:
+        response = await client.fetch(f'{base_url}/api/alerts')
+        alerts = json.loads(response.body)
+    except (HTTPClientError, OSError):
+        return []
+    products = {row['Product ID'] for row in alerts['high_demand']['table']}
+    return [f'/api/products/{product}' for product in sorted(products)[:limit]]
+
+
+async def worker(client, base_url, paths, deadline, latencies, errors, offset):
+    i = offset
+    while time.perf_counter() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            await client.fetch(HTTPRequest(base_url + path, request_timeout=60))
+            latencies[path.split('?')[0]].append(time.perf_counter() - started)
+        except (HTTPClientError, OSError) as e:
+            errors[type(e).__name__] += 1
+
+
+async def run(base_url, concurrency, duration, paths):
+    AsyncHTTPClient.configure(None, max_clients=concurrency)
+    client = AsyncHTTPClient()
+    paths = list(paths) + await discover_products(client, base_url)
+
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(
+        worker(client, base_url, paths, deadline, latencies, errors, offset)
+        for offset in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    client.close()
+    return latencies, errors, elapsed
+
+
+def report(latencies, errors, elapsed, concurrency):
+    all_latencies = np.array([value for values in latencies.values() for value in values])
+    total = len(all_latencies)
+    print(f"concurrency {concurrency}, {elapsed:.1f}s, {total:,} requests, "
+          f"{total / elapsed:,.1f} req/s, {sum(errors.values())} errors {dict(errors) or ''}")
+    print(f"{'endpoint':<32} {'count':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    rows = sorted(latencies.items())
+    if total:
+        rows.append(('ALL', list(all_latencies)))
+    for path, values in rows:
+        p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+        print(f"{path:<32} {len(values):>8,} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the retail analytics JSON API")
+    parser.add_argument('--url', default='http://127.0.0.1:8600', help="Base URL of a running api.py")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[16],
+                        help="Requests kept in flight; several values run one after another")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument('--path', action='append', dest='paths', help="Endpoint to include (repeatable)")
+    args = parser.parse_args(argv)
+
+    for concurrency in args.concurrency:
+        latencies, errors, elapsed = asyncio.run(
+            run(args.url.rstrip('/'), concurrency, args.duration, args.paths or DEFAULT_PATHS)
+        )
+        report(latencies, errors, elapsed, concurrency)
+        print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
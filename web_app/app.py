@@ -2,6 +2,7 @@
 import streamlit as st
 import sys
 import os
+from datetime import timedelta
 
 # Page config
 st.set_page_config(
@@ -12,7 +13,16 @@ st.set_page_config(
 )
 
 # Import utilities
-from utils import load_data, get_css
+from utils import load_data, get_css, slice_date_range
+from data_watch import WATCHER, WATCH_INTERVAL
+from forecast_table import FORECASTS
+from startup import import_timings, prewarm, prewarm_enabled
+import perf
+from profiler import PROFILER
+
+# Opt-in allocation tracking for the per-span memory figures
+if os.environ.get('RETAIL_TRACE_MEMORY') == '1':
+    perf.enable_memory_tracing()
 
 # Apply custom CSS
 st.markdown(get_css(), unsafe_allow_html=True)
@@ -44,33 +54,101 @@ pages = {
     ' Admin': 'Admin'
 }
 
-# Create navigation buttons
+# Create navigation buttons. The widget keeps its own selection: an index
+# derived from current_page would change the widget's identity after every
+# page switch and drop the next click.
 selected = st.sidebar.radio(
     "Navigate to:",
     list(pages.keys()),
-    index=list(pages.values()).index(st.session_state.current_page) if st.session_state.current_page in pages.values() else 0
+    key='navigation'
 )
 
 # Update current page
 st.session_state.current_page = pages[selected]
 
-# Load data once (cached)
-if 'df' not in st.session_state:
-    st.session_state.df = load_data()
+# Load data once (cached), and again when the data source has changed:
+# only the changed months are read, the rest is reused from the old frame
+data_version = WATCHER.version()
+if 'df' not in st.session_state or st.session_state.get('data_version') != data_version:
+    st.session_state.df = load_data(version=data_version, _previous=st.session_state.get('df'))
+    st.session_state.data_version = data_version
+
+df = st.session_state.df
+
+@st.fragment(run_every=WATCH_INTERVAL or None)
+def watch_data_source():
+    """Rerun the page when another session or the watcher has seen new data"""
+    if WATCHER.version() != st.session_state.get('data_version'):
+        st.rerun()
+
+with st.sidebar:
+    watch_data_source()
+
+# Global date range filter
+view = df
+if df is not None and len(df) > 0:
+    st.sidebar.markdown("---")
+    first_date = df['Date'].iloc[0].date()
+    last_date = df['Date'].iloc[-1].date()
+    range_options = {
+        'All history': None,
+        'Last 30 days': 30,
+        'Last 90 days': 90,
+        'Last 365 days': 365,
+        'Custom range': 'custom'
+    }
+    range_choice = st.sidebar.selectbox("Date Range", list(range_options.keys()), key='date_range_choice')
+    range_days = range_options[range_choice]
+
+    start_date, end_date = first_date, last_date
+    if range_days == 'custom':
+        selected_range = st.sidebar.date_input(
+            "Select dates",
+            value=(first_date, last_date),
+            min_value=first_date,
+            max_value=last_date,
+            key='date_range_custom'
+        )
+        # The widget returns a single date while the user is still picking the end
+        if isinstance(selected_range, (list, tuple)) and len(selected_range) == 2:
+            start_date, end_date = selected_range
+    elif range_days is not None:
+        start_date = max(first_date, last_date - timedelta(days=range_days - 1))
+
+    st.session_state.date_range = (start_date, end_date)
+    view = slice_date_range(df, start_date, end_date)
+    st.sidebar.caption(f"Showing {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d} ({len(view):,} records)")
+    st.sidebar.toggle(
+        "Approximate statistics",
+        value=os.environ.get('RETAIL_APPROXIMATE') == '1',
+        key='approximate_mode',
+        help="Distinct counts and percentile thresholds from per-partition sketches instead of full column scans"
+    )
+    st.sidebar.toggle(
+        "Parallel aggregation",
+        value=os.environ.get('RETAIL_SHARDED') == '1',
+        key='sharded_mode',
+        help="Totals and rollups computed per store shard in worker processes, then merged"
+    )
 
 # Route to appropriate page
-if st.session_state.current_page == 'Dashboard':
-    from pages.dashboard import show_dashboard
-    show_dashboard(st.session_state.df)
-elif st.session_state.current_page == 'Alerts':
-    from pages.alerts import show_alerts
-    show_alerts(st.session_state.df)
-elif st.session_state.current_page == 'Products':
-    from pages.products import show_products
-    show_products(st.session_state.df)
-elif st.session_state.current_page == 'Admin':
-    from pages.admin import show_admin
-    show_admin(st.session_state.df)
+if view is not None and len(view) == 0:
+    st.warning("No records fall inside the selected date range.")
+else:
+    # Each page render is recorded as a perf span shown on the Admin page
+    with perf.span(f"page.{st.session_state.current_page.lower()}", rows=None if view is None else len(view)):
+        if st.session_state.current_page == 'Dashboard':
+            from pages.dashboard import show_dashboard
+            show_dashboard(view)
+        elif st.session_state.current_page == 'Alerts':
+            from pages.alerts import show_alerts
+            show_alerts(view)
+        elif st.session_state.current_page == 'Products':
+            from pages.products import show_products
+            show_products(view)
+        elif st.session_state.current_page == 'Admin':
+            from pages.admin import show_admin
+            show_admin(view)
 
 # Footer
 st.sidebar.markdown("---")
@@ -80,6 +158,32 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Count finished script runs for rerun-bounded profiler captures
+PROFILER.note_rerun()
+
+# Serve the JSON API from this process when a port is configured
+if os.environ.get('RETAIL_API_PORT'):
+    import api
+    api.start_in_background(int(os.environ['RETAIL_API_PORT']))
+
+# Keep the forward forecast table current (a background job; pages only read it)
+FORECASTS.start()
+
+# Load heavy libraries in the background once the first page has been sent
+if prewarm_enabled():
+    prewarm()
+
+# Startup mode: show how long each lazily imported module took to load
+if os.environ.get('RETAIL_STARTUP_PROFILE') == '1':
+    with st.sidebar.expander("Startup Profile"):
+        timings = import_timings()
+        if timings:
+            for name, timing in sorted(timings.items(), key=lambda item: -item[1]['seconds']):
+                st.write(f"- `{name}`: {timing['seconds'] * 1000:.0f} ms ({timing['thread']})")
+        else:
+            st.write("No deferred imports have been loaded yet.")
+        st.caption("Run `python startup.py` for a full `-X importtime` report.")
+
 if __name__ == "__main__":
     # Helpful message when someone runs `python app.py` directly.
     try:
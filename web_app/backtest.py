@@ -0,0 +1,224 @@
+# web_app/backtest.py
+# Rolling-origin backtest of demand forecasts. For each origin the models
+# are trained on the days before it and forecast the next `horizon` days of
+# every store/product series; origins step back from the end of the data.
+# Features are built once (forecasting.feature_set) and shared by every
+# fold; each (model, fold) pair is an independent task run in parallel with
+# joblib, which memory-maps the feature arrays into the worker processes
+# instead of copying them.
+#
+#   python backtest.py                                  # app dataset, all models
+#   python backtest.py --scale 1m --models naive xgboost --folds 6 --jobs 4
+#   python backtest.py --output predictions.csv
+#
+# Errors are reported per model overall, per Category and per Region:
+#   MAPE  mean absolute percentage error over rows with sales
+#   WAPE  sum |forecast - actual| / sum actual
+#   Bias  sum (forecast - actual) / sum actual (positive = over-forecast)
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+import forecasting
+from perf import span
+
+# Reference forecasts computed straight from the history, no training
+BASELINES = ('naive', 'seasonal_naive', 'moving_average', 'dataset_forecast')
+MODELS = BASELINES + tuple(forecasting.ESTIMATORS)
+MOVING_AVERAGE_DAYS = 28
+
+DEFAULT_FOLDS = 4
+
+
+def fold_origins(n_days, folds, horizon, step=None):
+    """First forecast day of each fold, oldest first; the last fold ends on the last day"""
+    step = step or horizon
+    origins = [n_days - horizon - step * i for i in reversed(range(folds))]
+    return [origin for origin in origins if origin > 0]
+
+
+def _baseline_forecast(model, features, origin, rows):
+    series = features.series[rows]
+    if model == 'naive':
+        return features.grid[series, origin - 1].astype(np.float64)
+    if model == 'seasonal_naive':
+        # Repeat the last observed week
+        season = forecasting.SEASON_DAYS
+        offset = (features.day[rows] - origin) % season
+        lookup = origin - season + offset
+        return np.where(lookup >= 0, features.grid[series, np.maximum(lookup, 0)], np.nan).astype(np.float64)
+    if model == 'moving_average':
+        window = features.grid[:, max(0, origin - MOVING_AVERAGE_DAYS):origin]
+        observed = ~np.isnan(window)
+        totals = np.where(observed, window, 0).sum(axis=1, dtype=np.float64)
+        means = np.divide(totals, observed.sum(axis=1), out=np.full(len(totals), np.nan), where=observed.any(axis=1))
+        return means[series]
+    if model == 'dataset_forecast':
+        if features.provided is None:
+            return np.full(rows.stop - rows.start, np.nan)
+        return features.provided[rows]
+    raise ValueError(f"Unknown model: {model}")
+
+
+def run_fold(features, model, fold, origin, train_days=forecasting.DEFAULT_TRAIN_DAYS,
+             max_train_rows=forecasting.DEFAULT_MAX_TRAIN_ROWS, seed=0):
+    """Forecast the `features.horizon` days from `origin` with one model.
+
+    Returns the test row slice, the forecasts and the fit/predict seconds.
+    Estimators train on complete-feature rows from the `train_days` before
+    the origin, subsampled to `max_train_rows`.
+    """
+    test = features.day_bounds(origin, origin + features.horizon)
+    fit_seconds = 0.0
+    started = time.perf_counter()
+    if model in BASELINES:
+        forecast = _baseline_forecast(model, features, origin, test)
+    else:
+        rows = forecasting.training_rows(features, origin, train_days, max_train_rows, seed + fold)
+        estimator = forecasting.fit_estimator(model, features, rows, seed)
+        fit_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        forecast = estimator.predict(features.X[test]).astype(np.float64)
+    predict_seconds = time.perf_counter() - started
+    return {
+        'model': model,
+        'fold': fold,
+        'origin': origin,
+        'rows': (test.start, test.stop),
+        'forecast': np.maximum(forecast, 0),
+        'fit_seconds': fit_seconds,
+        'predict_seconds': predict_seconds,
+    }
+
+
+def forecast_metrics(predictions, by=()):
+    """MAPE, WAPE and Bias (percent) per model, optionally split by columns in `by`.
+
+    Rows without a forecast (too little history) are left out.
+    """
+    frame = predictions.dropna(subset=['Forecast'])
+    error = frame['Forecast'] - frame['Actual']
+    frame = frame.assign(
+        _error=error,
+        _abs_error=error.abs(),
+        _ape=(error.abs() / frame['Actual']).where(frame['Actual'] > 0),
+    )
+    grouped = frame.groupby(['Model', *by], sort=True, observed=True)
+    actual = grouped['Actual'].sum()
+    metrics = pd.DataFrame({
+        'Rows': grouped.size(),
+        'Actual': actual,
+        'MAPE': grouped['_ape'].mean() * 100,
+        'WAPE': grouped['_abs_error'].sum() / actual * 100,
+        'Bias': grouped['_error'].sum() / actual * 100,
+    })
+    return metrics.reset_index()
+
+
+def run_backtest(df, models=MODELS, folds=DEFAULT_FOLDS, horizon=forecasting.DEFAULT_HORIZON, step=None,
+                 train_days=forecasting.DEFAULT_TRAIN_DAYS, max_train_rows=forecasting.DEFAULT_MAX_TRAIN_ROWS,
+                 jobs=-1, seed=0):
+    """Rolling-origin backtest of `models` over a Date-sorted frame.
+
+    Returns a dict with the row-level 'predictions', the metrics 'overall',
+    'by_category' and 'by_region', per-model 'timing' and the fold 'origins'
+    (dates). `jobs` is the joblib worker count (-1 = all cores).
+    """
+    unknown = set(models) - set(MODELS)
+    if unknown:
+        raise ValueError(f"Unknown models: {', '.join(sorted(unknown))}")
+    with span('backtest.features', rows=len(df)):
+        features = forecasting.feature_set(df, horizon)
+    origins = fold_origins(features.n_days, folds, horizon, step)
+    if not origins:
+        raise ValueError("Not enough history for a single fold")
+
+    # Slow estimators first so the pool does not end on one long task
+    tasks = sorted(
+        ((model, fold, origin) for model in models for fold, origin in enumerate(origins)),
+        key=lambda task: task[0] in BASELINES,
+    )
+    started = time.perf_counter()
+    with span('backtest.folds', rows=len(df)):
+        results = Parallel(n_jobs=jobs)(
+            delayed(run_fold)(features, model, fold, origin, train_days, max_train_rows, seed)
+            for model, fold, origin in tasks
+        )
+    wall_seconds = time.perf_counter() - started
+
+    columns = ['Store ID', 'Product ID', 'Category', 'Region']
+    parts = []
+    for result in sorted(results, key=lambda result: (models.index(result['model']), result['fold'])):
+        rows = slice(*result['rows'])
+        part = df.iloc[rows][['Date', *columns]].reset_index(drop=True)
+        part.insert(0, 'Fold', result['fold'])
+        part.insert(0, 'Model', result['model'])
+        part['Actual'] = features.y[rows]
+        part['Forecast'] = result['forecast']
+        parts.append(part)
+    predictions = pd.concat(parts, ignore_index=True)
+
+    timing = pd.DataFrame([
+        {'Model': result['model'], 'Fit s': result['fit_seconds'], 'Predict s': result['predict_seconds']}
+        for result in results
+    ]).groupby('Model', sort=False).sum().reindex(list(models))
+    timing['Total s'] = timing['Fit s'] + timing['Predict s']
+
+    return {
+        'predictions': predictions,
+        'overall': forecast_metrics(predictions),
+        'by_category': forecast_metrics(predictions, ['Category']),
+        'by_region': forecast_metrics(predictions, ['Region']),
+        'timing': timing.reset_index(),
+        'origins': [pd.Timestamp(features.first_date) + pd.Timedelta(days=origin) for origin in origins],
+        'wall_seconds': wall_seconds,
+    }
+
+
+def _load_frame(args):
+    if args.scale:
+        import benchmark
+        return benchmark.ensure_dataset(args.scale, benchmark.SCALES[args.scale]).read(args.start, args.end)
+    from utils import open_dataset
+    return open_dataset().read(args.start, args.end)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of demand forecast models")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS)
+    parser.add_argument('--horizon', type=int, default=forecasting.DEFAULT_HORIZON, help="Days forecast per fold")
+    parser.add_argument('--step', type=int, help="Days between fold origins (default: the horizon)")
+    parser.add_argument('--train-days', type=int, default=forecasting.DEFAULT_TRAIN_DAYS,
+                        help="History used to train estimators (0 = all)")
+    parser.add_argument('--max-train-rows', type=int, default=forecasting.DEFAULT_MAX_TRAIN_ROWS)
+    parser.add_argument('--jobs', type=int, default=-1, help="Parallel workers (-1 = all cores)")
+    parser.add_argument('--scale', help="Use a benchmark dataset (10k, 100k, 1m, ...) instead of the app data")
+    parser.add_argument('--start', help="First date (YYYY-MM-DD)")
+    parser.add_argument('--end', help="Last date (YYYY-MM-DD)")
+    parser.add_argument('--output', help="Write row-level predictions to this CSV file")
+    args = parser.parse_args(argv)
+
+    df = _load_frame(args)
+    report = run_backtest(df, tuple(args.models), args.folds, args.horizon, args.step,
+                          args.train_days, args.max_train_rows, args.jobs)
+    origins = ', '.join(origin.strftime('%Y-%m-%d') for origin in report['origins'])
+    print(f"{len(df):,} rows, {len(report['origins'])} folds of {args.horizon} days from {origins}\n")
+    with pd.option_context('display.width', 120, 'display.float_format', '{:,.2f}'.format):
+        for title, key in (('Overall', 'overall'), ('By category', 'by_category'),
+                           ('By region', 'by_region'), ('Compute time', 'timing')):
+            print(f"{title}\n{report[key].to_string(index=False)}\n")
+    print(f"Wall time {report['wall_seconds']:.2f}s with {args.jobs} jobs")
+    if args.output:
+        report['predictions'].to_csv(args.output, index=False)
+        print(f"Predictions written to {os.path.abspath(args.output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
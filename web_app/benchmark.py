@@ -0,0 +1,276 @@
+# web_app/benchmark.py
+# Benchmark suite: times dataset loading, each page's computations and
+# demand prediction on synthetic data at several scales, records peak
+# memory, and compares the results against a stored baseline.
+#
+#   python benchmark.py --scales 10k 100k 1m            # run and print
+#   python benchmark.py --scales 10k 100k --save-baseline
+#   python benchmark.py --scales 10k 100k --compare     # exit 1 on regression
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import analytics
+import backtest
+import elasticity
+import forecasting
+import inventory_policy
+import series_store
+import sharded
+import synthetic
+from datastore import PartitionedDataset
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DATA_DIR = os.path.join(ROOT_DIR, 'data', 'bench')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+SCALES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+    '50m': 50_000_000,
+}
+
+
+def _dashboard(df):
+    analytics.kpis(df)
+    analytics.category_sales(df)
+    analytics.category_average_sales(df)
+    analytics.region_sales(df)
+    analytics.store_sales(df)
+    analytics.region_category_matrix(df)
+    analytics.daily_sales(df)
+    analytics.monthly_sales(df)
+    analytics.seasonal_sales(df)
+    analytics.inventory_sample(df)
+    analytics.demand_breakdown(df)
+    analytics.business_insights(df)
+
+
+def _alerts(df):
+    analytics.alert_snapshot(df)
+
+
+def _products(df):
+    analytics.product_totals(df)
+    analytics.product_summary(df)
+    analytics.category_stats(df)
+    analytics.store_stats(df)
+    analytics.price_analysis(df)
+    records = analytics.product_records(df, df['Product ID'].iloc[0])
+    analytics.product_detail(records)
+    analytics.product_timeline(records)
+
+
+def _admin(df):
+    analytics.system_statistics(df)
+    analytics.data_completeness(df)
+    analytics.data_ranges(df)
+    analytics.sales_performance(df)
+    analytics.inventory_performance(df)
+    analytics.record_counts(df, 'Category')
+    analytics.record_counts(df, 'Region')
+
+
+def _prediction(df, requests=1000):
+    # Sidebar demand predictions for a batch of requests drawn from the data
+    sample = df.sample(min(requests, len(df)), random_state=0)
+    columns = ['Category', 'Price', 'Discount', 'Inventory Level', 'Holiday/Promotion']
+    for category, price, discount, inventory, holiday in zip(*(sample[c] for c in columns)):
+        analytics.predict_demand(category, price, discount, inventory, holiday)
+
+
+def _forecast_features(df):
+    forecasting.build_features(df)
+
+
+def _backtest(df):
+    # Baselines only; backtest.py reports estimator training times itself
+    backtest.run_backtest(df, models=backtest.BASELINES, jobs=1)
+
+
+def _elasticity(df):
+    elasticity.fit(df)
+    elasticity.fit(df, by=('Product ID', 'Region'))
+
+
+def _reorder_policy(df):
+    inventory_policy.reorder_policy(df)
+
+
+def _statistics(df, sketches=None):
+    # Distinct counts, percentile thresholds and demand terciles used across pages
+    analytics.kpis(df, sketches)
+    analytics.system_statistics(df, sketches)
+    analytics.data_ranges(df, sketches)
+    analytics.alert_thresholds(df, sketches)
+    analytics.discount_alerts(df, sketches=sketches)
+    analytics.demand_breakdown(df, sketches)
+
+
+def _sharded(df):
+    # The same rollups as the page cases, from store shards of a series store (built once per dataset)
+    summary = sharded.summarize(series_store.for_frame(df), jobs=1)
+    for name in sharded.COMPUTATIONS:
+        summary.compute(name)
+
+
+# Cases run against the loaded frame, in order. Add new hot paths here.
+CASES = [
+    ('page.dashboard', _dashboard),
+    ('page.alerts', _alerts),
+    ('page.products', _products),
+    ('page.admin', _admin),
+    ('forecast.rule_based', _prediction),
+    ('forecast.features', _forecast_features),
+    ('forecast.backtest', _backtest),
+    ('inventory.reorder_policy', _reorder_policy),
+    ('pricing.elasticity', _elasticity),
+    ('stats.exact', _statistics),
+    ('stats.sharded', _sharded),
+]
+
+# Cases given the frame and the dataset's merged partition sketches
+SKETCH_CASES = [
+    ('stats.approximate', _statistics),
+]
+
+
+def ensure_dataset(scale, rows):
+    """Partitioned synthetic dataset for a scale, generated on first use"""
+    root = os.path.join(BENCH_DATA_DIR, f'{scale}-v{synthetic.DATA_VERSION}')
+    if PartitionedDataset.exists(root):
+        return PartitionedDataset(root)
+    print(f"Generating {scale} dataset ({rows:,} rows) in {root} ...", file=sys.stderr)
+    return synthetic.write_partitioned(root, rows)
+
+
+def measure(func, repeat):
+    """Best wall time over `repeat` runs, then peak traced memory of one more run"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    del result
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': float(np.median(times)), 'peak_bytes': peak}
+
+
+def run_scale(scale, rows, repeat):
+    dataset = ensure_dataset(scale, rows)
+    results = {}
+    results['load'] = measure(dataset.read, repeat)
+    df = dataset.read()
+    results['load']['rows'] = len(df)
+    for name, case in CASES:
+        results[name] = measure(lambda: case(df), repeat)
+        results[name]['rows'] = len(df)
+    results['sketch.merge'] = measure(dataset.sketches, repeat)
+    results['sketch.merge']['rows'] = len(df)
+    sketches = dataset.sketches()
+    for name, case in SKETCH_CASES:
+        results[name] = measure(lambda: case(df, sketches), repeat)
+        results[name]['rows'] = len(df)
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.005):
+    """List of regressions: cases slower or hungrier than baseline by more than `tolerance`.
+
+    Slowdowns smaller than `min_seconds` are treated as timer noise.
+    """
+    regressions = []
+    for scale, cases in results.items():
+        for name, current in cases.items():
+            previous = baseline.get('results', {}).get(scale, {}).get(name)
+            if previous is None:
+                continue
+            for metric in ('seconds', 'peak_bytes'):
+                if metric == 'seconds' and current[metric] - previous[metric] < min_seconds:
+                    continue
+                if previous[metric] > 0 and current[metric] > previous[metric] * (1 + tolerance):
+                    regressions.append((scale, name, metric, previous[metric], current[metric]))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'scale':>6}  {'case':<26} {'rows':>12} {'best s':>9} {'peak MB':>9} {'vs base':>8}")
+    for scale, cases in results.items():
+        for name, result in cases.items():
+            change = ''
+            previous = (baseline or {}).get('results', {}).get(scale, {}).get(name)
+            if previous and previous['seconds'] > 0:
+                change = f"{result['seconds'] / previous['seconds'] - 1:+.0%}"
+            print(f"{scale:>6}  {name:<26} {result['rows']:>12,} {result['seconds']:>9.3f} "
+                  f"{result['peak_bytes'] / 1e6:>9.1f} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark data loading and page computations")
+    parser.add_argument('--scales', nargs='+', default=['10k', '100k'], choices=list(SCALES))
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (best is reported)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--compare', action='store_true', help="Exit with status 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed slowdown/growth (0.25 = 25%%)")
+    parser.add_argument('--output', help="Also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = {scale: run_scale(scale, SCALES[scale], args.repeat) for scale in args.scales}
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        if baseline:
+            # Keep baseline entries for scales that were not re-run
+            merged = dict(baseline.get('results', {}))
+            merged.update(results)
+            report['results'] = merged
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.compare:
+        if baseline is None:
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline first")
+            return 1
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for scale, name, metric, before, after in regressions:
+                print(f"  {scale} {name} {metric}: {before:,.3f} -> {after:,.3f}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
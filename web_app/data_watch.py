@@ -0,0 +1,122 @@
+# web_app/data_watch.py
+# Detects changes to the source CSV for the whole server process. At most
+# once every RETAIL_WATCH_INTERVAL seconds (default 5, 0 = only on demand)
+# the watcher stats the CSV; a new modification time or size leads to a
+# content hash and, when the content really changed, to re-partitioning of
+# the changed months only (utils.open_dataset). The dataset's write counter
+# is the version sessions compare against to reload their frame.
+#
+# Caches keyed by utils.data_key need no clearing: a view's key only
+# changes when partitions inside it change. Shared figure specs for views
+# that did change are dropped here so they do not hold cache space, new
+# sales anomalies are handed to the notification dispatcher and the forward
+# forecast job is woken to rebuild its table. The leaderboards fold in the
+# changed months here too, ahead of the next page that needs them.
+#
+# Every session asks for the version at the start of each rerun, so only the
+# check and the version bump happen under the lock. The follow-up work runs
+# in a background thread, one change at a time; changes that arrive while it
+# is busy are folded into one.
+import collections
+import os
+import threading
+import time
+
+from anomaly import DETECTOR
+from figure_cache import FIGURES
+from forecast_table import FORECASTS
+from leaderboard import LEADERBOARDS
+from notifications import NOTIFIER, anomaly_alerts
+from utils import open_dataset
+
+WATCH_INTERVAL = float(os.environ.get('RETAIL_WATCH_INTERVAL', 5))
+
+
+class DataWatcher:
+    """Process-wide view of the dataset version, refreshed at most every `interval` seconds"""
+
+    def __init__(self, interval=WATCH_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._checksums = {}
+        self._checked_at = 0.0
+        # Latest (dataset, version, months, started) waiting for the follow-up thread
+        self._pending = None
+        self._worker = None
+        self.last_error = None
+        self.events = collections.deque(maxlen=20)
+
+    def version(self):
+        """Current dataset version, checking the source first when the interval has passed"""
+        with self._lock:
+            if self._version is None or (self.interval > 0 and time.monotonic() - self._checked_at >= self.interval):
+                self._check()
+            return self._version
+
+    def refresh(self):
+        """Check the source now; returns the months that changed since the last check"""
+        with self._lock:
+            return self._check()
+
+    def _check(self):
+        started = time.perf_counter()
+        dataset = open_dataset()
+        self._checked_at = time.monotonic()
+        version = dataset.metadata.get('version', 0)
+        checksums = dataset.checksums()
+        changed = sorted(
+            month for month in set(checksums) | set(self._checksums)
+            if checksums.get(month) != self._checksums.get(month)
+        )
+        first_check = self._version is None
+        self._version, self._checksums = version, checksums
+        if first_check or not changed:
+            return []
+        months = changed
+        if self._pending is not None:
+            _, _, earlier, started = self._pending
+            months = sorted(set(earlier) | set(changed))
+        self._pending = (dataset, version, months, started)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._follow_up, name='data-watch', daemon=True)
+            self._worker.start()
+        return changed
+
+    def _follow_up(self):
+        """Apply pending changes until none are left (runs in the worker thread)"""
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, None
+                if pending is None:
+                    self._worker = None
+                    return
+            try:
+                self._apply(*pending)
+                self.last_error = None
+            except Exception as error:  # keep watching; the next change retries with fresh data
+                self.last_error = f"{type(error).__name__}: {error}"
+
+    def _apply(self, dataset, version, changed, started):
+        """Drop stale figures, score new days, wake the forecast job and update the leaderboards"""
+        evicted = FIGURES.discard(lambda key: dataset.version(*key[1][1:3]) != key[1][0])
+        # Score the new days while they are fresh rather than on the next Alerts visit
+        detected = DETECTOR.update(dataset)
+        if detected['anomalies'] and NOTIFIER.recipients():
+            NOTIFIER.notify(
+                anomaly_alerts(DETECTOR.anomalies('store'), DETECTOR.through)
+                + anomaly_alerts(DETECTOR.anomalies('pair'), DETECTOR.through)
+            )
+        FORECASTS.wake()
+        LEADERBOARDS.update(dataset)
+        self.events.append({
+            'at': time.time(),
+            'version': version,
+            'months': changed,
+            'figures_evicted': evicted,
+            'anomalies': detected['anomalies'],
+            'seconds': time.perf_counter() - started,
+        })
+
+
+WATCHER = DataWatcher()
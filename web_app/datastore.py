@@ -0,0 +1,457 @@
+# web_app/datastore.py
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+from sketches import ColumnSketches
+
+METADATA_FILE = '_partitions.json'
+
+
+def month_keys(dates):
+    """Return the 'YYYY-MM' partition key for each date"""
+    return pd.to_datetime(dates).dt.strftime('%Y-%m')
+
+
+def frame_checksum(df):
+    """Content hash of a frame, independent of its index"""
+    hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.sha1(hashes.tobytes()).hexdigest()[:16]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of a file's bytes"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partitions_version(checksums):
+    """Version string for (month, checksum) pairs, as used by PartitionedDataset.version"""
+    digest = hashlib.sha1()
+    for month, checksum in checksums:
+        digest.update(f"{month}:{checksum};".encode())
+    return digest.hexdigest()[:16]
+
+
+def frame_version(df):
+    """Version of the partitions a frame's rows come from, or None for other frames.
+
+    `read()` records the (month, checksum) of every partition it read in
+    `df.attrs['partitions']`, which survives slicing; only the months
+    between the frame's first and last Date count, so a view's version
+    only changes when data inside it changes.
+    """
+    partitions = df.attrs.get('partitions')
+    if partitions is None or len(df) == 0:
+        return None
+    first = f"{df['Date'].iloc[0]:%Y-%m}"
+    last = f"{df['Date'].iloc[-1]:%Y-%m}"
+    return partitions_version((month, checksum) for month, checksum in partitions if first <= month <= last)
+
+
+def _column_stats(df):
+    """Min/max of every date and numeric column, JSON serializable"""
+    stats = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            stats[column] = {'min': series.min().isoformat(), 'max': series.max().isoformat()}
+        elif pd.api.types.is_numeric_dtype(series):
+            stats[column] = {'min': float(series.min()), 'max': float(series.max())}
+    return stats
+
+
+def _to_timestamp(value):
+    return None if value is None else pd.Timestamp(value)
+
+
+def _source_info(csv_path):
+    """What a dataset records about the CSV it was built from"""
+    stat = os.stat(csv_path)
+    return {
+        'path': os.path.abspath(csv_path),
+        'mtime': stat.st_mtime,
+        'size': stat.st_size,
+        'sha1': file_digest(csv_path),
+    }
+
+
+class PartitionedDataset:
+    """Retail dataset stored as one Parquet file per calendar month of `Date`.
+
+    `_partitions.json` keeps, for every month, the file name, row count,
+    min/max of each date/numeric column and a content checksum. Reads and
+    aggregations use it to skip months outside the requested date range.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.metadata = self._read_metadata()
+
+    # ------------------------------------------------------------------ #
+    # Construction
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def exists(root):
+        return os.path.exists(os.path.join(root, METADATA_FILE))
+
+    @classmethod
+    def from_frame(cls, df, root, source=None):
+        """Write `df` as a fresh partitioned dataset under `root`"""
+        os.makedirs(root, exist_ok=True)
+        dataset = cls.__new__(cls)
+        dataset.root = root
+        dataset.metadata = {'version': 0, 'source': source, 'partitions': {}}
+
+        df = df.copy()
+        df['Date'] = pd.to_datetime(df['Date'])
+        for month, part in df.groupby(month_keys(df['Date']), sort=True):
+            dataset._write_partition(month, part)
+
+        # Drop files left over from an older layout of this dataset
+        for name in os.listdir(root):
+            if name.endswith('.parquet') and name[:-len('.parquet')] not in dataset.metadata['partitions']:
+                os.remove(os.path.join(root, name))
+
+        dataset._write_metadata()
+        return dataset
+
+    @classmethod
+    def from_csv(cls, csv_path, root):
+        """Partition a flat CSV export by month"""
+        df = pd.read_csv(csv_path)
+        return cls.from_frame(df, root, source=_source_info(csv_path))
+
+    # ------------------------------------------------------------------ #
+    # Metadata
+    # ------------------------------------------------------------------ #
+    def _read_metadata(self):
+        path = os.path.join(self.root, METADATA_FILE)
+        if not os.path.exists(path):
+            return {'version': 0, 'source': None, 'partitions': {}}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_metadata(self):
+        path = os.path.join(self.root, METADATA_FILE)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.metadata, f, indent=2)
+        os.replace(tmp_path, path)
+
+    @property
+    def source(self):
+        return self.metadata.get('source')
+
+    @property
+    def partitions(self):
+        """Partition entries ordered by month"""
+        return [self.metadata['partitions'][month] for month in sorted(self.metadata['partitions'])]
+
+    @property
+    def row_count(self):
+        return sum(p['rows'] for p in self.partitions)
+
+    def date_bounds(self):
+        """(first Date, last Date) of the whole dataset, or (None, None) when empty"""
+        partitions = self.partitions
+        if not partitions:
+            return None, None
+        return pd.Timestamp(partitions[0]['min_date']), pd.Timestamp(partitions[-1]['max_date'])
+
+    def prune(self, start=None, end=None):
+        """Partitions whose [min_date, max_date] overlaps the inclusive range"""
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        selected = []
+        for partition in self.partitions:
+            if end is not None and pd.Timestamp(partition['min_date']) > end:
+                continue
+            if start is not None and pd.Timestamp(partition['max_date']) < start:
+                continue
+            selected.append(partition)
+        return selected
+
+    def version(self, start=None, end=None):
+        """Checksum of the partitions covering a date range.
+
+        It only changes when data inside the range changes, so it can be
+        used as a cache key for anything computed from that range.
+        """
+        return partitions_version((p['month'], p['checksum']) for p in self.prune(start, end))
+
+    def checksums(self):
+        """Content checksum of every partition, by month"""
+        return {month: partition['checksum'] for month, partition in self.metadata['partitions'].items()}
+
+    # ------------------------------------------------------------------ #
+    # Partition I/O
+    # ------------------------------------------------------------------ #
+    def _partition_path(self, month):
+        return os.path.join(self.root, f'{month}.parquet')
+
+    def _sketch_path(self, month):
+        return os.path.join(self.root, f'{month}.sketch.npz')
+
+    def _write_partition(self, month, part):
+        part = part.sort_values('Date', kind='stable').reset_index(drop=True)
+        path = self._partition_path(month)
+        tmp_path = path + '.tmp'
+        part.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        checksum = frame_checksum(part)
+        ColumnSketches.from_frame(part).save(self._sketch_path(month), checksum=checksum)
+        self.metadata['partitions'][month] = {
+            'month': month,
+            'file': os.path.basename(path),
+            'rows': len(part),
+            'min_date': part['Date'].min().isoformat(),
+            'max_date': part['Date'].max().isoformat(),
+            'checksum': checksum,
+            'stats': _column_stats(part),
+            'written_at': time.time(),
+        }
+        self.metadata['version'] = self.metadata.get('version', 0) + 1
+
+    def read_partition(self, partition, columns=None):
+        return pd.read_parquet(os.path.join(self.root, partition['file']), columns=columns)
+
+    def _scan(self, start=None, end=None, columns=None):
+        """Yield the rows of each overlapping partition inside the range"""
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        if columns is not None and 'Date' not in columns:
+            read_columns = ['Date'] + list(columns)
+        else:
+            read_columns = columns
+        for partition in self.prune(start, end):
+            part = self._trim(partition, self.read_partition(partition, read_columns), start, end)
+            if columns is not None:
+                part = part[list(columns)]
+            yield partition, part
+
+    @staticmethod
+    def _straddles(partition, start, end):
+        return (
+            (start is not None and pd.Timestamp(partition['min_date']) < start)
+            or (end is not None and pd.Timestamp(partition['max_date']) > end)
+        )
+
+    def _trim(self, partition, part, start, end):
+        # Only partitions straddling a range boundary need row filtering
+        if not self._straddles(partition, start, end):
+            return part
+        if start is not None:
+            part = part[part['Date'] >= start]
+        if end is not None:
+            part = part[part['Date'] <= end]
+        return part
+
+    # ------------------------------------------------------------------ #
+    # Queries
+    # ------------------------------------------------------------------ #
+    def read(self, start=None, end=None, columns=None):
+        """Load the rows between `start` and `end` (inclusive), sorted by Date"""
+        parts = [part for _, part in self._scan(start, end, columns)]
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        df = pd.concat(parts, ignore_index=True)
+        df.attrs['partitions'] = self._read_checksums(start, end)
+        return df
+
+    def _read_checksums(self, start, end):
+        return tuple((p['month'], p['checksum']) for p in self.prune(start, end))
+
+    def reread(self, previous, start=None, end=None):
+        """`read(start, end)` reusing the rows of `previous` for months that have not changed.
+
+        `previous` is an earlier read of the same range (all columns). Only
+        partitions whose checksum differs from the one recorded in its attrs
+        are read from disk.
+        """
+        if previous is None or len(previous) == 0 or not previous.attrs.get('partitions'):
+            return self.read(start, end)
+        known = dict(previous.attrs['partitions'])
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        dates = previous['Date'].to_numpy()
+        parts = []
+        for partition in self.prune(start, end):
+            month = partition['month']
+            if known.get(month) == partition['checksum']:
+                # Rows are Date-sorted, so a month is one contiguous block
+                first = pd.Timestamp(f'{month}-01')
+                bounds = dates.searchsorted([first.to_datetime64(), (first + pd.offsets.MonthBegin()).to_datetime64()])
+                parts.append(previous.iloc[bounds[0]:bounds[1]])
+            else:
+                parts.append(self._trim(partition, self.read_partition(partition), start, end))
+        if not parts:
+            return pd.DataFrame()
+        df = pd.concat(parts, ignore_index=True)
+        df.attrs['partitions'] = self._read_checksums(start, end)
+        return df
+
+    def map_partitions(self, func, start=None, end=None, columns=None):
+        """Apply `func` to each partition in the range and return the results"""
+        return [func(part) for _, part in self._scan(start, end, columns)]
+
+    def aggregate(self, by, values, agg='sum', start=None, end=None):
+        """Group-by aggregation computed partition by partition.
+
+        `agg` is one of 'sum', 'count', 'min', 'max' or 'mean'. Partial
+        results are combined, so only the pruned partitions are ever read.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        values = [values] if isinstance(values, str) else list(values)
+        columns = list(dict.fromkeys(by + values))
+        if agg == 'mean':
+            partials = self.map_partitions(
+                lambda part: part.groupby(by)[values].agg(['sum', 'count']), start, end, columns
+            )
+            if not partials:
+                return pd.DataFrame(columns=values)
+            combined = pd.concat(partials).groupby(level=list(range(len(by)))).sum()
+            result = pd.DataFrame({
+                value: combined[(value, 'sum')] / combined[(value, 'count')] for value in values
+            })
+            result.index.names = by
+            return result
+
+        if agg not in ('sum', 'count', 'min', 'max'):
+            raise ValueError(f"Unsupported aggregation: {agg}")
+        combine = 'sum' if agg == 'count' else agg
+        partials = self.map_partitions(lambda part: part.groupby(by)[values].agg(agg), start, end, columns)
+        if not partials:
+            return pd.DataFrame(columns=values)
+        return pd.concat(partials).groupby(level=list(range(len(by)))).agg(combine)
+
+    def partition_sketches(self, partition):
+        """Sketches stored with a partition, rebuilt if missing or out of date"""
+        path = self._sketch_path(partition['month'])
+        if os.path.exists(path):
+            sketches, meta = ColumnSketches.load(path)
+            if meta.get('checksum') == partition['checksum']:
+                return sketches
+        sketches = ColumnSketches.from_frame(self.read_partition(partition))
+        sketches.save(path, checksum=partition['checksum'])
+        return sketches
+
+    def sketches(self, start=None, end=None):
+        """Distinct-count and quantile sketches for a date range.
+
+        Partitions inside the range contribute their stored sketches; only
+        the (at most two) partitions straddling a boundary are read and
+        sketched for the rows inside the range.
+        """
+        start, end = _to_timestamp(start), _to_timestamp(end)
+        merged = ColumnSketches()
+        for partition in self.prune(start, end):
+            if self._straddles(partition, start, end):
+                part = self._trim(partition, self.read_partition(partition), start, end)
+                sketches = ColumnSketches.from_frame(part)
+            else:
+                sketches = self.partition_sketches(partition)
+            merged = merged.merge(sketches)
+        return merged
+
+    # ------------------------------------------------------------------ #
+    # Updates
+    # ------------------------------------------------------------------ #
+    def source_unchanged(self, csv_path):
+        """True when the CSV still has the modification time and size it was partitioned from"""
+        source = self.source
+        if not source or not os.path.exists(csv_path):
+            return True
+        stat = os.stat(csv_path)
+        return source.get('mtime') == stat.st_mtime and source.get('size') == stat.st_size
+
+    def sync_csv(self, csv_path):
+        """Bring the partitions in line with a changed CSV export.
+
+        A CSV that was only touched (same content hash) just has its recorded
+        modification time updated. Otherwise it is re-partitioned in memory
+        and only months whose rows changed are rewritten; months no longer in
+        the export are removed. Returns the months that changed.
+        """
+        source = _source_info(csv_path)
+        if (self.source or {}).get('sha1') == source['sha1']:
+            self.metadata['source'] = source
+            self._write_metadata()
+            return []
+
+        df = pd.read_csv(csv_path)
+        df['Date'] = pd.to_datetime(df['Date'])
+        changed = []
+        months = set()
+        for month, part in df.groupby(month_keys(df['Date']), sort=True):
+            months.add(month)
+            existing = self.metadata['partitions'].get(month)
+            part = part.sort_values('Date', kind='stable').reset_index(drop=True)
+            if existing is not None and existing['checksum'] == frame_checksum(part):
+                continue
+            self._write_partition(month, part)
+            changed.append(month)
+        for month in sorted(set(self.metadata['partitions']) - months):
+            for path in (self._partition_path(month), self._sketch_path(month)):
+                if os.path.exists(path):
+                    os.remove(path)
+            del self.metadata['partitions'][month]
+            self.metadata['version'] = self.metadata.get('version', 0) + 1
+            changed.append(month)
+        self.metadata['source'] = source
+        self._write_metadata()
+        return sorted(changed)
+
+    def append_to_csv(self, csv_path, new_rows):
+        """Append imported rows to the CSV export; sync_csv then rewrites only their months.
+
+        The columns must match the CSV header. Rows whose (Date, Store ID,
+        Product ID) are already in the dataset are skipped. Returns the
+        numbers of rows appended and skipped.
+        """
+        columns = pd.read_csv(csv_path, nrows=0).columns.tolist()
+        missing = sorted(set(columns) - set(new_rows.columns))
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        new_rows = new_rows[columns].copy()
+        new_rows['Date'] = pd.to_datetime(new_rows['Date'])
+        keys = ['Date', 'Store ID', 'Product ID']
+        new_rows = new_rows.drop_duplicates(keys, keep='last')
+        existing = self.read(start=new_rows['Date'].min(), end=new_rows['Date'].max(), columns=keys)
+        if len(existing):
+            known = new_rows[keys].merge(existing.drop_duplicates(), on=keys, how='left', indicator=True)['_merge'] == 'both'
+        else:
+            known = pd.Series(False, index=range(len(new_rows)))
+        added = new_rows[~known.to_numpy()].sort_values('Date', kind='stable')
+        if len(added):
+            with open(csv_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                ends_with_newline = f.read(1) == b'\n'
+            with open(csv_path, 'a', newline='') as f:
+                if not ends_with_newline:
+                    f.write('\n')
+                added.to_csv(f, header=False, index=False, date_format='%Y-%m-%d')
+        return len(added), int(known.sum())
+
+    def append(self, new_rows):
+        """Add rows, rewriting only the months they fall in.
+
+        Appending a new day touches the newest partition (or creates the
+        next one at a month boundary); older partitions are left alone.
+        Returns the list of months that were written.
+        """
+        new_rows = new_rows.copy()
+        new_rows['Date'] = pd.to_datetime(new_rows['Date'])
+        touched = []
+        for month, rows in new_rows.groupby(month_keys(new_rows['Date']), sort=True):
+            existing = self.metadata['partitions'].get(month)
+            if existing is not None:
+                rows = pd.concat([self.read_partition(existing), rows], ignore_index=True)
+            self._write_partition(month, rows)
+            touched.append(month)
+        if touched:
+            self._write_metadata()
+        return touched
@@ -0,0 +1,406 @@
+# web_app/demand_model.py
+# Next-day demand model behind the what-if scenarios. A tree estimator from
+# forecasting is trained on the loaded data, exported to a TreeEnsemble
+# (tree_export) and stored under data/models/, named by a model version
+# derived from the data it was trained on. Later sessions and restarts load
+# the stored arrays instead of retraining.
+#
+# When the data has only grown since a stored model was trained (the months
+# before its last month are unchanged), the model is updated from the new
+# days instead of retrained: XGBoost continues boosting its saved booster
+# for a few rounds, a random forest replaces its oldest trees with trees
+# grown on the recent days. Each update first measures drift on the new
+# days: the population stability index of the target and key inputs
+# against the full training, and the model's error against its first
+# out-of-sample error. Too much drift, or a long chain of updates, leads to
+# a full retrain. An update only builds features for the days it reads
+# (the training window plus the history its lags need), so its cost grows
+# with the new data rather than the whole history. Every model is recorded in data/models/lineage.json with
+# its parent, mode, drift figures and training time; only the newest
+# KEEP_MODELS models of each estimator stay on disk.
+# No streamlit import, like analytics.
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+from perf import span
+from tree_export import TreeEnsemble, export
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_DIR = os.path.join(ROOT_DIR, 'data', 'models')
+LINEAGE_PATH = os.path.join(MODEL_DIR, 'lineage.json')
+
+# Scenarios look one day past the data, so next-day lags are usable
+HORIZON = 1
+DEFAULT_MODEL = 'xgboost'
+
+# Updates train on the new days, and on at least this many of the latest days
+UPDATE_MIN_DAYS = 7
+# Boosting rounds added per new day, within these bounds
+UPDATE_MIN_ROUNDS = 10
+UPDATE_MAX_ROUNDS = 100
+# Forest trees replaced per update, as a share of the forest per new day of a year
+UPDATE_MIN_TREES = 5
+# Updates since the last full training before the next full retrain
+MAX_UPDATES = 20
+# Drift limits: population stability index, and error over the first measured error
+DRIFT_PSI = 0.25
+DRIFT_ERROR_RATIO = 1.3
+DRIFT_COLUMNS = ('Price', 'Discount', 'Competitor Pricing', 'lag_1')
+DRIFT_BINS = 10
+# Fewer complete-feature rows than this are not enough to train on
+MIN_TRAIN_ROWS = 200
+# Stored models kept per estimator, and lineage records kept in total
+KEEP_MODELS = 5
+MAX_LINEAGE = 200
+
+_lineage_lock = threading.Lock()
+_train_lock = threading.Lock()
+
+
+def model_version(data, model):
+    """Short hash naming a model trained with `model` on the data behind a utils.data_key"""
+    payload = json.dumps([list(map(str, data)), model, HORIZON], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:12]
+
+
+def _model_path(model, version):
+    return os.path.join(MODEL_DIR, f'{model}-{version}.npz')
+
+
+def _booster_path(version):
+    """XGBoost's own model file, kept next to the export so boosting can continue"""
+    return os.path.join(MODEL_DIR, f'xgboost-{version}.ubj')
+
+
+# ---------------------------------------------------------------------- #
+# Lineage and drift
+# ---------------------------------------------------------------------- #
+def lineage(model=None):
+    """Recorded models, oldest first, optionally only those of one estimator"""
+    if not os.path.exists(LINEAGE_PATH):
+        return []
+    with open(LINEAGE_PATH) as f:
+        records = json.load(f)
+    return [record for record in records if model is None or record['model'] == model]
+
+
+def _record(entry):
+    with _lineage_lock:
+        records = (lineage() + [entry])[-MAX_LINEAGE:]
+        os.makedirs(MODEL_DIR, exist_ok=True)
+        tmp_path = LINEAGE_PATH + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f, indent=1)
+        os.replace(tmp_path, LINEAGE_PATH)
+        _prune(records)
+
+
+def _prune(records):
+    """Delete stored models other than the newest KEEP_MODELS of each estimator"""
+    keep = set()
+    for model in forecasting.ESTIMATORS:
+        versions = [record['version'] for record in records if record['model'] == model]
+        keep.update(os.path.basename(_model_path(model, version)) for version in versions[-KEEP_MODELS:])
+        if model == 'xgboost':
+            keep.update(os.path.basename(_booster_path(version)) for version in versions[-KEEP_MODELS:])
+    for model in forecasting.ESTIMATORS:
+        for path in glob.glob(os.path.join(MODEL_DIR, f'{model}-*.npz')) + glob.glob(os.path.join(MODEL_DIR, f'{model}-*.ubj')):
+            if os.path.basename(path) not in keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+def _reference(features, rows):
+    """Bin edges and shares of the target and DRIFT_COLUMNS over the training rows"""
+    if len(rows) == 0:
+        raise ValueError("No training rows to take drift reference bins from")
+    column = {name: i for i, name in enumerate(features.names)}
+    reference = {}
+    for name in ('Units Sold', *DRIFT_COLUMNS):
+        values = features.y[rows] if name == 'Units Sold' else features.X[rows, column[name]]
+        inner = np.unique(np.quantile(values, np.linspace(0, 1, DRIFT_BINS + 1)[1:-1]))
+        edges = np.concatenate([[-np.inf], inner, [np.inf]])
+        reference[name] = [edges[1:-1].tolist(), (np.histogram(values, edges)[0] / len(values)).tolist()]
+    return reference
+
+
+def population_stability(reference, values):
+    """PSI of `values` against reference (inner edges, shares); above 0.25 is a large shift"""
+    inner, expected = reference
+    edges = np.concatenate([[-np.inf], inner, [np.inf]])
+    actual = np.histogram(values, edges)[0] / max(len(values), 1)
+    expected, actual = np.maximum(expected, 1e-4), np.maximum(actual, 1e-4)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def drift(ensemble, meta, features, rows):
+    """Drift of the rows a model has not seen yet: PSI per column and error vs the first measured one"""
+    column = {name: i for i, name in enumerate(features.names)}
+    psi = {
+        name: population_stability(
+            meta['reference'][name], features.y[rows] if name == 'Units Sold' else features.X[rows, column[name]]
+        )
+        for name in meta['reference']
+    }
+    mae = float(np.mean(np.abs(ensemble.predict(features.X[rows]) - features.y[rows])))
+    baseline = meta.get('baseline_mae') or mae
+    return {
+        'psi': psi,
+        'max_psi': max(psi.values()),
+        'mae': mae,
+        'baseline_mae': baseline,
+        'error_ratio': mae / baseline if baseline > 0 else 1.0,
+    }
+
+
+def _last_day(meta, features):
+    """Day index (in `features`) of the last day a model was trained on"""
+    return int((pd.Timestamp(meta['trained_through']) - pd.Timestamp(features.first_date)).days)
+
+
+def _levels(df):
+    """Names behind each categorical feature code, as build_features would encode the whole of `df`"""
+    return {column: np.sort(df[column].unique()).tolist() for column in forecasting.CATEGORICAL}
+
+
+def _parent(df, model):
+    """Newest stored model of `model` trained on an earlier, otherwise unchanged state of `df`"""
+    partitions = dict(df.attrs.get('partitions') or [])
+    first_date = str(df['Date'].to_numpy()[0])
+    last_date = str(pd.Timestamp(df['Date'].iloc[-1]))
+    names = forecasting.feature_names(HORIZON)
+    levels = None
+    for record in reversed(lineage(model)):
+        path = _model_path(model, record['version'])
+        if not (record['first_date'] == first_date and record['trained_through'] < last_date
+                and os.path.exists(path)):
+            continue
+        # Every month before the parent's last one must still hold the same rows
+        last_month = record['trained_through'][:7]
+        if any(partitions.get(month) != checksum for month, checksum in record['months'] if month < last_month):
+            continue
+        ensemble, meta = TreeEnsemble.load(path)
+        levels = _levels(df) if levels is None else levels
+        if meta['features'] == names and meta['levels'] == levels:
+            return ensemble, meta
+    return None
+
+
+# ---------------------------------------------------------------------- #
+# Training
+# ---------------------------------------------------------------------- #
+def _meta(features, model, version, rows, **extra):
+    return {
+        'model': model,
+        'version': version,
+        'features': features.names,
+        'levels': features.levels,
+        'trained_rows': int(len(rows)),
+        'trained_through': str(pd.Timestamp(features.first_date) + pd.Timedelta(days=features.n_days - 1)),
+        'trained_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        **extra,
+    }
+
+
+def _store(df, features, ensemble, meta, estimator=None, seconds=0.0, **lineage_fields):
+    """Save the model (and XGBoost booster) under its version and add it to the lineage"""
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    if estimator is not None and meta['model'] == 'xgboost':
+        estimator.get_booster().save_model(_booster_path(meta['version']))
+    ensemble.save(_model_path(meta['model'], meta['version']), **meta)
+    _record({
+        'version': meta['version'],
+        'model': meta['model'],
+        'parent': meta.get('parent'),
+        'mode': meta['mode'],
+        'first_date': str(df['Date'].to_numpy()[0]),
+        'trained_through': meta['trained_through'],
+        'trained_rows': meta['trained_rows'],
+        'trees': ensemble.n_trees,
+        'seconds': round(seconds, 3),
+        'recorded_at': meta['trained_at'],
+        'months': [list(item) for item in df.attrs.get('partitions') or []],
+        **lineage_fields,
+    })
+
+
+def train(df, model=DEFAULT_MODEL, version=None, reason='new data'):
+    """Train on every complete row of `df`, export, and store when `version` is given.
+
+    Returns the TreeEnsemble and its metadata; raises ValueError when `df`
+    has fewer than MIN_TRAIN_ROWS complete rows.
+    """
+    features = forecasting.feature_set(df, HORIZON)
+    started = time.perf_counter()
+    rows = forecasting.training_rows(features, features.n_days)
+    if len(rows) < MIN_TRAIN_ROWS:
+        raise ValueError(
+            f"Only {len(rows)} rows with complete features (lags reach back "
+            f"{max(forecasting.feature_lags(HORIZON))} days); at least {MIN_TRAIN_ROWS} are needed to train"
+        )
+    with span(f'model.train.{model}', rows=len(rows)):
+        estimator = forecasting.fit_estimator(model, features, rows)
+        ensemble = export(estimator)
+    meta = _meta(features, model, version, rows, mode='full', updates=0, reference=_reference(features, rows))
+    if version is not None:
+        _store(df, features, ensemble, meta, estimator, time.perf_counter() - started, reason=reason)
+    return ensemble, meta
+
+
+def _continue(model, parent, parent_meta, features, rows, n_new_days, seed):
+    """Estimator or ensemble for an update: parent model plus what was learned from `rows`"""
+    X, y = features.X[rows], features.y[rows]
+    if model == 'xgboost':
+        booster = forecasting.xgboost.Booster()
+        booster.load_model(_booster_path(parent_meta['version']))
+        estimator = forecasting.ESTIMATORS[model](seed)
+        estimator.set_params(n_estimators=int(np.clip(n_new_days, UPDATE_MIN_ROUNDS, UPDATE_MAX_ROUNDS)))
+        estimator.fit(X, y, xgb_model=booster)
+        return estimator, export(estimator)
+    # Forests: the oldest trees make room for trees grown on the recent days
+    n_trees = parent.n_trees
+    replace = int(np.clip(round(n_trees * n_new_days / forecasting.DEFAULT_TRAIN_DAYS), UPDATE_MIN_TREES, n_trees // 2))
+    estimator = forecasting.ESTIMATORS[model](seed)
+    estimator.set_params(n_estimators=replace)
+    estimator.fit(X, y)
+    trees = parent.trees()[replace:] + export(estimator).trees()
+    ensemble = TreeEnsemble.from_trees(trees, scale=1.0 / len(trees), strict=parent.strict, n_features=parent.n_features)
+    return None, ensemble
+
+
+def _update_window(df, parent_meta):
+    """The rows of `df` an update reads: its training days and the history their features need"""
+    last_date = pd.Timestamp(df['Date'].iloc[-1])
+    n_new_days = (last_date - pd.Timestamp(parent_meta['trained_through'])).days
+    days = max(n_new_days, UPDATE_MIN_DAYS) + forecasting.history_days(HORIZON)
+    start = np.searchsorted(df['Date'].to_numpy(), np.datetime64(last_date - pd.Timedelta(days=days - 1)))
+    return df.iloc[start:]
+
+
+def update(df, version, parent, parent_meta, model=DEFAULT_MODEL):
+    """Model for `df` from a parent trained on its first days; a full retrain when drift is too large.
+
+    Features are built for the update window only, coded with the parent's levels.
+    """
+    with span('model.update.features'):
+        features = forecasting.build_features(_update_window(df, parent_meta), HORIZON, parent_meta['levels'])
+    first_new = _last_day(parent_meta, features) + 1
+    new = features.day_bounds(first_new, features.n_days)
+    new_rows = np.arange(new.start, new.stop)[features.complete[new]]
+    if len(new_rows) == 0:
+        # Nothing new to learn from: the parent still describes this data
+        return parent, parent_meta
+    measured = drift(parent, parent_meta, features, new_rows)
+    updates = parent_meta.get('updates', 0) + 1
+    if measured['max_psi'] > DRIFT_PSI:
+        return train(df, model, version, reason=f"input drift (PSI {measured['max_psi']:.2f})")
+    if measured['error_ratio'] > DRIFT_ERROR_RATIO:
+        return train(df, model, version, reason=f"error drift (MAE x{measured['error_ratio']:.2f})")
+    if updates > MAX_UPDATES:
+        return train(df, model, version, reason=f"{MAX_UPDATES} updates since full training")
+
+    started = time.perf_counter()
+    n_new_days = features.n_days - first_new
+    recent = forecasting.training_rows(features, features.n_days, train_days=max(n_new_days, UPDATE_MIN_DAYS))
+    if len(recent) == 0:
+        return parent, parent_meta
+    with span(f'model.update.{model}', rows=len(recent)):
+        estimator, ensemble = _continue(model, parent, parent_meta, features, recent, n_new_days, seed=updates)
+    meta = _meta(
+        features, model, version, recent, mode='update', parent=parent_meta['version'], updates=updates,
+        reference=parent_meta['reference'], baseline_mae=measured['baseline_mae'],
+    )
+    _store(df, features, ensemble, meta, estimator, time.perf_counter() - started,
+           reason=f"{n_new_days} new day(s)", new_rows=int(len(new_rows)), drift=measured)
+    return ensemble, meta
+
+
+def load_or_train(df, data, model=DEFAULT_MODEL, incremental=True):
+    """Stored model for the data behind `data` (a utils.data_key), updated or trained on first use.
+
+    Raises ValueError when `df` has too few complete rows to train on.
+    """
+    version = model_version(data, model)
+    path = _model_path(model, version)
+    # One training at a time, so a page and a background refresh do not both build a version
+    with _train_lock:
+        if os.path.exists(path):
+            ensemble, meta = TreeEnsemble.load(path)
+            if meta.get('features') == forecasting.feature_names(HORIZON):
+                return ensemble, meta
+        parent = _parent(df, model) if incremental else None
+        if parent is None:
+            return train(df, model, version)
+        return update(df, version, *parent, model=model)
+
+
+def refresh_in_background(load, models=(DEFAULT_MODEL,)):
+    """Bring the stored models up to date from a daemon thread (after an import).
+
+    `load()` returns the whole dataset and its utils.data_key; it is called
+    in the thread, so the caller does not wait for the read.
+    """
+    def run():
+        df, data = load()
+        for model in models:
+            try:
+                load_or_train(df, data, model)
+            except ValueError:
+                # Too little data to train on; pages report it when they need the model
+                return
+    thread = threading.Thread(target=run, name='model-refresh', daemon=True)
+    thread.start()
+    return thread
+
+
+def _encode(levels, column, values):
+    """Integer feature codes for label values; unseen labels become NaN (the missing branch)"""
+    names = levels[column]
+    return np.array([names.index(value) if value in names else np.nan for value in values], dtype=np.float64)
+
+
+def scenario_grid(ensemble, df, store, product, prices, discounts, holidays=None, weathers=None):
+    """Predicted next-day demand and revenue for every combination of the given inputs.
+
+    Inputs not swept (holiday, weather, competitor price) keep the values of
+    the pair's latest row. All combinations are scored in one batched
+    predict call.
+    """
+    features = forecasting.feature_set(df, HORIZON)
+    series = features.series_index(store, product)
+    if series is None:
+        raise ValueError(f"No history for product {product} in store {store}")
+    base = forecasting.next_day_features(features, series)
+    column = {name: i for i, name in enumerate(features.names)}
+    weather_names = features.levels['Weather Condition']
+    if holidays is None:
+        holidays = [int(base[column['Holiday/Promotion']])]
+    if weathers is None:
+        weathers = [weather_names[int(base[column['weather_code']])]]
+
+    combos = pd.MultiIndex.from_product(
+        [prices, discounts, holidays, weathers],
+        names=['Price', 'Discount', 'Holiday/Promotion', 'Weather Condition'],
+    ).to_frame(index=False)
+    X = np.repeat(base[None, :], len(combos), axis=0).astype(np.float64)
+    X[:, column['Price']] = combos['Price']
+    X[:, column['Discount']] = combos['Discount']
+    X[:, column['Holiday/Promotion']] = combos['Holiday/Promotion']
+    X[:, column['price_ratio']] = combos['Price'] / base[column['Competitor Pricing']]
+    X[:, column['weather_code']] = _encode(features.levels, 'Weather Condition', combos['Weather Condition'])
+
+    with span('model.scenarios', rows=len(combos)):
+        demand = np.maximum(ensemble.predict(X), 0)
+    combos['Demand'] = demand
+    combos['Revenue'] = demand * combos['Price'] * (1 - combos['Discount'] / 100)
+    return combos
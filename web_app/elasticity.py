@@ -0,0 +1,139 @@
+# web_app/elasticity.py
+# Price elasticities for every product (or product and region) from one
+# log-log demand model per group:
+#
+#   log(1 + Units Sold) = a + b_price * log(Price) + b_discount * Discount
+#                           + b_relative * log(Price / Competitor Pricing)
+#
+# All groups are fitted together: each entry of every group's normal
+# equations X'X b = X'y is accumulated with one bincount over the rows, and
+# the stacked (groups x 4 x 4) systems are solved in a single call.
+# With the competitor's price held fixed, a 1% price change moves demand by
+# b_price + b_relative percent (the "Price Elasticity" column).
+# No streamlit import, like analytics.
+import numpy as np
+import pandas as pd
+
+from perf import timed
+
+TERMS = ('Intercept', 'log Price', 'Discount', 'log Relative Price')
+# Groups with fewer rows get no estimate
+MIN_ROWS = 30
+# Ridge added relative to each diagonal entry, keeps constant columns solvable
+RIDGE = 1e-8
+# |t| above which an estimate is treated as significant
+SIGNIFICANT_T = 2.0
+
+
+def design(df):
+    """Model matrix (rows x TERMS), log(1 + Units Sold) and the rows usable for fitting"""
+    price = df['Price'].to_numpy(dtype=np.float64)
+    competitor = df['Competitor Pricing'].to_numpy(dtype=np.float64)
+    units = df['Units Sold'].to_numpy(dtype=np.float64)
+    usable = (price > 0) & (competitor > 0) & (units >= 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = np.column_stack([
+            np.ones(len(df)),
+            np.log(price),
+            df['Discount'].to_numpy(dtype=np.float64),
+            np.log(price / competitor),
+        ])
+    return X, np.log1p(units), usable & np.isfinite(X).all(axis=1)
+
+
+def _normal_equations(codes, n_groups, X, y):
+    """Per-group X'X, X'y, y'y and row counts, one bincount per entry"""
+    k = X.shape[1]
+    xtx = np.empty((n_groups, k, k))
+    for i in range(k):
+        for j in range(i, k):
+            xtx[:, i, j] = xtx[:, j, i] = np.bincount(codes, X[:, i] * X[:, j], minlength=n_groups)
+    xty = np.column_stack([np.bincount(codes, X[:, i] * y, minlength=n_groups) for i in range(k)])
+    yty = np.bincount(codes, y * y, minlength=n_groups)
+    y_sum = np.bincount(codes, y, minlength=n_groups)
+    return xtx, xty, yty, y_sum
+
+
+@timed()
+def fit(df, by=('Product ID',), min_rows=MIN_ROWS):
+    """Elasticity estimates and standard errors for every group of `by` in `df`"""
+    by = list(by)
+    X, y, usable = design(df)
+    keys = df.loc[usable, by]
+    X, y = X[usable], y[usable]
+    codes, groups = pd.factorize(pd.MultiIndex.from_frame(keys) if len(by) > 1 else keys[by[0]], sort=True)
+    n_groups, k = len(groups), len(TERMS)
+    rows = np.bincount(codes, minlength=n_groups)
+
+    xtx, xty, yty, y_sum = _normal_equations(codes, n_groups, X, y)
+    diagonal = np.diagonal(xtx, axis1=1, axis2=2)
+    system = xtx + RIDGE * np.maximum(diagonal, 1.0)[:, :, None] * np.eye(k)
+    beta = np.linalg.solve(system, xty[:, :, None])[:, :, 0]
+    covariance_unscaled = np.linalg.inv(system)
+
+    # Residual sum of squares from the accumulated moments: y'y - 2b'X'y + b'X'Xb
+    sse = yty - 2 * (beta * xty).sum(axis=1) + np.einsum('gi,gij,gj->g', beta, xtx, beta)
+    dof = rows - k
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma2 = np.where(dof > 0, np.maximum(sse, 0) / dof, np.nan)
+        sst = yty - y_sum ** 2 / rows
+        r2 = 1 - sse / sst
+    covariance = sigma2[:, None, None] * covariance_unscaled
+
+    price, discount, relative = 1, 2, 3
+    result = pd.DataFrame(
+        groups.to_list() if len(by) > 1 else {by[0]: groups}, columns=by
+    )
+    result['Rows'] = rows
+    result['Price Elasticity'] = beta[:, price] + beta[:, relative]
+    result['Price Elasticity SE'] = np.sqrt(
+        covariance[:, price, price] + covariance[:, relative, relative] + 2 * covariance[:, price, relative]
+    )
+    result['Relative Price Elasticity'] = beta[:, relative]
+    result['Relative Price SE'] = np.sqrt(covariance[:, relative, relative])
+    result['Discount Effect'] = beta[:, discount]
+    result['Discount Effect SE'] = np.sqrt(covariance[:, discount, discount])
+    result['Intercept'] = beta[:, 0]
+    result['R2'] = r2
+    estimates = result.columns[len(by) + 1:]
+    result.loc[rows < max(min_rows, k + 1), estimates] = np.nan
+    return result
+
+
+def demand_ratio(estimate, price, discount, base_price, base_discount):
+    """Demand at `price`/`discount` relative to the base, competitor price unchanged.
+
+    `estimate` is one row of fit(); exact in log(1 + units), so an
+    approximation of the ratio of units.
+    """
+    log_change = (
+        estimate['Price Elasticity'] * (np.log(price) - np.log(base_price))
+        + estimate['Discount Effect'] * (np.asarray(discount) - base_discount)
+    )
+    return np.exp(log_change)
+
+
+@timed()
+def price_sensitivity_alerts(df, estimates, top=10):
+    """Products priced above competitors whose sales measurably fall with the premium.
+
+    Uses the groups of `estimates` (from fit) and the mean prices in `df`;
+    'Sales Lift' is the estimated change in units from matching the
+    competitor's price.
+    """
+    by = [column for column in ('Product ID', 'Region') if column in estimates.columns]
+    prices = df.groupby(by).agg({
+        'Price': 'mean',
+        'Competitor Pricing': 'mean',
+        'Units Sold': 'mean',
+    }).reset_index()
+    merged = prices.merge(estimates, on=by)
+    significant = merged['Relative Price Elasticity'] < -SIGNIFICANT_T * merged['Relative Price SE']
+    flagged = merged[significant & (merged['Price'] > merged['Competitor Pricing'])].copy()
+    flagged['Price Premium'] = (flagged['Price'] / flagged['Competitor Pricing'] - 1) * 100
+    ratio = np.exp(-flagged['Relative Price Elasticity'] * np.log(flagged['Price'] / flagged['Competitor Pricing']))
+    flagged['Sales Lift'] = (ratio - 1) * 100
+    flagged['Extra Units per Store-Day'] = flagged['Units Sold'] * (ratio - 1)
+    columns = by + ['Price', 'Competitor Pricing', 'Price Premium', 'Relative Price Elasticity',
+                    'Units Sold', 'Sales Lift', 'Extra Units per Store-Day']
+    return len(flagged), flagged[columns].sort_values('Extra Units per Store-Day', ascending=False).head(top)
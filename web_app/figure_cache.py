@@ -0,0 +1,183 @@
+# web_app/figure_cache.py
+# Serialized Plotly figures shared by every session. A chart is identified
+# by a chart id, the data it was drawn from (dataset version and date range,
+# see utils.data_key) and its filter parameters. While those are unchanged
+# the stored JSON spec is sent to the browser again, skipping the aggregation
+# behind the chart, the Plotly Express build and the serialization.
+#
+# Cached specs are sent with Streamlit internals (_enqueue_direct) that match
+# streamlit==1.37.1, the version pinned in requirements.txt; upgrading
+# Streamlit means checking _enqueue_direct against the new version first. On
+# any other version, or if the direct send fails, specs are turned back into
+# figures for the public st.plotly_chart (about 10-30 ms per chart), and the
+# Admin page's figure cache line says so.
+import collections
+import json
+import os
+import threading
+
+import streamlit as st
+
+import perf
+from startup import lazy_import
+
+plotly_io = lazy_import('plotly.io')
+
+
+class FigureCache:
+    """Least-recently-used figure specs, bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._specs = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            spec = self._specs.get(key)
+            if spec is None:
+                self.misses += 1
+                return None
+            self._specs.move_to_end(key)
+            self.hits += 1
+            return spec
+
+    def put(self, key, spec):
+        with self._lock:
+            old = self._specs.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            if len(spec) > self.max_bytes:
+                return
+            self._specs[key] = spec
+            self._bytes += len(spec)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._specs.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def discard(self, stale):
+        """Drop the entries whose key `stale(key)` is true; returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._specs if stale(key)]
+            for key in keys:
+                self._bytes -= len(self._specs.pop(key))
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._specs.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._specs),
+                'size_mb': self._bytes / 1e6,
+                'max_mb': self.max_bytes / 1e6,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+FIGURES = FigureCache(int(float(os.environ.get('RETAIL_FIGURE_CACHE_MB', 64)) * 1e6))
+
+
+def lazy(func, *args, **kwargs):
+    """`func(*args, **kwargs)` computed on first call only; cached charts may never need it"""
+    result = []
+
+    def get():
+        if not result:
+            result.append(func(*args, **kwargs))
+        return result[0]
+    return get
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# The direct path below uses st._main, DeltaGenerator._enqueue, current_form_id
+# and compute_widget_id's keyword signature as of this version; keep it in
+# step with the streamlit pin in requirements.txt
+PINNED_STREAMLIT = '1.37.1'
+_direct_enqueue = st.__version__ == PINNED_STREAMLIT
+_direct_error = None if _direct_enqueue else f"streamlit {st.__version__} is not the pinned {PINNED_STREAMLIT}"
+
+
+def _enqueue_direct(spec, use_container_width):
+    """Send an already serialized figure, as st.plotly_chart would after serializing it"""
+    from streamlit.elements.form import current_form_id
+    from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    from streamlit.runtime.state.common import compute_widget_id
+
+    dg = st._main
+    proto = PlotlyChartProto()
+    proto.use_container_width = use_container_width
+    proto.theme = 'streamlit'
+    proto.form_id = current_form_id(dg)
+    proto.spec = spec
+    proto.config = json.dumps({'showLink': False, 'linkText': False})
+    ctx = get_script_run_ctx()
+    proto.id = compute_widget_id(
+        'plotly_chart',
+        user_key=None,
+        key=None,
+        plotly_spec=proto.spec,
+        plotly_config=proto.config,
+        selection_mode=('points', 'box', 'lasso'),
+        is_selection_activated=False,
+        theme='streamlit',
+        form_id=proto.form_id,
+        use_container_width=use_container_width,
+        page=ctx.active_script_hash if ctx else None,
+    )
+    dg._enqueue('plotly_chart', proto)
+
+
+def _enqueue_spec(spec, use_container_width):
+    """Draw a serialized figure: directly on the pinned Streamlit, else through the public API"""
+    global _direct_enqueue, _direct_error
+    if _direct_enqueue:
+        try:
+            _enqueue_direct(spec, use_container_width)
+            return
+        except Exception as error:
+            # Internals changed under us: stop trying and re-validate through st.plotly_chart
+            _direct_enqueue = False
+            _direct_error = f"{type(error).__name__}: {error}"
+    st.plotly_chart(plotly_io.from_json(spec), use_container_width=use_container_width)
+
+
+def send_mode():
+    """How cached specs reach the browser, for the Admin page"""
+    if _direct_enqueue:
+        return f"sent directly (streamlit {PINNED_STREAMLIT})"
+    return f"rebuilt for st.plotly_chart ({_direct_error})"
+
+
+def plotly_chart(chart_id, data, build, params=(), use_container_width=True):
+    """Draw a chart, reusing its serialized spec while its data and params are unchanged.
+
+    `data` is a utils.data_key() (None disables caching) and `build()`
+    returns the Plotly figure; it only runs on a cache miss.
+    """
+    if data is None:
+        st.plotly_chart(build(), use_container_width=use_container_width)
+        return
+    key = (chart_id, data, _freeze(params))
+    spec = FIGURES.get(key)
+    if spec is None:
+        with perf.span(f'figure.{chart_id}'):
+            spec = plotly_io.to_json(build(), validate=False)
+        FIGURES.put(key, spec)
+    _enqueue_spec(spec, use_container_width)
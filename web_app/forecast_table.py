@@ -0,0 +1,398 @@
+# web_app/forecast_table.py
+# Materialized forward forecasts. A background job forecasts every
+# store/product pair HORIZON days past the end of the data, with a point
+# forecast and an INTERVAL prediction interval per day, and stores the
+# result in data/forecasts/forward.npz. Pages only read that table (a file
+# stat per rerun, arrays reloaded when the file changes); they never train
+# or run a model.
+#
+# Forecasts are direct: the day h ahead comes from a model trained with the
+# shortest horizon in MODEL_HORIZONS that is at least h, so its lags never
+# reach past the last observed day. Interval bounds are quantiles of each
+# model's errors on the last CALIBRATION_DAYS, predicted by a fit on the
+# days before them. The table is rebuilt when the dataset version changes:
+# the job checks every RETAIL_FORECAST_INTERVAL seconds (default 3600,
+# 0 = no job, build from the command line) and the data watcher wakes it
+# when months change.
+#
+# Projected stockouts draw each pair's stock down by the forecasts and add
+# the receipts it can expect: orders already recorded (Units Ordered) arrive
+# after the lead time, later days receive the pair's average daily order.
+#
+#   python forecast_table.py            # build the table if the data changed
+#   python forecast_table.py --force
+#
+# No streamlit import, like analytics.
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import forecasting
+from inventory_policy import DEFAULT_LEAD_TIME_DAYS
+from perf import span
+from startup import lazy_import
+
+go = lazy_import('plotly.graph_objects')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TABLE_PATH = os.path.join(ROOT_DIR, 'data', 'forecasts', 'forward.npz')
+
+HORIZON = 14
+MODEL_HORIZONS = (1, 3, 7, 14)
+MODEL = 'xgboost'
+INTERVAL = 0.8
+CALIBRATION_DAYS = 28
+REFRESH_INTERVAL = float(os.environ.get('RETAIL_FORECAST_INTERVAL', 3600))
+# Bumped when the table layout or the settings above change the results
+TABLE_FORMAT = [2, HORIZON, list(MODEL_HORIZONS), MODEL, INTERVAL, CALIBRATION_DAYS]
+
+
+class ForecastTable:
+    """Forecasts of every pair (rows) for each day ahead (columns), with lookup by pair"""
+
+    def __init__(self, stores, products, categories, regions, inventory, orders, dates, forecast, lower, upper,
+                 meta):
+        self.stores = stores
+        self.products = products
+        self.categories = categories
+        self.regions = regions
+        # Inventory Level on each pair's latest day, the stock the forecasts draw down
+        self.inventory = inventory
+        # Units Ordered on each pair's last HORIZON observed days, oldest first (NaN = no row)
+        self.orders = orders
+        self.dates = dates
+        self.forecast = forecast
+        self.lower = lower
+        self.upper = upper
+        self.meta = meta
+        self._index = {key: i for i, key in enumerate(zip(stores.tolist(), products.tolist()))}
+
+    def __len__(self):
+        return len(self.stores)
+
+    @property
+    def through(self):
+        """Last observed date the forecasts start from"""
+        return pd.Timestamp(self.meta['through'])
+
+    def rows(self, stores=None, products=None, categories=None, regions=None):
+        """Pair rows matching the given values (None = any)"""
+        mask = np.ones(len(self), dtype=bool)
+        for values, column in ((stores, self.stores), (products, self.products),
+                               (categories, self.categories), (regions, self.regions)):
+            if values is not None:
+                mask &= np.isin(column, list(values))
+        return np.flatnonzero(mask)
+
+    def pair(self, store, product):
+        """Date, Horizon, Forecast, Lower and Upper of one pair, or None when it is not in the table"""
+        i = self._index.get((store, product))
+        if i is None:
+            return None
+        return pd.DataFrame({
+            'Date': self.dates,
+            'Horizon': np.arange(1, len(self.dates) + 1),
+            'Forecast': self.forecast[i],
+            'Lower': self.lower[i],
+            'Upper': self.upper[i],
+        })
+
+    def total(self, rows=None):
+        """Daily forecast summed over pair rows; bounds combine the pairs' half-widths in quadrature"""
+        rows = np.arange(len(self)) if rows is None else rows
+        forecast = self.forecast[rows].sum(axis=0)
+        below = np.sqrt(((self.forecast[rows] - self.lower[rows]) ** 2).sum(axis=0))
+        above = np.sqrt(((self.upper[rows] - self.forecast[rows]) ** 2).sum(axis=0))
+        return pd.DataFrame({
+            'Date': self.dates,
+            'Forecast': forecast,
+            'Lower': np.maximum(forecast - below, 0),
+            'Upper': forecast + above,
+        })
+
+    def frame(self, rows=None):
+        """Long table: one row per (Store ID, Product ID, Date)"""
+        rows = np.arange(len(self)) if rows is None else rows
+        days = len(self.dates)
+        return pd.DataFrame({
+            'Store ID': np.repeat(self.stores[rows], days),
+            'Product ID': np.repeat(self.products[rows], days),
+            'Date': np.tile(self.dates, len(rows)),
+            'Horizon': np.tile(np.arange(1, days + 1), len(rows)),
+            'Forecast': self.forecast[rows].ravel(),
+            'Lower': self.lower[rows].ravel(),
+            'Upper': self.upper[rows].ravel(),
+        })
+
+    def receipts(self, rows=None, days=None, lead_time_days=DEFAULT_LEAD_TIME_DAYS):
+        """Units each pair expects to receive on each day ahead.
+
+        An order placed on the last observed day arrives `lead_time_days`
+        later, so the first days receive the recorded orders; days past the
+        lead time receive the pair's average daily order.
+        """
+        rows = np.arange(len(self)) if rows is None else rows
+        days = len(self.dates) if days is None else min(days, len(self.dates))
+        placed = self.orders[rows]
+        recorded = ~np.isnan(placed)
+        average = np.divide(np.where(recorded, placed, 0).sum(axis=1), recorded.sum(axis=1),
+                            out=np.zeros(len(rows)), where=recorded.any(axis=1))
+        ahead = np.arange(1, days + 1)
+        column = placed.shape[1] - 1 - lead_time_days + ahead
+        known = (ahead <= lead_time_days) & (column >= 0)
+        pipeline = placed[:, np.where(known, column, 0)]
+        return np.where(known & ~np.isnan(pipeline), pipeline, average[:, None])
+
+    def stockouts(self, days=None, rows=None, lead_time_days=DEFAULT_LEAD_TIME_DAYS):
+        """Pairs whose stock runs out within `days` (default: the horizon) at the point forecast.
+
+        Stock is the current inventory plus expected receipts (see receipts)
+        less cumulative forecast demand. Earliest Stockout is the first day
+        cumulative demand at the upper bound (pair half-widths combined in
+        quadrature) exceeds it. Soonest first.
+        """
+        rows = np.arange(len(self)) if rows is None else rows
+        days = len(self.dates) if days is None else min(days, len(self.dates))
+        receipts = self.receipts(rows, days, lead_time_days)
+        supply = self.inventory[rows, None] + np.cumsum(receipts, axis=1)
+        demand = np.cumsum(self.forecast[rows, :days], axis=1)
+        high = demand + np.sqrt(np.cumsum((self.upper[rows, :days] - self.forecast[rows, :days]) ** 2, axis=1))
+        point, high = demand > supply, high > supply
+        at_risk = point.any(axis=1)
+        rows, receipts, point, high = rows[at_risk], receipts[at_risk], point[at_risk], high[at_risk]
+        result = pd.DataFrame({
+            'Store ID': self.stores[rows],
+            'Product ID': self.products[rows],
+            'Category': self.categories[rows],
+            'Region': self.regions[rows],
+            'Current Inventory': self.inventory[rows],
+            'Expected Receipts': receipts.sum(axis=1),
+            'Forecast Demand': self.forecast[rows, :days].sum(axis=1),
+            'Projected Stockout': self.dates[point.argmax(axis=1)],
+            'Earliest Stockout': self.dates[high.argmax(axis=1)],
+        })
+        return result.sort_values(['Projected Stockout', 'Earliest Stockout', 'Store ID', 'Product ID'],
+                                  ignore_index=True)
+
+    # ------------------------------------------------------------------ #
+    # Storage (.npz, no pickled objects)
+    # ------------------------------------------------------------------ #
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path, header=np.array(json.dumps(self.meta)),
+            stores=self.stores.astype(str), products=self.products.astype(str),
+            categories=self.categories.astype(str), regions=self.regions.astype(str),
+            inventory=self.inventory, orders=self.orders, dates=self.dates.to_numpy().astype('datetime64[D]'),
+            forecast=self.forecast, lower=self.lower, upper=self.upper,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Stored table, or None when it was written in another TABLE_FORMAT"""
+        with np.load(path, allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays['header']))
+            if meta.get('format') != TABLE_FORMAT:
+                return None
+            return cls(
+                arrays['stores'], arrays['products'], arrays['categories'], arrays['regions'],
+                arrays['inventory'], arrays['orders'], pd.DatetimeIndex(arrays['dates']), arrays['forecast'],
+                arrays['lower'], arrays['upper'], meta,
+            )
+
+
+def _model_steps():
+    """(model horizon, days ahead it forecasts) pairs covering 1..HORIZON"""
+    steps, first = [], 1
+    for horizon in MODEL_HORIZONS:
+        steps.append((horizon, range(first, min(horizon, HORIZON) + 1)))
+        first = horizon + 1
+    return [(horizon, ahead) for horizon, ahead in steps if len(ahead)]
+
+
+def _error_quantiles(features, seed=0):
+    """Quantiles of forecast minus actual over the last CALIBRATION_DAYS, fitted on the days before"""
+    origin = features.n_days - CALIBRATION_DAYS
+    rows = forecasting.training_rows(features, origin, seed=seed)
+    test = features.day_bounds(origin, features.n_days)
+    test = np.arange(test.start, test.stop)[features.complete[test]]
+    if len(rows) == 0 or len(test) == 0:
+        raise ValueError("Not enough history to calibrate forecast intervals")
+    estimator = forecasting.fit_estimator(MODEL, features, rows, seed)
+    error = np.maximum(estimator.predict(features.X[test]), 0) - features.y[test]
+    tail = (1 - INTERVAL) / 2
+    low, high = np.quantile(error, [tail, 1 - tail])
+    return float(low), float(high)
+
+
+def build(df, version=None, seed=0):
+    """ForecastTable for a Date-sorted frame, forecasting HORIZON days past its last date"""
+    started = time.perf_counter()
+    last_date = df['Date'].iloc[-1]
+    forecast = lower = upper = None
+    errors = {}
+    for horizon, ahead in _model_steps():
+        with span('forecast_table.model', rows=len(df)):
+            features = forecasting.feature_set(df, horizon)
+            low, high = _error_quantiles(features, seed)
+            rows = forecasting.training_rows(features, features.n_days, seed=seed)
+            estimator = forecasting.fit_estimator(MODEL, features, rows, seed)
+        if forecast is None:
+            shape = (len(features.keys), HORIZON)
+            forecast, lower, upper = np.empty(shape), np.empty(shape), np.empty(shape)
+        for step in ahead:
+            point = np.maximum(estimator.predict(forecasting.future_features(features, step)), 0)
+            # A forecast above the actual by `high` means the actual sits `high` below it
+            forecast[:, step - 1] = point
+            lower[:, step - 1] = np.maximum(point - high, 0)
+            upper[:, step - 1] = point - low
+        errors[str(horizon)] = [low, high]
+
+    # Orders of the last HORIZON days on the (series x day) grid of the last features
+    first_day = features.n_days - HORIZON
+    recent = features.day >= first_day
+    orders = np.full((len(features.keys), HORIZON), np.nan)
+    orders[features.series[recent], features.day[recent] - first_day] = df['Units Ordered'].to_numpy(np.float64)[recent]
+
+    # Labels and stock from each pair's latest row, in series code order
+    latest = (df.drop_duplicates(['Store ID', 'Product ID'], keep='last')
+              .set_index(['Store ID', 'Product ID'])
+              .reindex(pd.MultiIndex.from_tuples(features.keys, names=['Store ID', 'Product ID']))
+              .reset_index())
+    meta = {
+        'format': TABLE_FORMAT,
+        'version': version,
+        'through': str(pd.Timestamp(last_date).date()),
+        'model': MODEL,
+        'interval': INTERVAL,
+        'built_at': time.time(),
+        'seconds': time.perf_counter() - started,
+        'errors': errors,
+    }
+    return ForecastTable(
+        latest['Store ID'].to_numpy(str), latest['Product ID'].to_numpy(str),
+        latest['Category'].to_numpy(str), latest['Region'].to_numpy(str),
+        latest['Inventory Level'].to_numpy(np.float64), orders,
+        pd.date_range(pd.Timestamp(last_date) + pd.Timedelta(days=1), periods=HORIZON),
+        forecast, lower, upper, meta,
+    )
+
+
+class ForwardForecasts:
+    """The stored table for readers, and the job that rebuilds it when the data changes"""
+
+    def __init__(self, path=TABLE_PATH, interval=REFRESH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._table = None
+        self._stat = None
+        self._wake = threading.Event()
+        self._thread = None
+        self.last_error = None
+
+    def table(self):
+        """Latest stored ForecastTable, or None until the job has built one in the current format"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stat = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stat != self._stat:
+                self._table, self._stat = ForecastTable.load(self.path), stat
+            return self._table
+
+    def for_frame(self, df):
+        """Stored table when its forecasts continue `df` (the frame ends on the table's last observed date)"""
+        table = self.table()
+        if table is None or len(df) == 0 or df['Date'].iloc[-1] != table.through:
+            return None
+        return table
+
+    def stale(self, version):
+        table = self.table()
+        return table is None or table.meta.get('version') != version or table.meta.get('format') != TABLE_FORMAT
+
+    def refresh(self, dataset, force=False):
+        """Rebuild the table when the dataset version changed; True when it was rebuilt"""
+        with self._build_lock:
+            version = dataset.version()
+            if not force and not self.stale(version):
+                return False
+            with span('forecast_table.build', rows=dataset.row_count):
+                table = build(dataset.read(), version)
+            table.save(self.path)
+            return True
+
+    def start(self):
+        """Start the scheduled job once per process (no-op when the interval is 0)"""
+        with self._lock:
+            if self._thread is not None or self.interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, name='forecast-table', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Have the job check the data now rather than at its next interval"""
+        self._wake.set()
+
+    def _run(self):
+        from utils import open_dataset
+        while True:
+            try:
+                self.refresh(open_dataset())
+                self.last_error = None
+            except Exception as error:  # keep the schedule alive; the next check retries
+                self.last_error = f"{type(error).__name__}: {error}"
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+FORECASTS = ForwardForecasts()
+
+
+def add_overlay(fig, forecast, color='#ff7f0e'):
+    """Add a forecast line and its interval band (a ForecastTable.total or .pair frame) to a Plotly figure"""
+    dates = list(forecast['Date'])
+    fig.add_trace(go.Scatter(
+        x=dates + dates[::-1],
+        y=list(forecast['Upper']) + list(forecast['Lower'])[::-1],
+        fill='toself', fillcolor=color, opacity=0.2, line={'width': 0},
+        hoverinfo='skip', name=f"{INTERVAL:.0%} interval",
+    ))
+    fig.add_trace(go.Scatter(
+        x=dates, y=forecast['Forecast'], mode='lines', line={'color': color, 'dash': 'dash', 'width': 2},
+        name="Forecast",
+    ))
+    return fig
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the forward forecast table")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the data has not changed")
+    args = parser.parse_args(argv)
+
+    from utils import open_dataset
+    started = time.perf_counter()
+    rebuilt = FORECASTS.refresh(open_dataset(), force=args.force)
+    table = FORECASTS.table()
+    state = 'built' if rebuilt else 'up to date'
+    print(f"{len(table)} pairs x {HORIZON} days from {table.through.date()}: {state} "
+          f"({time.perf_counter() - started:.1f} s) -> {FORECASTS.path}")
+    for horizon, (low, high) in table.meta['errors'].items():
+        print(f"  horizon {horizon:>2}: {INTERVAL:.0%} of errors within [{low:+.1f}, {high:+.1f}] units")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# web_app/forecasting.py
+# Features and models for forecasting daily `Units Sold` per store/product
+# series. Features are built once per frame and forecast horizon: every
+# series is laid out on a (series x day) grid, so lags and rolling means are
+# array lookups instead of per-series groupby shifts. Lags never reach past
+# the forecast origin (they start at the horizon), so one feature matrix
+# serves every origin of a rolling backtest.
+# No streamlit import, like analytics.
+import collections
+import threading
+
+import numpy as np
+import pandas as pd
+
+from datastore import frame_version
+from inventory_policy import pair_codes
+from perf import timed
+from startup import lazy_import
+
+sklearn_ensemble = lazy_import('sklearn.ensemble')
+xgboost = lazy_import('xgboost')
+
+DEFAULT_HORIZON = 7
+SEASON_DAYS = 7
+ROLLING_WINDOWS = (7, 28)
+# Inputs known ahead of time: planned prices and promotions
+EXOGENOUS = ['Price', 'Discount', 'Holiday/Promotion', 'Competitor Pricing']
+# Label columns encoded as integer codes (weather as forecast for the day)
+CATEGORICAL = {'Category': 'category_code', 'Region': 'region_code', 'Weather Condition': 'weather_code'}
+
+FEATURE_CACHE_ENTRIES = 4
+
+
+def feature_lags(horizon):
+    """Lags usable `horizon` days ahead: the horizon itself plus the weekly lags beyond it"""
+    return sorted({horizon, *(lag for lag in (7, 14, 28) if lag >= horizon)})
+
+
+def history_days(horizon):
+    """Days of history before a row that its lags and rolling means read"""
+    return max(max(feature_lags(horizon)), horizon + max(ROLLING_WINDOWS))
+
+
+def feature_names(horizon):
+    """Column names of build_features' matrix, in order"""
+    return [
+        *(f'lag_{lag}' for lag in feature_lags(horizon)),
+        *(f'rolling_mean_{window}' for window in ROLLING_WINDOWS),
+        'day_of_week', 'month', *EXOGENOUS, 'price_ratio', *CATEGORICAL.values(),
+    ]
+
+
+class FeatureSet:
+    """Feature matrix and series layout of a Date-sorted frame"""
+
+    def __init__(self, X, names, y, day, series, grid, provided, complete, horizon, first_date,
+                 keys, levels):
+        self.X = X
+        self.names = names
+        self.y = y
+        self.day = day
+        self.series = series
+        self.grid = grid
+        self.provided = provided
+        self.complete = complete
+        self.horizon = horizon
+        self.first_date = first_date
+        # (Store ID, Product ID) per series code, and the names behind each categorical code
+        self.keys = keys
+        self.levels = levels
+
+    def __len__(self):
+        return len(self.y)
+
+    @property
+    def n_days(self):
+        return self.grid.shape[1]
+
+    def series_index(self, store, product):
+        """Series code of a store/product pair, or None when it has no rows"""
+        try:
+            return self.keys.index((store, product))
+        except ValueError:
+            return None
+
+    def day_bounds(self, first_day, last_day):
+        """Row slice covering days first_day..last_day-1 (rows are Date-sorted)"""
+        return slice(*np.searchsorted(self.day, [first_day, last_day], side='left'))
+
+
+def _history_columns(grid, series, day, horizon):
+    """Lag and rolling-mean columns for the rows (series, day) of a (series x day) demand grid.
+
+    `day` may run up to `horizon` days past the end of the grid.
+    """
+    lags = feature_lags(horizon)
+    pad = history_days(horizon)
+    padded = np.concatenate([np.full((len(grid), pad), np.nan, dtype=np.float32), grid], axis=1)
+    position = day + pad
+
+    columns, names = [], []
+    for lag in lags:
+        columns.append(padded[series, position - lag])
+        names.append(f'lag_{lag}')
+
+    # Rolling means over the window ending `horizon` days before each row
+    observed = ~np.isnan(padded)
+    totals = np.concatenate([np.zeros((len(grid), 1)), np.cumsum(np.where(observed, padded, 0), axis=1)], axis=1)
+    counts = np.concatenate([np.zeros((len(grid), 1)), np.cumsum(observed, axis=1)], axis=1)
+    end = position - horizon + 1
+    for window in ROLLING_WINDOWS:
+        total = totals[series, end] - totals[series, end - window]
+        count = counts[series, end] - counts[series, end - window]
+        columns.append(np.divide(total, count, out=np.full(len(day), np.nan), where=count >= window / 2))
+        names.append(f'rolling_mean_{window}')
+    return columns, names
+
+
+def _calendar_columns(dates):
+    weekday = (dates.astype('datetime64[D]').astype(np.int64) + 3) % 7
+    month = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    return [weekday, month], ['day_of_week', 'month']
+
+
+@timed()
+def build_features(df, horizon=DEFAULT_HORIZON, levels=None):
+    """FeatureSet for forecasting `horizon` days ahead of any origin.
+
+    Assumes one row per series per day, as in the retail export; missing
+    days simply leave gaps (NaN) in the lags. `levels` (column -> names)
+    fixes the categorical codes, so features of a slice of the data match
+    those of the whole; by default codes follow the names present in `df`.
+    """
+    dates = df['Date'].to_numpy()
+    first_date = dates[0]
+    day = ((dates - first_date) // np.timedelta64(1, 'D')).astype(np.int32)
+    series, stores, products = pair_codes(df)
+    series = series.astype(np.int32)
+    y = df['Units Sold'].to_numpy(dtype=np.float64)
+
+    n_days = int(day[-1]) + 1 if len(day) else 0
+    grid = np.full((len(stores), n_days), np.nan, dtype=np.float32)
+    grid[series, day] = y
+
+    columns, names = _history_columns(grid, series, day, horizon)
+    calendar, calendar_names = _calendar_columns(dates)
+    columns += calendar
+    names += calendar_names
+    for column in EXOGENOUS:
+        columns.append(df[column].to_numpy(dtype=np.float64))
+        names.append(column)
+    columns.append(np.divide(df['Price'].to_numpy(dtype=np.float64), df['Competitor Pricing'].to_numpy(dtype=np.float64)))
+    names.append('price_ratio')
+    levels = dict(levels or {})
+    for column, name in CATEGORICAL.items():
+        if column in levels:
+            codes = pd.Categorical(df[column], categories=levels[column]).codes
+        else:
+            # Codes follow the sorted names, not the order rows happen to appear in
+            codes, levels[column] = pd.factorize(df[column], sort=True)
+        columns.append(codes)
+        names.append(name)
+
+    X = np.empty((len(y), len(columns)), dtype=np.float32)
+    for i, values in enumerate(columns):
+        X[:, i] = values
+    provided = df['Demand Forecast'].to_numpy(dtype=np.float64) if 'Demand Forecast' in df else None
+    complete = ~np.isnan(X[:, names.index(f'lag_{max(feature_lags(horizon))}')])
+    return FeatureSet(X, names, y, day, series, grid, provided, complete, horizon, first_date,
+                      list(zip(stores, products)), {column: list(values) for column, values in levels.items()})
+
+
+def next_day_features(features, series):
+    """Feature row for the day after the data for one series, inputs taken from its latest row"""
+    day = np.array([features.n_days])
+    columns, _ = _history_columns(features.grid[[series]], np.zeros(1, dtype=np.intp), day, features.horizon)
+    date = np.array([features.first_date + np.timedelta64(features.n_days, 'D')])
+    calendar, _ = _calendar_columns(date)
+    row = features.X[np.flatnonzero(features.series == series)[-1]].copy()
+    history = len(columns)
+    row[:history] = np.concatenate(columns)
+    row[history:history + len(calendar)] = np.concatenate(calendar)
+    return row
+
+
+def future_features(features, ahead):
+    """Feature rows of every series `ahead` days past the end of the data (1 = the next day).
+
+    `ahead` may not exceed the horizon; inputs are taken from each series'
+    latest row, as in next_day_features.
+    """
+    if not 1 <= ahead <= features.horizon:
+        raise ValueError(f"Cannot build features {ahead} days ahead with horizon {features.horizon}")
+    n_series = len(features.keys)
+    day = np.full(n_series, features.n_days + ahead - 1)
+    columns, _ = _history_columns(features.grid, np.arange(n_series), day, features.horizon)
+    date = np.full(n_series, features.first_date + np.timedelta64(int(day[0]), 'D'))
+    calendar, _ = _calendar_columns(date)
+    latest = np.zeros(n_series, dtype=np.intp)
+    np.maximum.at(latest, features.series, np.arange(len(features.series)))
+    X = features.X[latest].copy()
+    for i, values in enumerate(columns + calendar):
+        X[:, i] = values
+    return X
+
+
+_feature_lock = threading.Lock()
+_feature_cache = collections.OrderedDict()
+
+
+def feature_set(df, horizon=DEFAULT_HORIZON):
+    """build_features, reused while the frame's data is unchanged.
+
+    Frames read from a PartitionedDataset carry their data version (see
+    datastore.frame_version); other frames are rebuilt on every call.
+    """
+    version = frame_version(df)
+    if version is None:
+        return build_features(df, horizon)
+    key = (version, str(df['Date'].iloc[0]), str(df['Date'].iloc[-1]), len(df), horizon)
+    with _feature_lock:
+        features = _feature_cache.get(key)
+        if features is not None:
+            _feature_cache.move_to_end(key)
+            return features
+    features = build_features(df, horizon)
+    with _feature_lock:
+        _feature_cache[key] = features
+        while len(_feature_cache) > FEATURE_CACHE_ENTRIES:
+            _feature_cache.popitem(last=False)
+    return features
+
+
+# ---------------------------------------------------------------------- #
+# Models
+# ---------------------------------------------------------------------- #
+def random_forest(seed=0):
+    # Half-size bootstrap samples: a third of the fit time at the same accuracy
+    return sklearn_ensemble.RandomForestRegressor(
+        n_estimators=60, max_depth=12, min_samples_leaf=10, max_features=0.5, max_samples=0.5,
+        n_jobs=1, random_state=seed,
+    )
+
+
+def gradient_boosting(seed=0):
+    return xgboost.XGBRegressor(
+        n_estimators=300, max_depth=6, learning_rate=0.08, subsample=0.8, colsample_bytree=0.8,
+        tree_method='hist', n_jobs=1, random_state=seed,
+    )
+
+
+# Regressors trained on the feature matrix, by model name
+ESTIMATORS = {
+    'random_forest': random_forest,
+    'xgboost': gradient_boosting,
+}
+
+DEFAULT_TRAIN_DAYS = 365
+DEFAULT_MAX_TRAIN_ROWS = 200_000
+
+
+def training_rows(features, origin, train_days=DEFAULT_TRAIN_DAYS, max_train_rows=DEFAULT_MAX_TRAIN_ROWS, seed=0):
+    """Complete-feature rows from the `train_days` before day `origin`, sampled to `max_train_rows`"""
+    train = features.day_bounds(max(0, origin - train_days) if train_days else 0, origin)
+    rows = np.arange(train.start, train.stop)[features.complete[train]]
+    if len(rows) > max_train_rows:
+        rows = np.sort(np.random.default_rng(seed).choice(rows, max_train_rows, replace=False))
+    return rows
+
+
+def fit_estimator(model, features, rows, seed=0):
+    """Train the named estimator on the given feature rows"""
+    estimator = ESTIMATORS[model](seed)
+    estimator.fit(features.X[rows], features.y[rows])
+    return estimator
@@ -0,0 +1,123 @@
+# web_app/inventory_policy.py
+# Reorder policy for every (Store ID, Product ID) pair. Daily demand is the
+# `Units Sold` history of the pair; from its mean and standard deviation the
+# engine derives lead-time demand, safety stock (z * sigma * sqrt(lead time))
+# and the reorder point, then compares them with the latest inventory level.
+# Per-pair statistics come from one pass of np.bincount over integer pair
+# codes, so hundreds of thousands of pairs take well under a second.
+# No streamlit import, like analytics.
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from perf import timed
+
+DEFAULT_SERVICE_LEVEL = 0.95
+# The dataset records replenishment orders daily
+DEFAULT_LEAD_TIME_DAYS = 1
+DEFAULT_REVIEW_DAYS = 1
+
+# Target probability of not stocking out during a replenishment lead time
+SERVICE_LEVELS = {
+    'Electronics': 0.95,
+    'Clothing': 0.90,
+    'Groceries': 0.98,
+    'Toys': 0.90,
+    'Furniture': 0.85,
+}
+
+
+def service_z(service_level):
+    """Standard normal quantile for a cycle service level"""
+    return NormalDist().inv_cdf(min(max(service_level, 0.5), 0.9999))
+
+
+def pair_codes(df):
+    """Integer code per row for its (Store ID, Product ID) pair, plus the pair keys"""
+    store_codes, stores = pd.factorize(df['Store ID'])
+    product_codes, products = pd.factorize(df['Product ID'])
+    combined = store_codes.astype(np.int64) * len(products) + product_codes
+    codes, pairs = pd.factorize(combined)
+    return codes, stores[pairs // len(products)], products[pairs % len(products)]
+
+
+@timed()
+def reorder_policy(df, service_levels=None, lead_time_days=DEFAULT_LEAD_TIME_DAYS,
+                   review_days=DEFAULT_REVIEW_DAYS):
+    """Demand statistics, safety stock, reorder point and order quantity per store/product.
+
+    `service_levels` maps Category to a cycle service level (others use
+    SERVICE_LEVELS, then DEFAULT_SERVICE_LEVEL). Pairs whose latest
+    inventory is at or below the reorder point get `Reorder` set and an
+    order quantity that restores stock to the order-up-to level for
+    `lead_time_days + review_days`. Rows needing a reorder come first,
+    largest shortfall first.
+    """
+    columns = ['Store ID', 'Product ID', 'Category', 'Region', 'Observed Days', 'Avg Daily Demand',
+               'Demand Std', 'Service Level', 'Lead Time Demand', 'Safety Stock', 'Reorder Point',
+               'Current Inventory', 'Days of Cover', 'Reorder', 'Order Quantity']
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+
+    codes, stores, products = pair_codes(df)
+    n_pairs = len(stores)
+    demand = df['Units Sold'].to_numpy(dtype=np.float64)
+
+    # Mean and sample variance of daily demand per pair
+    count = np.bincount(codes, minlength=n_pairs).astype(np.float64)
+    total = np.bincount(codes, weights=demand, minlength=n_pairs)
+    mean = total / count
+    squares = np.bincount(codes, weights=(demand - mean[codes]) ** 2, minlength=n_pairs)
+    std = np.sqrt(np.divide(squares, count - 1, out=np.zeros(n_pairs), where=count > 1))
+
+    # Latest row of each pair (rows are Date-sorted) gives its current stock and labels
+    last_row = np.zeros(n_pairs, dtype=np.int64)
+    np.maximum.at(last_row, codes, np.arange(len(df)))
+    inventory = df['Inventory Level'].to_numpy(dtype=np.float64)[last_row]
+    categories = df['Category'].to_numpy()[last_row]
+    regions = df['Region'].to_numpy()[last_row]
+
+    # One z per category instead of one inverse CDF per pair
+    levels = {**SERVICE_LEVELS, **(service_levels or {})}
+    category_codes, category_names = pd.factorize(categories)
+    category_levels = np.array([levels.get(name, DEFAULT_SERVICE_LEVEL) for name in category_names])
+    category_z = np.array([service_z(level) for level in category_levels])
+    service_level = category_levels[category_codes]
+    z = category_z[category_codes]
+
+    lead_time_demand = mean * lead_time_days
+    safety_stock = z * std * np.sqrt(lead_time_days)
+    reorder_point = lead_time_demand + safety_stock
+    protection_days = lead_time_days + review_days
+    order_up_to = mean * protection_days + z * std * np.sqrt(protection_days)
+    reorder = inventory <= reorder_point
+    order_quantity = np.where(reorder, np.ceil(np.maximum(order_up_to - inventory, 0)), 0)
+    days_of_cover = np.divide(inventory, mean, out=np.full(n_pairs, np.inf), where=mean > 0)
+
+    policy = pd.DataFrame({
+        'Store ID': stores,
+        'Product ID': products,
+        'Category': categories,
+        'Region': regions,
+        'Observed Days': count.astype(np.int64),
+        'Avg Daily Demand': mean,
+        'Demand Std': std,
+        'Service Level': service_level,
+        'Lead Time Demand': lead_time_demand,
+        'Safety Stock': safety_stock,
+        'Reorder Point': reorder_point,
+        'Current Inventory': inventory,
+        'Days of Cover': days_of_cover,
+        'Reorder': reorder,
+        'Order Quantity': order_quantity.astype(np.int64),
+    }, columns=columns)
+    shortfall = policy['Reorder Point'] - policy['Current Inventory']
+    order = np.lexsort((-shortfall.to_numpy(), ~policy['Reorder'].to_numpy()))
+    return policy.iloc[order].reset_index(drop=True)
+
+
+def reorder_recommendations(policy, top=None):
+    """Pairs at or below their reorder point, most urgent first"""
+    recommendations = policy[policy['Reorder']]
+    return recommendations if top is None else recommendations.head(top)
@@ -0,0 +1,262 @@
+# web_app/leaderboard.py
+# Top-K leaderboards over the whole dataset, maintained incrementally. Each
+# board keeps running totals (row count and column sums) per key, such as
+# Units Sold per Category, and a heap of its keys by score. The best `k` keys
+# are re-ranked only when totals change, so asking for them costs nothing.
+#
+# Totals are kept per month partition as well. When partitions change (an
+# appended day rewrites only the newest month), the old totals of those
+# months are subtracted and the new ones added; the other months are never
+# read again. Boards that only count rows past a threshold (high demand, low
+# stock) are rebuilt when the threshold itself moves.
+#
+# The boards serve the Key Business Insights and the top-10 alert tables
+# when a view covers the whole dataset; other date ranges use analytics.
+# No streamlit import, like analytics.
+import heapq
+import threading
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from datastore import frame_version
+from perf import span
+
+COLUMNS = ['Date', 'Store ID', 'Product ID', 'Category', 'Region', 'Inventory Level', 'Units Sold',
+           'Units Ordered', 'Price', 'Discount', 'Seasonality']
+
+
+class Leaderboard:
+    """Running totals per key and the `k` best keys by the sum or mean of one column.
+
+    `where` = (column, '>' or '<') only counts rows past a threshold set
+    with reset(); `extra` columns are summed too and reported as means.
+    """
+
+    def __init__(self, by, value, stat='sum', ascending=False, k=10, extra=(), where=None):
+        self.by = list(by)
+        self.value = value
+        self.stat = stat
+        self.ascending = ascending
+        self.k = k
+        self.extra = list(extra)
+        self.where = where
+        self.reset()
+
+    def reset(self, threshold=None):
+        self.threshold = threshold
+        # key -> [rows, value sum, extra sums...]
+        self.totals = {}
+        self.rows = 0
+        self.integer = False
+        self._heap = []
+        self._top = []
+
+    def partial(self, part):
+        """Totals of one batch of rows per key, in the form apply() takes"""
+        if self.where is not None:
+            column, op = self.where
+            part = part[part[column] > self.threshold] if op == '>' else part[part[column] < self.threshold]
+        columns = [self.value, *self.extra]
+        grouped = part.groupby(self.by, observed=True, sort=False)[columns]
+        partial = grouped.sum()
+        partial.insert(0, 'rows', grouped.size())
+        if len(partial.index.names) == 1:
+            partial.index = pd.MultiIndex.from_arrays([partial.index])
+        return partial
+
+    def apply(self, partial, sign=1):
+        """Add (sign=1) or subtract (sign=-1) a partial's totals and re-rank the top keys"""
+        if len(partial) == 0:
+            return
+        self.integer |= pd.api.types.is_integer_dtype(partial[self.value])
+        values = partial.to_numpy(dtype=np.float64) * sign
+        for key, row in zip(partial.index, values):
+            total = self.totals.get(key)
+            total = row if total is None else total + row
+            self.rows += int(row[0])
+            if total[0] <= 0:
+                self.totals.pop(key, None)
+                continue
+            self.totals[key] = total
+            heapq.heappush(self._heap, (self._rank(total), key))
+        if len(self._heap) > 2 * len(self.totals) + 64:
+            self._heap = [(self._rank(total), key) for key, total in self.totals.items()]
+            heapq.heapify(self._heap)
+        self._top = self._best()
+
+    def _score(self, total):
+        return total[1] if self.stat == 'sum' else total[1] / total[0]
+
+    def _rank(self, total):
+        """Heap order: the smallest entry is the best key"""
+        score = self._score(total)
+        return score if self.ascending else -score
+
+    def _best(self):
+        """The k best keys, skipping heap entries left behind by earlier totals"""
+        best, seen = [], set()
+        while self._heap and len(best) < self.k:
+            rank, key = heapq.heappop(self._heap)
+            total = self.totals.get(key)
+            if key in seen or total is None or self._rank(total) != rank:
+                continue
+            seen.add(key)
+            best.append((rank, key))
+        for entry in best:
+            heapq.heappush(self._heap, entry)
+        return [key for _, key in best]
+
+    def top(self, k=None):
+        """Best keys with their score and extra means, best first"""
+        keys = self._top[:k]
+        totals = np.array([self.totals[key] for key in keys]).reshape(len(keys), 2 + len(self.extra))
+        frame = pd.DataFrame(list(keys), columns=self.by)
+        score = totals[:, 1] if self.stat == 'sum' else totals[:, 1] / np.maximum(totals[:, 0], 1)
+        frame[self.value] = np.rint(score).astype(np.int64) if self.stat == 'sum' and self.integer else score
+        for i, column in enumerate(self.extra):
+            frame[column] = totals[:, 2 + i] / np.maximum(totals[:, 0], 1)
+        return frame
+
+
+def _boards():
+    return {
+        'category_sales': Leaderboard(['Category'], 'Units Sold', k=3),
+        'region_sales': Leaderboard(['Region'], 'Units Sold'),
+        'season_sales': Leaderboard(['Seasonality'], 'Units Sold', stat='mean'),
+        # Pricing insights: one key for all rows
+        'overall': Leaderboard(['All'], 'Price', extra=['Discount', 'Discounted'], k=1),
+        'high_demand': Leaderboard(
+            ['Product ID', 'Category', 'Region'], 'Units Ordered', stat='mean',
+            extra=['Inventory Level', 'Price', 'Discount'], where=('Units Ordered', '>'),
+        ),
+        'low_stock': Leaderboard(
+            ['Product ID', 'Category', 'Store ID'], 'Inventory Level', stat='mean', ascending=True,
+            extra=['Units Sold', 'Price'], where=('Inventory Level', '<'),
+        ),
+    }
+
+
+def _prepare(part):
+    return part.assign(All='all', Discounted=(part['Discount'] > 0).astype(np.int64))
+
+
+class Leaderboards:
+    """Process-wide boards over the partitioned dataset, updated from changed partitions only"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.boards = _boards()
+        # month -> partition checksum, and board -> month -> partial totals
+        self.months = {}
+        self.partials = {name: {} for name in self.boards}
+        self.version = None
+        self.row_count = 0
+
+    def update(self, dataset):
+        """Fold in the partitions that changed since the last update; returns the months read"""
+        with self._lock:
+            checksums = dataset.checksums()
+            changed = sorted(month for month in set(checksums) | set(self.months)
+                             if checksums.get(month) != self.months.get(month))
+            if not changed:
+                return []
+            with span('leaderboard.update') as update_span:
+                partitions = {partition['month']: partition for partition in dataset.partitions}
+                rows = 0
+                for month in changed:
+                    part = None
+                    if month in checksums:
+                        part = _prepare(dataset.read_partition(partitions[month], columns=COLUMNS))
+                        rows += len(part)
+                    for name, board in self.boards.items():
+                        if board.where is not None and board.threshold is None:
+                            continue
+                        self._replace(name, month, part)
+                    if part is None:
+                        self.months.pop(month, None)
+                    else:
+                        self.months[month] = checksums[month]
+                update_span['rows'] = rows
+            self.version = dataset.version()
+            self.row_count = dataset.row_count
+            return changed
+
+    def _replace(self, name, month, part):
+        board = self.boards[name]
+        old = self.partials[name].pop(month, None)
+        if old is not None:
+            board.apply(old, -1)
+        if part is not None:
+            new = board.partial(part)
+            board.apply(new)
+            self.partials[name][month] = new
+
+    def for_frame(self, df):
+        """These boards when `df` is the whole dataset they were last updated with, else None"""
+        if self.version is None or len(df) != self.row_count or frame_version(df) != self.version:
+            return None
+        return self
+
+    def _threshold_board(self, name, threshold, df):
+        """A threshold board's row count and top keys, rebuilt from `df` (the whole dataset) when the threshold moved.
+
+        None when `df` no longer matches the boards' data version.
+        """
+        with self._lock:
+            if frame_version(df) != self.version:
+                return None
+            board = self.boards[name]
+            if board.threshold != threshold:
+                with span(f'leaderboard.{name}', rows=len(df)):
+                    board.reset(threshold)
+                    self.partials[name] = {}
+                    months = df['Date'].to_numpy().astype('datetime64[M]')
+                    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+                    for start, end in zip(starts, np.append(starts[1:], len(df))):
+                        self._replace(name, str(months[start]), _prepare(df.iloc[start:end]))
+            return board.rows, board.top()
+
+    # ------------------------------------------------------------------ #
+    # Results in the shape of the analytics functions they replace
+    # ------------------------------------------------------------------ #
+    def insights(self):
+        """analytics.business_insights for the whole dataset"""
+        with self._lock:
+            categories = self.boards['category_sales'].top()
+            regions = self.boards['region_sales'].top()
+            seasons = self.boards['season_sales'].top()
+            overall = self.boards['overall']
+            overall = overall.totals.get(('all',), np.zeros(4))
+        seasonal_avg = seasons.set_index('Seasonality')['Units Sold']
+        rows = max(overall[0], 1)
+        return {
+            'top_categories': categories.set_index('Category')['Units Sold'],
+            'top_regions': regions.set_index('Region')['Units Sold'],
+            'seasonal_avg': seasonal_avg,
+            'best_season': seasonal_avg.index[0],
+            'worst_season': seasonal_avg.index[-1],
+            'avg_price': overall[1] / rows,
+            'avg_discount': overall[2] / rows,
+            'discounted_share': overall[3] / rows * 100,
+        }
+
+    def high_demand(self, df, threshold):
+        """analytics.high_demand_alerts for the whole dataset"""
+        result = self._threshold_board('high_demand', threshold, df)
+        if result is None:
+            return analytics.high_demand_alerts(df, threshold)
+        count, top = result
+        return count, top[['Product ID', 'Category', 'Region', 'Units Ordered', 'Inventory Level', 'Price', 'Discount']]
+
+    def low_stock(self, df, threshold):
+        """analytics.low_stock_alerts for the whole dataset"""
+        result = self._threshold_board('low_stock', threshold, df)
+        if result is None:
+            return analytics.low_stock_alerts(df, threshold)
+        count, top = result
+        return count, top[['Product ID', 'Category', 'Store ID', 'Inventory Level', 'Units Sold', 'Price']]
+
+
+LEADERBOARDS = Leaderboards()
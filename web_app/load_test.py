@@ -0,0 +1,371 @@
+# web_app/load_test.py
+# Load test for the Streamlit app: starts `streamlit run app.py` headless on
+# a local port (or uses a running server via --url), then opens N browser-like
+# websocket sessions. Each session clicks through Dashboard, Alerts, Products
+# and Admin, changing widgets the way a store manager would. Clicks are sent
+# as the same BackMsg reruns the frontend sends, carrying the values of every
+# widget on the page. A click's latency is the time until the server reports
+# the script run finished. Reported for every session count: rerun latency
+# percentiles per page, reruns per second, errors, and the server's RSS.
+#
+#   python load_test.py --sessions 1 4 16 --duration 60
+#   python load_test.py --url http://127.0.0.1:8501 --pid 12345 --sessions 8
+import argparse
+import asyncio
+import collections
+import os
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+from tornado.httpclient import AsyncHTTPClient, HTTPClientError
+from tornado.websocket import WebSocketClosedError, websocket_connect
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+NAVIGATION = "Navigate to:"
+PAGES = {
+    'Dashboard': ' Dashboard',
+    'Alerts': ' Alerts',
+    'Products': ' Products List',
+    'Admin': ' Admin',
+}
+FINISHED = (ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_WITH_COMPILE_ERROR)
+
+
+def _other(*choices):
+    """A widget value that switches between `choices` on every visit"""
+    def choose(options, current):
+        return choices[(choices.index(current) + 1) % len(choices)] if current in choices else choices[0]
+    return choose
+
+
+def _first_option(options, current):
+    return [] if current else options[:1]
+
+
+def _flip(options, current):
+    return not current
+
+
+# One visit of a store manager: (page, widget label, new value). A step without
+# a widget opens the page from the sidebar; callables get the widget's options
+# and current value, so repeated visits keep changing something.
+SCENARIO = [
+    ('Dashboard', None, None),
+    ('Dashboard', "Section", _other(' Store & Region', ' Time Trends', ' Sales Overview')),
+    ('Dashboard', "Date Range", _other('Last 90 days', 'All history')),
+    ('Alerts', None, None),
+    ('Alerts', "Estimate price sensitivity per region", _flip),
+    ('Products', None, None),
+    ('Products', "Categories", _first_option),
+    ('Products', "Sort by", _other('Avg Price', 'Total Units Sold')),
+    ('Admin', None, None),
+]
+# Sessions start at different pages, always by opening one
+PAGE_STEPS = [i for i, (_, label, _) in enumerate(SCENARIO) if label is None]
+
+
+# Widgets whose value the frontend sends back on every rerun, by the field it uses
+WIDGET_FIELDS = {
+    'radio': 'int_value',
+    'selectbox': 'int_value',
+    'checkbox': 'bool_value',
+    'multiselect': 'int_array_value',
+    'slider': 'double_array_value',
+    'date_input': 'string_array_value',
+    'text_input': 'string_value',
+    'text_area': 'string_value',
+}
+
+
+def _widget_value(kind, widget):
+    """The value the frontend reports for a freshly drawn widget, as (field, value)"""
+    value = widget.value if widget.set_value else widget.default
+    if kind == 'number_input':
+        if widget.data_type == widget.INT:
+            return 'int_value', int(value)
+        return 'double_value', value
+    field = WIDGET_FIELDS[kind]
+    return field, (list(value) if field.endswith('_array_value') else value)
+
+
+def _encode(kind, widget, value):
+    """(field, protobuf value) for setting `widget` to the Python `value`"""
+    if kind in ('radio', 'selectbox'):
+        return 'int_value', list(widget.options).index(value)
+    if kind == 'multiselect':
+        return 'int_array_value', [list(widget.options).index(option) for option in value]
+    return _widget_value(kind, widget)[0], value
+
+
+def _decode(kind, widget, value):
+    """Python value of a stored widget state, the inverse of _encode"""
+    if kind in ('radio', 'selectbox'):
+        return widget.options[value]
+    if kind == 'multiselect':
+        return [widget.options[index] for index in value]
+    return value
+
+
+class Session:
+    """One browser tab: a websocket plus the widget values its page holds"""
+
+    def __init__(self, ws_url, timeout):
+        self.ws_url = ws_url
+        self.timeout = timeout
+        self.ws = None
+        self.page_hash = ''
+        self.widgets = {}    # label -> (kind, proto) drawn in the last run
+        self.values = {}     # widget id -> (field, value)
+        self.exceptions = []
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.ws_url, subprotocols=['streamlit'])
+        return await self.rerun()
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+            self.ws = None
+
+    async def rerun(self, changes=None, trigger=None):
+        """Rerun the script with the current widget values plus `changes`; seconds taken"""
+        self.values.update(changes or {})
+        states = []
+        for widget_id, (field, value) in self.values.items():
+            state = WidgetState(id=widget_id)
+            if field.endswith('_array_value'):
+                getattr(state, field).data.extend(value)
+            else:
+                setattr(state, field, value)
+            states.append(state)
+        if trigger is not None:
+            states.append(WidgetState(id=trigger, trigger_value=True))
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.page_script_hash = self.page_hash
+        message.rerun_script.widget_states.widgets.extend(states)
+
+        started = time.perf_counter()
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+        await asyncio.wait_for(self._read_run(), self.timeout)
+        return time.perf_counter() - started
+
+    async def _read_run(self):
+        """Consume forward messages until the script run finishes"""
+        widgets, values, self.exceptions = {}, {}, []
+        while True:
+            payload = await self.ws.read_message()
+            if payload is None:
+                raise WebSocketClosedError("server closed the session")
+            message = ForwardMsg()
+            message.ParseFromString(payload)
+            kind = message.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_hash = message.new_session.page_script_hash
+                widgets, values, self.exceptions = {}, {}, []
+            elif kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element = message.delta.new_element
+                element_kind = element.WhichOneof('type')
+                if element_kind == 'exception':
+                    self.exceptions.append(element.exception.message)
+                    continue
+                if element_kind not in WIDGET_FIELDS and element_kind != 'number_input':
+                    continue
+                widget = getattr(element, element_kind)
+                initial = _widget_value(element_kind, widget)
+                widgets.setdefault(widget.label, (element_kind, widget))
+                # Widgets keep their value across reruns while they stay on the page
+                values[widget.id] = self.values.get(widget.id, initial)
+            elif kind == 'script_finished' and message.script_finished in FINISHED:
+                self.widgets, self.values = widgets, values
+                return
+
+    def value(self, label):
+        kind, widget = self.widgets[label]
+        _, value = self.values[widget.id]
+        return _decode(kind, widget, value)
+
+    async def set(self, label, value):
+        """Change the widget labelled `label`, like a click in the browser"""
+        kind, widget = self.widgets[label]
+        if callable(value):
+            value = value(list(getattr(widget, 'options', [])), self.value(label))
+        return await self.rerun({widget.id: _encode(kind, widget, value)})
+
+    async def press(self, label):
+        return await self.rerun(trigger=self.widgets[label][1].id)
+
+    def page(self):
+        """Page the sidebar radio shows as selected"""
+        return self.value(NAVIGATION)
+
+    async def open(self, page):
+        return await self.set(NAVIGATION, PAGES[page])
+
+
+async def run_session(session, deadline, think, latencies, errors, offset):
+    """Repeat the scenario from step `offset` until the deadline"""
+    i = offset
+    while time.perf_counter() < deadline:
+        page, label, value = SCENARIO[i % len(SCENARIO)]
+        i += 1
+        try:
+            if label is None:
+                seconds = await session.open(page)
+                if session.page() != PAGES[page]:
+                    errors['wrong page'] += 1
+            elif label in session.widgets and session.page() == PAGES[page]:
+                seconds = await session.set(label, value)
+            else:
+                errors[f'missing {label!r}'] += 1
+                continue
+            latencies[page].append(seconds)
+            if session.exceptions:
+                errors['script exception'] += 1
+        except asyncio.TimeoutError:
+            errors['timeout'] += 1
+        except (WebSocketClosedError, OSError) as e:
+            errors[type(e).__name__] += 1
+            return
+        await asyncio.sleep(random.uniform(0, 2 * think))
+
+
+def rss_bytes(pid):
+    """Resident set size of process `pid` (Linux), or None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+async def sample_rss(pid, samples, stop, interval=0.25):
+    while not stop.is_set():
+        rss = rss_bytes(pid)
+        if rss is not None:
+            samples.append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run(base_url, sessions, duration, think, timeout, pid):
+    ws_url = base_url.replace('http', 'ws', 1) + '/_stcore/stream'
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    samples = []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(sample_rss(pid, samples, stop)) if pid else None
+
+    clients = [Session(ws_url, timeout) for _ in range(sessions)]
+    connected = await asyncio.gather(*(client.connect() for client in clients), return_exceptions=True)
+    for client, result in zip(clients, connected):
+        if isinstance(result, BaseException):
+            errors[f'connect {type(result).__name__}'] += 1
+            client.close()
+        else:
+            latencies['(first load)'].append(result)
+    active = [client for client in clients if client.ws is not None]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(client, started + duration, think, latencies, errors, PAGE_STEPS[n % len(PAGE_STEPS)])
+        for n, client in enumerate(active)
+    ))
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.close()
+    if sampler is not None:
+        stop.set()
+        await sampler
+    return latencies, errors, elapsed, samples
+
+
+def report(latencies, errors, elapsed, sessions, samples):
+    clicks = np.array([value for page, values in latencies.items() if page in PAGES for value in values])
+    total = len(clicks)
+    rss = f"server RSS peak {max(samples) / 2**20:,.0f} MB, end {samples[-1] / 2**20:,.0f} MB" if samples else "server RSS n/a"
+    print(f"{sessions} sessions, {elapsed:.1f}s, {total:,} reruns, {total / elapsed:,.2f} reruns/s, "
+          f"{sum(errors.values())} errors {dict(errors) or ''}, {rss}")
+    print(f"{'page':<16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = [(page, latencies[page]) for page in ['(first load)', *PAGES] if latencies.get(page)]
+    if total:
+        rows.append(('ALL', list(clicks)))
+    for page, values in rows:
+        values = np.array(values) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        print(f"{page:<16} {len(values):>7,} {p50:>9.0f} {p95:>9.0f} {p99:>9.0f} {values.max():>9.0f}")
+
+
+async def wait_healthy(base_url, timeout):
+    client = AsyncHTTPClient()
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            await client.fetch(f'{base_url}/_stcore/health', request_timeout=5)
+            return True
+        except (HTTPClientError, OSError):
+            await asyncio.sleep(0.5)
+    return False
+
+
+def start_server(port):
+    """`streamlit run app.py` on localhost in a child process"""
+    return subprocess.Popen(
+        [sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+         '--server.headless', 'true', '--server.port', str(port), '--server.address', '127.0.0.1',
+         '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none'],
+        cwd=os.path.dirname(APP_PATH), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the Streamlit app with concurrent sessions")
+    parser.add_argument('--url', help="Base URL of a running app; by default one is started on --port")
+    parser.add_argument('--port', type=int, default=8599, help="Port for the app started by this script")
+    parser.add_argument('--pid', type=int, help="Server process to measure RSS of when using --url")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 4, 16],
+                        help="Concurrent sessions; several values run one after another")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of clicking per session count")
+    parser.add_argument('--think', type=float, default=1.0, help="Mean pause between clicks, in seconds")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Seconds before a rerun counts as timed out")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.url:
+        base_url, pid = args.url.rstrip('/'), args.pid
+    else:
+        server = start_server(args.port)
+        base_url, pid = f'http://127.0.0.1:{args.port}', server.pid
+    try:
+        if not asyncio.run(wait_healthy(base_url, 60)):
+            print(f"No app answering at {base_url}", file=sys.stderr)
+            return 1
+        if pid:
+            print(f"server RSS at start {rss_bytes(pid) / 2**20:,.0f} MB\n")
+        for sessions in args.sessions:
+            latencies, errors, elapsed, samples = asyncio.run(
+                run(base_url, sessions, args.duration, args.think, args.timeout, pid)
+            )
+            report(latencies, errors, elapsed, sessions, samples)
+            print()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,443 @@
+# web_app/notifications.py
+# Email and SMS alert notifications, sent off the render path. Pages hand
+# alerts to NOTIFIER.notify(), which only appends them to an in-memory inbox.
+# A daemon dispatcher thread moves them into a SQLite queue
+# (data/notifications/queue.sqlite3), one row per alert and recipient.
+# Duplicates are ignored, so an alert seen on every rerun is queued once.
+# The thread then sends each recipient one digest of everything pending:
+# - once the oldest alert has waited DIGEST_SECONDS,
+# - at most RATE_LIMIT digests per recipient per RATE_WINDOW seconds
+#   (alerts keep collecting meanwhile),
+# - a failed send is retried with exponential backoff, up to MAX_ATTEMPTS.
+#
+# Transports are looked up by name in TRANSPORTS: 'smtp' (RETAIL_SMTP_*
+# settings), 'file' (appends to data/notifications/outbox.jsonl) and 'stub'
+# (keeps messages in memory). RETAIL_NOTIFY_EMAIL_TRANSPORT and
+# RETAIL_NOTIFY_SMS_TRANSPORT choose them; email uses smtp when
+# RETAIL_SMTP_HOST is set, everything else defaults to file.
+# No streamlit import, like analytics.
+import collections
+import contextlib
+import json
+import os
+import queue
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from email.message import EmailMessage
+
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOTIFY_DIR = os.path.join(ROOT_DIR, 'data', 'notifications')
+QUEUE_PATH = os.path.join(NOTIFY_DIR, 'queue.sqlite3')
+OUTBOX_PATH = os.path.join(NOTIFY_DIR, 'outbox.jsonl')
+
+CHANNELS = ('email', 'sms')
+DIGEST_SECONDS = float(os.environ.get('RETAIL_NOTIFY_DIGEST_SECONDS', 60))
+RATE_LIMIT = int(os.environ.get('RETAIL_NOTIFY_RATE_LIMIT', 4))
+RATE_WINDOW = 3600.0
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30.0
+# Alerts listed in one digest; the rest are counted, and sent with the next one
+MAX_DIGEST_ALERTS = 50
+SMS_LENGTH = 160
+# Anomalies this many days before the newest day are still worth a message
+ANOMALY_DAYS = 7
+
+DEFAULT_SETTINGS = {
+    'email_enabled': False,
+    'sms_enabled': False,
+    'email_recipients': [],
+    'sms_recipients': [],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    alert_key TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT,
+    UNIQUE (channel, recipient, alert_key)
+);
+CREATE INDEX IF NOT EXISTS pending_status ON pending (status, channel, recipient);
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    alerts INTEGER NOT NULL,
+    transport TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS deliveries_recipient ON deliveries (channel, recipient, sent_at);
+"""
+
+# One alert: `key` identifies it across reruns, `kind` groups it in a digest
+Alert = collections.namedtuple('Alert', ['key', 'kind', 'summary'])
+
+
+# ---------------------------------------------------------------------- #
+# Alerts from the Alerts page tables
+# ---------------------------------------------------------------------- #
+def reorder_alerts(recommendations, as_of):
+    """One alert per store/product at or below its reorder point on `as_of`"""
+    day = pd.Timestamp(as_of).date()
+    return [
+        Alert(
+            f"reorder:{row['Store ID']}:{row['Product ID']}:{day}",
+            'Reorder',
+            f"{row['Store ID']} {row['Product ID']}: {row['Current Inventory']:.0f} in stock, "
+            f"reorder point {row['Reorder Point']:.0f}, order {row['Order Quantity']:.0f}",
+        )
+        for row in recommendations.to_dict('records')
+    ]
+
+
+def anomaly_alerts(anomalies, as_of, days=ANOMALY_DAYS):
+    """One alert per anomaly (from DETECTOR.anomalies) in the `days` up to `as_of`"""
+    recent = anomalies[anomalies['Date'] > pd.Timestamp(as_of) - pd.Timedelta(days=days)]
+    alerts = []
+    for row in recent.to_dict('records'):
+        series = f"{row['Store ID']} {row['Product ID']}" if 'Product ID' in row else f"{row['Store ID']} total"
+        alerts.append(Alert(
+            f"anomaly:{series}:{row['Date']:%Y-%m-%d}:{row['Check']}",
+            'Sales anomaly',
+            f"{series} on {row['Date']:%Y-%m-%d}: {row['Units Sold']:.0f} units sold, "
+            f"{row['Expected']:.0f} expected (z {row['Z-Score']:+.1f})",
+        ))
+    return alerts
+
+
+def digest(channel, alerts, remaining=0):
+    """(subject, body) of one message listing `alerts` grouped by kind"""
+    by_kind = collections.defaultdict(list)
+    for alert in alerts:
+        by_kind[alert.kind].append(alert.summary)
+    counts = ', '.join(f"{len(summaries)} {kind.lower()}{'s' if len(summaries) != 1 else ''}"
+                       for kind, summaries in by_kind.items())
+    subject = f"Retail alerts: {counts}"
+    if channel == 'sms':
+        first = alerts[0].summary if alerts else ''
+        return subject, f"{subject}. {first}"[:SMS_LENGTH]
+    lines = []
+    for kind, summaries in by_kind.items():
+        lines.append(f"{kind} ({len(summaries)})")
+        lines.extend(f"  - {summary}" for summary in summaries)
+        lines.append('')
+    if remaining:
+        lines.append(f"{remaining} more alert(s) follow in the next message.")
+    lines.append("Open the Alerts page of the Retail Management System for details.")
+    return subject, '\n'.join(lines)
+
+
+# ---------------------------------------------------------------------- #
+# Transports
+# ---------------------------------------------------------------------- #
+class FileTransport:
+    """Appends every message as a JSON line to a local file"""
+
+    def __init__(self, path=OUTBOX_PATH):
+        self.path = path
+
+    def send(self, channel, recipient, subject, body):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        record = {'at': time.time(), 'channel': channel, 'to': recipient, 'subject': subject, 'body': body}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+
+
+class StubTransport:
+    """Keeps sent messages in memory; fails the next `fail` sends"""
+
+    def __init__(self, fail=0):
+        self.sent = []
+        self.fail = fail
+
+    def send(self, channel, recipient, subject, body):
+        if self.fail > 0:
+            self.fail -= 1
+            raise ConnectionError("stub transport failure")
+        self.sent.append((channel, recipient, subject, body))
+
+
+class SmtpTransport:
+    """Sends through an SMTP server; SMS go to RETAIL_SMS_GATEWAY, e.g. '{number}@sms.example.com'"""
+
+    def __init__(self):
+        self.host = os.environ.get('RETAIL_SMTP_HOST', 'localhost')
+        self.port = int(os.environ.get('RETAIL_SMTP_PORT', 25))
+        self.user = os.environ.get('RETAIL_SMTP_USER')
+        self.password = os.environ.get('RETAIL_SMTP_PASSWORD')
+        self.starttls = os.environ.get('RETAIL_SMTP_STARTTLS') == '1'
+        self.sender = os.environ.get('RETAIL_SMTP_FROM', 'retail-alerts@localhost')
+        self.sms_gateway = os.environ.get('RETAIL_SMS_GATEWAY', '{number}')
+
+    def send(self, channel, recipient, subject, body):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = self.sms_gateway.format(number=recipient) if channel == 'sms' else recipient
+        message['Subject'] = subject
+        message.set_content(body)
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password or '')
+            smtp.send_message(message)
+
+
+TRANSPORTS = {
+    'smtp': SmtpTransport,
+    'file': FileTransport,
+    'stub': StubTransport,
+}
+
+
+def transport_name(channel):
+    default = 'smtp' if channel == 'email' and os.environ.get('RETAIL_SMTP_HOST') else 'file'
+    return os.environ.get(f'RETAIL_NOTIFY_{channel.upper()}_TRANSPORT', default)
+
+
+# ---------------------------------------------------------------------- #
+# Persistent queue
+# ---------------------------------------------------------------------- #
+class NotificationQueue:
+    """Settings, pending alerts and the delivery log in one SQLite file"""
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self._ready = False
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Autocommit connection, closed on exit; creates the file and tables on first use"""
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            if not self._ready:
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.executescript(SCHEMA)
+                self._ready = True
+            yield connection
+        finally:
+            connection.close()
+
+    def settings(self):
+        with self._connect() as connection:
+            rows = connection.execute('SELECT name, value FROM settings').fetchall()
+        return {**DEFAULT_SETTINGS, **{name: json.loads(value) for name, value in rows}}
+
+    def save_settings(self, settings):
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)',
+                [(name, json.dumps(value)) for name, value in settings.items() if name in DEFAULT_SETTINGS]
+            )
+
+    def enqueue(self, alerts, recipients, now=None):
+        """Queue `alerts` for every (channel, recipient); returns the number of new rows"""
+        now = time.time() if now is None else now
+        rows = [
+            (channel, recipient, alert.key, alert.kind, alert.summary, now)
+            for channel, recipient in recipients for alert in alerts
+        ]
+        with self._connect() as connection:
+            before = connection.total_changes
+            connection.execute('BEGIN')
+            connection.executemany(
+                'INSERT OR IGNORE INTO pending (channel, recipient, alert_key, kind, summary, queued_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows
+            )
+            connection.execute('COMMIT')
+            return connection.total_changes - before
+
+    def due(self, now):
+        """(channel, recipient) pairs whose pending alerts should be sent by `now`, and the next wake-up time"""
+        with self._connect() as connection:
+            groups = connection.execute(
+                "SELECT channel, recipient, MIN(queued_at), MAX(next_attempt_at), COUNT(*) FROM pending "
+                "WHERE status = 'pending' GROUP BY channel, recipient"
+            ).fetchall()
+            ready, wake_at = [], None
+            for channel, recipient, oldest, retry_at, count in groups:
+                send_at = max(retry_at, oldest + DIGEST_SECONDS if count < MAX_DIGEST_ALERTS else oldest)
+                send_at = max(send_at, self._rate_limited_until(connection, channel, recipient, now))
+                if send_at <= now:
+                    ready.append((channel, recipient))
+                else:
+                    wake_at = send_at if wake_at is None else min(wake_at, send_at)
+        return ready, wake_at
+
+    def _rate_limited_until(self, connection, channel, recipient, now):
+        """Earliest time another digest may go to `recipient`"""
+        sent = connection.execute(
+            'SELECT sent_at FROM deliveries WHERE channel = ? AND recipient = ? AND error IS NULL AND sent_at > ? '
+            'ORDER BY sent_at', (channel, recipient, now - RATE_WINDOW)
+        ).fetchall()
+        if len(sent) < RATE_LIMIT:
+            return 0.0
+        return sent[len(sent) - RATE_LIMIT][0] + RATE_WINDOW
+
+    def claim(self, channel, recipient):
+        """Pending alerts of one recipient, oldest first: (ids, alerts, remaining, attempts)"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT id, alert_key, kind, summary, attempts FROM pending "
+                "WHERE status = 'pending' AND channel = ? AND recipient = ? ORDER BY queued_at, id",
+                (channel, recipient)
+            ).fetchall()
+        batch = rows[:MAX_DIGEST_ALERTS]
+        ids = [row[0] for row in batch]
+        alerts = [Alert(*row[1:4]) for row in batch]
+        attempts = max((row[4] for row in batch), default=0)
+        return ids, alerts, len(rows) - len(batch), attempts
+
+    def delivered(self, channel, recipient, ids, transport, now):
+        with self._connect() as connection:
+            connection.execute('BEGIN')
+            connection.executemany("UPDATE pending SET status = 'sent' WHERE id = ?", [(i,) for i in ids])
+            connection.execute(
+                'INSERT INTO deliveries (channel, recipient, sent_at, alerts, transport) VALUES (?, ?, ?, ?, ?)',
+                (channel, recipient, now, len(ids), transport)
+            )
+            connection.execute('COMMIT')
+
+    def failed(self, channel, recipient, ids, transport, error, attempts, now):
+        """Record a failed send; the alerts are retried after a backoff, or given up on"""
+        status = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+        retry_at = now + BACKOFF_SECONDS * 2 ** (attempts - 1) * random.uniform(0.75, 1.25)
+        with self._connect() as connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'UPDATE pending SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                [(status, attempts, retry_at, error, i) for i in ids]
+            )
+            connection.execute(
+                'INSERT INTO deliveries (channel, recipient, sent_at, alerts, transport, error) VALUES (?, ?, ?, ?, ?, ?)',
+                (channel, recipient, now, len(ids), transport, error)
+            )
+            connection.execute('COMMIT')
+
+    def status(self):
+        """Alert counts by status and the latest deliveries"""
+        with self._connect() as connection:
+            counts = dict(connection.execute('SELECT status, COUNT(*) FROM pending GROUP BY status').fetchall())
+            deliveries = pd.read_sql_query(
+                'SELECT sent_at, channel, recipient, alerts, transport, error FROM deliveries ORDER BY id DESC LIMIT 20',
+                connection
+            )
+        deliveries['sent_at'] = pd.to_datetime(deliveries['sent_at'], unit='s')
+        return {'counts': counts, 'deliveries': deliveries}
+
+
+# ---------------------------------------------------------------------- #
+# Dispatcher
+# ---------------------------------------------------------------------- #
+class Notifier:
+    """Accepts alerts without blocking and delivers them from a daemon thread"""
+
+    def __init__(self, queue_path=QUEUE_PATH, transports=None):
+        self.queue = NotificationQueue(queue_path)
+        # Transport instances by channel; created from TRANSPORTS on first use
+        self.transports = dict(transports or {})
+        self._inbox = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._settings = None
+
+    def settings(self):
+        if self._settings is None:
+            self._settings = self.queue.settings()
+        return self._settings
+
+    def save_settings(self, settings):
+        self.queue.save_settings(settings)
+        self._settings = None
+        self._start()
+        self._wake.set()
+
+    def recipients(self):
+        settings = self.settings()
+        return [
+            (channel, recipient)
+            for channel in CHANNELS if settings[f'{channel}_enabled']
+            for recipient in settings[f'{channel}_recipients']
+        ]
+
+    def notify(self, alerts):
+        """Hand alerts to the dispatcher; returns at once"""
+        if not alerts or not self.recipients():
+            return 0
+        self._inbox.put(list(alerts))
+        self._start()
+        self._wake.set()
+        return len(alerts)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        wake_at = None
+        while True:
+            timeout = None if wake_at is None else max(0.0, wake_at - time.time())
+            self._wake.wait(timeout)
+            self._wake.clear()
+            try:
+                wake_at = self.dispatch()
+            except (sqlite3.Error, OSError):
+                wake_at = time.time() + BACKOFF_SECONDS
+
+    def _transport(self, channel):
+        if channel not in self.transports:
+            self.transports[channel] = TRANSPORTS[transport_name(channel)]()
+        return self.transports[channel]
+
+    def dispatch(self, now=None):
+        """Queue the inbox, then send every digest that is due; returns the next time one will be"""
+        recipients = self.recipients()
+        while True:
+            try:
+                alerts = self._inbox.get_nowait()
+            except queue.Empty:
+                break
+            self.queue.enqueue(alerts, recipients, now)
+        now = time.time() if now is None else now
+        ready, wake_at = self.queue.due(now)
+        for channel, recipient in ready:
+            ids, alerts, remaining, attempts = self.queue.claim(channel, recipient)
+            if not ids:
+                continue
+            transport = self._transport(channel)
+            subject, body = digest(channel, alerts, remaining)
+            try:
+                transport.send(channel, recipient, subject, body)
+            except Exception as e:  # any transport error is retried with backoff
+                self.queue.failed(channel, recipient, ids, type(transport).__name__, str(e) or type(e).__name__,
+                                  attempts + 1, now)
+            else:
+                self.queue.delivered(channel, recipient, ids, type(transport).__name__, now)
+        if ready:
+            # Retries are due after their backoff, alerts beyond one digest right away
+            still_ready, wake_at = self.queue.due(now)
+            if still_ready:
+                wake_at = now
+        return wake_at
+
+
+NOTIFIER = Notifier()
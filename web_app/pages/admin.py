@@ -1,8 +1,134 @@
 # web_app/pages/admin.py
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from datetime import datetime
+import analytics
+import demand_model
+import perf
+from profiler import PROFILER
+from figure_cache import FIGURES, send_mode
+from data_watch import WATCHER, WATCH_INTERVAL
+from forecast_table import FORECASTS
+from notifications import CHANNELS, NOTIFIER, transport_name
+from utils import data_key, find_csv, open_dataset, range_sketches, approximation_note
+from startup import lazy_import
+
+px = lazy_import('plotly.express')
+
+def show_performance_spans():
+    """Render the p50/p95/p99 table of recorded perf spans with export controls"""
+    span_summary = perf.summary()
+    if not span_summary:
+        st.info("No timings recorded yet. Visit the other pages to collect data.")
+        return
+    
+    span_df = pd.DataFrame(span_summary)
+    span_df['last_seen'] = pd.to_datetime(span_df['last_seen'], unit='s')
+    st.dataframe(
+        span_df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "span": "Span",
+            "count": st.column_config.NumberColumn("Samples", format="%d"),
+            "p50_ms": st.column_config.NumberColumn("p50 (ms)", format="%.1f"),
+            "p95_ms": st.column_config.NumberColumn("p95 (ms)", format="%.1f"),
+            "p99_ms": st.column_config.NumberColumn("p99 (ms)", format="%.1f"),
+            "max_ms": st.column_config.NumberColumn("Max (ms)", format="%.1f"),
+            "avg_rows": st.column_config.NumberColumn("Avg Rows", format="%,.0f"),
+            "peak_memory_mb": st.column_config.NumberColumn("Peak Mem Δ (MB)", format="%.1f"),
+            "last_seen": st.column_config.DatetimeColumn("Last Seen", format="HH:mm:ss")
+        }
+    )
+    st.caption(
+        f"Last {perf.WINDOW} samples per span in this server process. "
+        f"Memory measured with {perf.memory_mode()} (set RETAIL_TRACE_MEMORY=1 for allocation tracing)."
+    )
+    figure_stats = FIGURES.stats()
+    st.caption(
+        f"Figure cache: {figure_stats['entries']} charts, {figure_stats['size_mb']:.1f} of "
+        f"{figure_stats['max_mb']:.0f} MB, {figure_stats['hit_rate']:.0%} hit rate "
+        f"({figure_stats['hits']:,} hits, {figure_stats['misses']:,} misses); cached charts are {send_mode()}."
+    )
+    
+    export_col1, export_col2 = st.columns(2)
+    with export_col1:
+        st.download_button(
+            label="Export Samples (JSON Lines)",
+            data=perf.export_jsonl(),
+            file_name=f"perf_spans_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+            mime="application/x-ndjson",
+            use_container_width=True
+        )
+    with export_col2:
+        if st.button("Reset Timings", use_container_width=True):
+            perf.reset()
+            st.rerun()
+
+def show_profiler_controls():
+    """Start/stop the sampling profiler and offer its results for download"""
+    status = PROFILER.status()
+    
+    prof_col1, prof_col2, prof_col3 = st.columns(3)
+    with prof_col1:
+        capture_mode = st.selectbox("Capture", options=['Next N reruns', 'Next N seconds'], key='profiler_mode')
+    with prof_col2:
+        capture_amount = st.number_input("N", min_value=1, max_value=600, value=10, step=1, key='profiler_amount')
+    with prof_col3:
+        interval_ms = st.number_input("Sample every (ms)", min_value=1, max_value=100, value=5, step=1, key='profiler_interval')
+    all_threads = st.checkbox("Sample all threads (not only page scripts)", value=False, key='profiler_all_threads')
+    
+    button_col1, button_col2 = st.columns(2)
+    with button_col1:
+        if st.button("Start Profiling", use_container_width=True, disabled=status['running']):
+            if capture_mode == 'Next N reruns':
+                PROFILER.start(reruns=int(capture_amount), interval=interval_ms / 1000, all_threads=all_threads)
+            else:
+                PROFILER.start(seconds=float(capture_amount), interval=interval_ms / 1000, all_threads=all_threads)
+            st.rerun()
+    with button_col2:
+        if st.button("Stop Profiling", use_container_width=True, disabled=not status['running']):
+            PROFILER.stop()
+            st.rerun()
+    
+    status = PROFILER.status()
+    if status['running']:
+        remaining = f", {status['reruns_left']} reruns left" if status['reruns_left'] is not None else ""
+        st.info(f"Profiling across all sessions: {status['samples']:,} samples in {status['elapsed_seconds']:.1f}s{remaining}.")
+    if status['samples'] == 0:
+        if not status['running']:
+            st.caption("No profile captured yet.")
+        return
+    
+    st.caption(
+        f"{status['samples']:,} samples, {status['distinct_stacks']:,} distinct stacks over {status['elapsed_seconds']:.1f}s. "
+        f"Sampler overhead {status['overhead_pct']:.2f}% of wall time (budget {status['overhead_budget_pct']:.0f}%, "
+        f"interval now {status['interval_ms']:.0f} ms)."
+    )
+    st.dataframe(
+        pd.DataFrame(PROFILER.top_functions()),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "function": "Function",
+            "self_samples": st.column_config.NumberColumn("Self Samples", format="%d"),
+            "total_samples": st.column_config.NumberColumn("Total Samples", format="%d"),
+            "self_pct": st.column_config.NumberColumn("Self %", format="%.1f%%"),
+            "total_pct": st.column_config.NumberColumn("Total %", format="%.1f%%")
+        }
+    )
+    st.download_button(
+        label="Download Collapsed Stacks (flamegraph)",
+        data=PROFILER.collapsed(),
+        file_name=f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.collapsed",
+        mime="text/plain",
+        use_container_width=True
+    )
+
+def whole_dataset():
+    """The whole dataset and its data key, read by the background model refresh"""
+    full_df = open_dataset().read()
+    return full_df, data_key(full_df)
 
 def show_admin(df):
     """Display admin panel with system management features"""
@@ -32,22 +158,23 @@ def show_admin(df):
         
         # Overall statistics
         stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
+        sketches = range_sketches(df)
+        stats = analytics.system_statistics(df, sketches)
         
         with stat_col1:
-            total_records = len(df)
-            st.metric("Total Records", f"{total_records:,}")
+            st.metric("Total Records", f"{stats['total_records']:,}")
         
         with stat_col2:
-            date_range = (df['Date'].max() - df['Date'].min()).days
-            st.metric("Date Range", f"{date_range} days")
+            st.metric("Date Range", f"{stats['date_range_days']} days")
         
         with stat_col3:
-            total_stores = df['Store ID'].nunique()
-            st.metric("Total Stores", total_stores)
+            st.metric("Total Stores", stats['total_stores'])
         
         with stat_col4:
-            total_products = df['Product ID'].nunique()
-            st.metric("Total Products", total_products)
+            st.metric("Total Products", stats['total_products'])
+        
+        if sketches is not None:
+            st.caption(f"Store and product counts: {approximation_note(sketches)}")
         
         st.markdown("---")
         
@@ -58,11 +185,7 @@ def show_admin(df):
         
         with quality_col1:
             st.write("**Data Completeness**")
-            completeness = {
-                'Total Records': len(df),
-                'Complete Records': len(df.dropna()),
-                'Missing Values': df.isnull().sum().sum()
-            }
+            completeness = analytics.data_completeness(df)
             for key, value in completeness.items():
                 st.write(f"- {key}: {value:,}")
             
@@ -71,39 +194,47 @@ def show_admin(df):
             st.caption(f"Data Completeness: {completeness_pct:.1f}%")
         
         with quality_col2:
+            ranges = analytics.data_ranges(df, sketches)
             st.write("**Data Range**")
-            st.write(f"- Start Date: {df['Date'].min().strftime('%Y-%m-%d')}")
-            st.write(f"- End Date: {df['Date'].max().strftime('%Y-%m-%d')}")
-            st.write(f"- Categories: {df['Category'].nunique()}")
-            st.write(f"- Regions: {df['Region'].nunique()}")
-            st.write(f"- Weather Conditions: {df['Weather Condition'].nunique()}")
+            st.write(f"- Start Date: {ranges['start_date'].strftime('%Y-%m-%d')}")
+            st.write(f"- End Date: {ranges['end_date'].strftime('%Y-%m-%d')}")
+            st.write(f"- Categories: {ranges['categories']}")
+            st.write(f"- Regions: {ranges['regions']}")
+            st.write(f"- Weather Conditions: {ranges['weather_conditions']}")
+            if sketches is not None:
+                st.caption(approximation_note(sketches))
         
         st.markdown("---")
         
-        # System performance
+        # System performance: timings recorded by perf spans across all sessions
         st.subheader("System Performance Overview")
+        show_performance_spans()
+        
+        st.subheader("Sampling Profiler")
+        show_profiler_controls()
+        
+        st.markdown("---")
+        
+        # Business performance
+        st.subheader("Business Performance Overview")
         
         perf_col1, perf_col2 = st.columns(2)
         
         with perf_col1:
             st.write("**Sales Performance**")
-            total_sales = df['Units Sold'].sum()
-            total_revenue = (df['Units Sold'] * df['Price'] * (1 - df['Discount']/100)).sum()
-            avg_daily_sales = df.groupby('Date')['Units Sold'].sum().mean()
+            sales = analytics.sales_performance(df)
             
-            st.write(f"- Total Sales: {total_sales:,} units")
-            st.write(f"- Total Revenue: ${total_revenue:,.2f}")
-            st.write(f"- Average Daily Sales: {avg_daily_sales:,.0f} units")
+            st.write(f"- Total Sales: {sales['total_sales']:,} units")
+            st.write(f"- Total Revenue: ${sales['total_revenue']:,.2f}")
+            st.write(f"- Average Daily Sales: {sales['avg_daily_sales']:,.0f} units")
         
         with perf_col2:
             st.write("**Inventory Performance**")
-            avg_inventory = df['Inventory Level'].mean()
-            total_inventory = df['Inventory Level'].sum()
-            inventory_turnover = total_sales / avg_inventory if avg_inventory > 0 else 0
+            inventory = analytics.inventory_performance(df)
             
-            st.write(f"- Average Inventory: {avg_inventory:,.0f} units")
-            st.write(f"- Total Inventory Value: ${(df['Inventory Level'] * df['Price']).sum():,.2f}")
-            st.write(f"- Inventory Turnover: {inventory_turnover:.2f}x")
+            st.write(f"- Average Inventory: {inventory['avg_inventory']:,.0f} units")
+            st.write(f"- Total Inventory Value: ${inventory['inventory_value']:,.2f}")
+            st.write(f"- Inventory Turnover: {inventory['inventory_turnover']:.2f}x")
         
         # Data distribution charts
         st.markdown("---")
@@ -112,7 +243,7 @@ def show_admin(df):
         dist_col1, dist_col2 = st.columns(2)
         
         with dist_col1:
-            category_dist = df['Category'].value_counts()
+            category_dist = analytics.record_counts(df, 'Category')
             fig_cat_dist = px.pie(
                 values=category_dist.values,
                 names=category_dist.index,
@@ -121,7 +252,7 @@ def show_admin(df):
             st.plotly_chart(fig_cat_dist, use_container_width=True)
         
         with dist_col2:
-            region_dist = df['Region'].value_counts()
+            region_dist = analytics.record_counts(df, 'Region')
             fig_region_dist = px.bar(
                 x=region_dist.index,
                 y=region_dist.values,
@@ -173,9 +304,9 @@ def show_admin(df):
         
         st.markdown("---")
         
-        # Data import (simulated)
+        # Data import: rows are appended to the CSV export, then only their months are re-partitioned
         st.subheader(" Import Data")
-        st.info("Data import functionality would be implemented here. Upload new CSV files to update the database.")
+        st.info("Upload a CSV with the same columns as the dataset. New rows are added; rows for a date, store and product already in the data are skipped.")
         
         uploaded_file = st.file_uploader(
             "Choose a CSV file",
@@ -188,10 +319,62 @@ def show_admin(df):
                 new_df = pd.read_csv(uploaded_file)
                 st.success(f"File uploaded successfully! {len(new_df)} records found.")
                 st.dataframe(new_df.head(), use_container_width=True)
-                st.warning(" This is a preview. Actual import would require database connection.")
+                if st.button(" Import Records", use_container_width=True):
+                    added, skipped = open_dataset().append_to_csv(find_csv(), new_df)
+                    changed = WATCHER.refresh()
+                    if added:
+                        # Forecast models catch up with the new days in the background
+                        demand_model.refresh_in_background(whole_dataset)
+                    st.toast(f"Imported {added:,} records ({skipped:,} already present); {len(changed)} month(s) updated")
+                    st.rerun()
             except Exception as e:
                 st.error(f"Error reading file: {str(e)}")
         
+        # Every stored demand model, with how it was derived from its parent
+        models = demand_model.lineage()
+        if models:
+            with st.expander("Forecast model lineage"):
+                lineage_df = pd.DataFrame([{
+                    'Version': record['version'],
+                    'Model': record['model'],
+                    'Mode': record['mode'],
+                    'Parent': record.get('parent'),
+                    'Trained Through': record['trained_through'][:10],
+                    'Rows': record['trained_rows'],
+                    'Trees': record['trees'],
+                    'Seconds': record['seconds'],
+                    'Max PSI': record.get('drift', {}).get('max_psi'),
+                    'Error Ratio': record.get('drift', {}).get('error_ratio'),
+                    'Reason': record.get('reason'),
+                } for record in reversed(models[-20:])])
+                st.dataframe(
+                    lineage_df,
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "Seconds": st.column_config.NumberColumn("Seconds", format="%.2f"),
+                        "Max PSI": st.column_config.NumberColumn(
+                            "Max PSI", format="%.3f",
+                            help=f"Largest population stability index of sales and inputs vs the full training; above {demand_model.DRIFT_PSI:g} forces a full retrain"
+                        ),
+                        "Error Ratio": st.column_config.NumberColumn(
+                            "Error Ratio", format="%.2f",
+                            help=f"Error on the new days vs the first measured one; above {demand_model.DRIFT_ERROR_RATIO:g} forces a full retrain"
+                        )
+                    }
+                )
+        
+        # Forward forecast table: built by a background job, read by the Dashboard, Products and Alerts pages
+        forecasts = FORECASTS.table()
+        if forecasts is not None:
+            st.caption(
+                f"Forward forecasts: {len(forecasts)} store/product pairs x {len(forecasts.dates)} days after "
+                f"{forecasts.through:%Y-%m-%d}, built {datetime.fromtimestamp(forecasts.meta['built_at']):%Y-%m-%d %H:%M} "
+                f"in {forecasts.meta['seconds']:.1f} s"
+            )
+        if FORECASTS.last_error:
+            st.warning(f"Forecast table job failed: {FORECASTS.last_error}")
+        
         st.markdown("---")
         
         # Data backup
@@ -257,12 +440,53 @@ def show_admin(df):
                 step=10
             )
             
-            enable_email_alerts = st.checkbox("Enable Email Alerts", value=False)
-            enable_sms_alerts = st.checkbox("Enable SMS Alerts", value=False)
+            notify_settings = NOTIFIER.settings()
+            enable_email_alerts = st.checkbox("Enable Email Alerts", value=notify_settings['email_enabled'])
+            email_recipients = st.text_input(
+                "Alert email recipients",
+                value=', '.join(notify_settings['email_recipients']),
+                help="Comma-separated addresses; each gets one digest of new alerts at a time"
+            )
+            enable_sms_alerts = st.checkbox("Enable SMS Alerts", value=notify_settings['sms_enabled'])
+            sms_recipients = st.text_input(
+                "Alert SMS numbers",
+                value=', '.join(notify_settings['sms_recipients']),
+                help="Comma-separated phone numbers"
+            )
         
         if st.button(" Save Settings", use_container_width=True):
+            NOTIFIER.save_settings({
+                'email_enabled': enable_email_alerts,
+                'sms_enabled': enable_sms_alerts,
+                'email_recipients': [r.strip() for r in email_recipients.split(',') if r.strip()],
+                'sms_recipients': [r.strip() for r in sms_recipients.split(',') if r.strip()],
+            })
             st.success("Settings saved successfully!")
         
+        # Notifications are queued by the Alerts page and sent by a background dispatcher
+        notify_status = NOTIFIER.queue.status()
+        counts = notify_status['counts']
+        st.caption(
+            f"Notifications: {counts.get('pending', 0)} queued, {counts.get('sent', 0)} sent, "
+            f"{counts.get('failed', 0)} failed; transports "
+            + ', '.join(f"{channel} via {transport_name(channel)}" for channel in CHANNELS)
+        )
+        if len(notify_status['deliveries']) > 0:
+            with st.expander("Recent notifications"):
+                st.dataframe(
+                    notify_status['deliveries'],
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "sent_at": st.column_config.DatetimeColumn("Sent", format="YYYY-MM-DD HH:mm:ss"),
+                        "channel": "Channel",
+                        "recipient": "Recipient",
+                        "alerts": st.column_config.NumberColumn("Alerts", format="%d"),
+                        "transport": "Transport",
+                        "error": "Error"
+                    }
+                )
+        
         st.markdown("---")
         
         # System maintenance
@@ -273,10 +497,16 @@ def show_admin(df):
         with maint_col1:
             if st.button(" Clear Cache", use_container_width=True):
                 st.cache_data.clear()
+                FIGURES.clear()
                 st.success("Cache cleared successfully!")
             
             if st.button(" Refresh Data", use_container_width=True):
-                st.success("Data refreshed successfully!")
+                # Sessions reload on their next run: only the changed months are read
+                changed = WATCHER.refresh()
+                if changed:
+                    st.toast(f"Data refreshed: {len(changed)} changed month(s) reloaded")
+                else:
+                    st.toast("Data source unchanged")
                 st.rerun()
         
         with maint_col2:
@@ -286,6 +516,17 @@ def show_admin(df):
             if st.button(" Run Data Validation", use_container_width=True):
                 st.info("Data validation completed. No issues found.")
         
+        watch_note = "on demand" if WATCH_INTERVAL <= 0 else f"every {WATCH_INTERVAL:g}s"
+        st.caption(f"Data source checked {watch_note}; dataset version {WATCHER.version()}")
+        if WATCHER.events:
+            last_change = WATCHER.events[-1]
+            st.caption(
+                f"Last change {datetime.fromtimestamp(last_change['at']):%Y-%m-%d %H:%M:%S}: "
+                f"{', '.join(last_change['months'])} rewritten, "
+                f"{last_change['figures_evicted']} cached charts dropped, "
+                f"{last_change['anomalies']} new sales anomalies"
+            )
+        
         st.markdown("---")
         
         # System information
@@ -1,8 +1,53 @@
 # web_app/pages/alerts.py
 import streamlit as st
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
+import analytics
+from inventory_policy import (
+    DEFAULT_LEAD_TIME_DAYS, DEFAULT_REVIEW_DAYS, DEFAULT_SERVICE_LEVEL, SERVICE_LEVELS,
+    reorder_policy, reorder_recommendations
+)
+import elasticity
+from anomaly import DETECTOR, Z_THRESHOLD
+from forecast_table import FORECASTS, INTERVAL
+from notifications import NOTIFIER, anomaly_alerts, reorder_alerts
+from utils import data_key, leaderboards, open_dataset, price_elasticities, range_sketches, shard_summary, approximation_note
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _cached_policy(key, service_levels, lead_time_days, review_days, _df):
+    return reorder_policy(_df, dict(service_levels), lead_time_days, review_days)
+
+def cached_reorder_policy(df, service_levels, lead_time_days, review_days):
+    """Reorder policy table, computed once per data version, date range and settings"""
+    key = data_key(df)
+    if key is None:
+        return reorder_policy(df, service_levels, lead_time_days, review_days)
+    return _cached_policy(key, tuple(sorted(service_levels.items())), lead_time_days, review_days, df)
+
+def show_policy_settings(categories):
+    """Lead time, review period and per-category service level inputs"""
+    with st.expander("Reorder policy settings"):
+        setting_col1, setting_col2 = st.columns(2)
+        with setting_col1:
+            lead_time_days = st.number_input(
+                "Lead time (days)", min_value=1, max_value=90, value=DEFAULT_LEAD_TIME_DAYS, key='policy_lead_time'
+            )
+        with setting_col2:
+            review_days = st.number_input(
+                "Review period (days)", min_value=0, max_value=90, value=DEFAULT_REVIEW_DAYS, key='policy_review_days'
+            )
+        st.write("**Service level by category** (probability of not running out before a delivery)")
+        service_levels = {}
+        for col, category in zip(st.columns(len(categories)), categories):
+            with col:
+                service_levels[category] = st.number_input(
+                    category,
+                    min_value=0.50,
+                    max_value=0.999,
+                    value=SERVICE_LEVELS.get(category, DEFAULT_SERVICE_LEVEL),
+                    step=0.01,
+                    format="%.3f",
+                    key=f'service_level_{category}'
+                )
+    return service_levels, lead_time_days, review_days
 
 def show_alerts(df):
     """Display alerts and notifications page"""
@@ -20,63 +65,110 @@ def show_alerts(df):
     </div>
     """, unsafe_allow_html=True)
     
-    # Calculate alerts
-    alerts = []
-    
     # Low Stock Alerts
     st.header(" Stock Alerts")
     
-    # Define thresholds
-    low_stock_threshold = df['Inventory Level'].quantile(0.2)  # Bottom 20%
-    high_demand_threshold = df['Units Ordered'].quantile(0.8)  # Top 20%
-    
-    # Low inventory alerts
-    low_stock = df[df['Inventory Level'] < low_stock_threshold].copy()
-    if len(low_stock) > 0:
-        st.subheader(" Low Stock Alert")
-        st.warning(f"**{len(low_stock)} products** have inventory levels below the threshold ({low_stock_threshold:.0f} units)")
-        
-        # Show top low stock items
-        low_stock_summary = low_stock.groupby(['Product ID', 'Category', 'Store ID']).agg({
-            'Inventory Level': 'mean',
-            'Units Sold': 'mean',
-            'Price': 'mean'
-        }).reset_index()
-        low_stock_summary = low_stock_summary.sort_values('Inventory Level').head(10)
+    # Reorder alerts: each store/product against its own demand rate and variability
+    service_levels, lead_time_days, review_days = show_policy_settings(sorted(df['Category'].unique()))
+    policy = cached_reorder_policy(df, service_levels, lead_time_days, review_days)
+    recommendations = reorder_recommendations(policy)
+    if len(recommendations) > 0:
+        st.subheader(" Reorder Recommendations")
+        st.warning(
+            f"**{len(recommendations)} of {len(policy)} store/product pairs** are at or below their reorder point "
+            f"(lead time {lead_time_days} day{'s' if lead_time_days != 1 else ''}, safety stock from each pair's demand variability)"
+        )
         
+        # Show the most urgent reorders
         st.dataframe(
-            low_stock_summary,
+            recommendations.head(20),
             use_container_width=True,
             hide_index=True,
             column_config={
-                "Product ID": "Product",
-                "Category": "Category",
                 "Store ID": "Store",
-                "Inventory Level": st.column_config.NumberColumn("Current Stock", format="%.0f"),
-                "Units Sold": st.column_config.NumberColumn("Avg Units Sold", format="%.1f"),
-                "Price": st.column_config.NumberColumn("Price", format="$%.2f")
+                "Product ID": "Product",
+                "Observed Days": None,
+                "Reorder": None,
+                "Avg Daily Demand": st.column_config.NumberColumn("Avg Daily Demand", format="%.1f"),
+                "Demand Std": st.column_config.NumberColumn("Demand Std", format="%.1f"),
+                "Service Level": st.column_config.NumberColumn("Service Level", format="%.3f"),
+                "Lead Time Demand": st.column_config.NumberColumn("Lead Time Demand", format="%.0f"),
+                "Safety Stock": st.column_config.NumberColumn("Safety Stock", format="%.0f"),
+                "Reorder Point": st.column_config.NumberColumn("Reorder Point", format="%.0f"),
+                "Current Inventory": st.column_config.NumberColumn("Current Stock", format="%.0f"),
+                "Days of Cover": st.column_config.NumberColumn("Days of Cover", format="%.1f"),
+                "Order Quantity": st.column_config.NumberColumn("Order Qty", format="%d")
             }
         )
+        st.download_button(
+            label="Download All Reorder Recommendations (CSV)",
+            data=recommendations.to_csv(index=False),
+            file_name="reorder_recommendations.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
     else:
-        st.success(" All products have adequate stock levels")
+        st.success(" All store/product pairs are above their reorder points")
+    
+    # Projected stockouts: current stock plus expected receipts against the stored forward forecasts (no model runs here)
+    forecasts = FORECASTS.for_frame(df)
+    if forecasts is not None:
+        protection_days = min(lead_time_days + review_days, len(forecasts.dates))
+        stockouts = forecasts.stockouts(protection_days, lead_time_days=lead_time_days)
+        if len(stockouts) > 0:
+            st.subheader(" Projected Stockouts")
+            st.error(
+                f"**{len(stockouts)} store/product pairs** are forecast to run out of stock within {protection_days} "
+                f"day{'s' if protection_days != 1 else ''} (lead time plus review period), "
+                f"counting orders already placed and each pair's average daily order after the lead time"
+            )
+            st.dataframe(
+                stockouts.head(20),
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Store ID": "Store",
+                    "Product ID": "Product",
+                    "Current Inventory": st.column_config.NumberColumn("Current Stock", format="%.0f"),
+                    "Expected Receipts": st.column_config.NumberColumn("Expected Receipts", format="%.0f"),
+                    "Forecast Demand": st.column_config.NumberColumn("Forecast Demand", format="%.0f"),
+                    "Projected Stockout": st.column_config.DateColumn("Projected Stockout"),
+                    "Earliest Stockout": st.column_config.DateColumn(
+                        "Earliest Stockout", help=f"At the upper end of the {INTERVAL:.0%} forecast interval"
+                    )
+                }
+            )
+        else:
+            st.success(f" No store/product pair is forecast to run out within {protection_days} days")
+        st.caption(
+            f"Forecasts for the {len(forecasts.dates)} days after {forecasts.through:%Y-%m-%d}, "
+            f"from the forecast table refreshed in the background when the data changes"
+        )
+    elif FORECASTS.table() is None:
+        st.caption("Projected stockouts appear once the background job has built the forecast table")
     
     st.markdown("---")
     
     # High Demand Alerts
     st.header(" High Demand Alerts")
     
-    high_demand = df[df['Units Ordered'] > high_demand_threshold].copy()
-    if len(high_demand) > 0:
+    # Define threshold: top 20% units ordered
+    sketches = range_sketches(df)
+    # Parallel aggregation answers the exact thresholds and rollups; approximate mode takes precedence
+    shards = shard_summary(df) if sketches is None else None
+    thresholds = (shards and shards.alert_thresholds()) or analytics.alert_thresholds(df, sketches)
+    high_demand_threshold = thresholds['high_demand']
+    if sketches is not None:
+        st.caption(f"Threshold: {approximation_note(sketches, 'quantile')}")
+    
+    boards = leaderboards(df)
+    if boards is not None:
+        high_demand_count, high_demand_summary = boards.high_demand(df, high_demand_threshold)
+    else:
+        high_demand_count, high_demand_summary = analytics.high_demand_alerts(df, high_demand_threshold)
+    if high_demand_count > 0:
         st.subheader(" High Demand Products")
-        st.info(f"**{len(high_demand)} product entries** show high demand (above {high_demand_threshold:.0f} units ordered)")
-        
-        high_demand_summary = high_demand.groupby(['Product ID', 'Category', 'Region']).agg({
-            'Units Ordered': 'mean',
-            'Inventory Level': 'mean',
-            'Price': 'mean',
-            'Discount': 'mean'
-        }).reset_index()
-        high_demand_summary = high_demand_summary.sort_values('Units Ordered', ascending=False).head(10)
+        st.info(f"**{high_demand_count} product entries** show high demand (above {high_demand_threshold:.0f} units ordered)")
         
         st.dataframe(
             high_demand_summary,
@@ -101,17 +193,10 @@ def show_alerts(df):
     st.header(" Pricing Alerts")
     
     # Products with high discount but low sales
-    high_discount_low_sales = df[(df['Discount'] > 15) & (df['Units Sold'] < df['Units Sold'].quantile(0.3))].copy()
-    if len(high_discount_low_sales) > 0:
+    discount_alert_count, discount_alert_summary = analytics.discount_alerts(df, sketches=sketches)
+    if discount_alert_count > 0:
         st.subheader(" High Discount, Low Sales")
-        st.warning(f"**{len(high_discount_low_sales)} products** have high discounts (>15%) but low sales. Consider reviewing pricing strategy.")
-        
-        discount_alert_summary = high_discount_low_sales.groupby(['Product ID', 'Category']).agg({
-            'Discount': 'mean',
-            'Units Sold': 'mean',
-            'Price': 'mean'
-        }).reset_index()
-        discount_alert_summary = discount_alert_summary.sort_values('Discount', ascending=False).head(10)
+        st.warning(f"**{discount_alert_count} products** have high discounts (>15%) but low sales. Consider reviewing pricing strategy.")
         
         st.dataframe(
             discount_alert_summary,
@@ -120,18 +205,10 @@ def show_alerts(df):
         )
     
     # Products priced significantly above competitor
-    competitor_price_diff = df[df['Price'] > df['Competitor Pricing'] * 1.2].copy()
-    if len(competitor_price_diff) > 0:
+    competitor_alert_count, price_alert_summary = analytics.competitor_price_alerts(df)
+    if competitor_alert_count > 0:
         st.subheader(" Price Above Competitors")
-        st.warning(f"**{len(competitor_price_diff)} products** are priced more than 20% above competitor pricing")
-        
-        price_alert_summary = competitor_price_diff.groupby(['Product ID', 'Category']).agg({
-            'Price': 'mean',
-            'Competitor Pricing': 'mean',
-            'Units Sold': 'mean'
-        }).reset_index()
-        price_alert_summary['Price Difference'] = price_alert_summary['Price'] - price_alert_summary['Competitor Pricing']
-        price_alert_summary = price_alert_summary.sort_values('Price Difference', ascending=False).head(10)
+        st.warning(f"**{competitor_alert_count} products** are priced more than 20% above competitor pricing")
         
         st.dataframe(
             price_alert_summary,
@@ -139,20 +216,82 @@ def show_alerts(df):
             hide_index=True
         )
     
+    # Products whose own sales history shows the competitor premium costs sales
+    by_region = st.checkbox("Estimate price sensitivity per region", key='elasticity_by_region')
+    estimates = price_elasticities(df, by_region)
+    sensitive_count, sensitive_summary = elasticity.price_sensitivity_alerts(df, estimates)
+    if sensitive_count > 0:
+        st.subheader(" Price-Sensitive Products Above Competitors")
+        st.warning(
+            f"**{sensitive_count} {'product/region pairs' if by_region else 'products'}** are priced above competitors "
+            f"and their sales drop measurably as the premium grows"
+        )
+        st.dataframe(
+            sensitive_summary,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Product ID": "Product",
+                "Price": st.column_config.NumberColumn("Avg Price", format="$%.2f"),
+                "Competitor Pricing": st.column_config.NumberColumn("Competitor", format="$%.2f"),
+                "Price Premium": st.column_config.NumberColumn("Premium", format="%.1f%%"),
+                "Relative Price Elasticity": st.column_config.NumberColumn(
+                    "Elasticity vs Competitor", format="%.2f",
+                    help="% change in units for a 1% higher price relative to the competitor"
+                ),
+                "Units Sold": st.column_config.NumberColumn("Avg Units", format="%.0f"),
+                "Sales Lift": st.column_config.NumberColumn("Lift at Competitor Price", format="%.1f%%"),
+                "Extra Units per Store-Day": st.column_config.NumberColumn("Extra Units per Store-Day", format="%.1f")
+            }
+        )
+    else:
+        st.info("No product's sales respond significantly to its price premium over competitors")
+    st.caption(
+        f"Log-log demand models of units sold on price, discount and price relative to competitors, "
+        f"fitted for {estimates['Price Elasticity'].notna().sum()} {'product/region pairs' if by_region else 'products'} at once"
+    )
+    
     st.markdown("---")
     
     # Store Performance Alerts
     st.header(" Store Performance Alerts")
     
-    store_performance = df.groupby('Store ID').agg({
-        'Units Sold': 'sum',
-        'Inventory Level': 'mean'
-    }).reset_index()
-    store_performance = store_performance.sort_values('Units Sold')
+    # Sudden changes: each day's sales of a store (or store/product pair) against its own recent level
+    DETECTOR.update(open_dataset())
+    first_day, last_day = df['Date'].iloc[0], df['Date'].iloc[-1]
+    store_anomalies = DETECTOR.anomalies('store', first_day, last_day)
+    pair_anomalies = DETECTOR.anomalies('pair', first_day, last_day)
+    anomaly_columns = {
+        "Date": st.column_config.DateColumn("Date"),
+        "Store ID": "Store",
+        "Product ID": "Product",
+        "Units Sold": st.column_config.NumberColumn("Units Sold", format="%.0f"),
+        "Expected": st.column_config.NumberColumn("Expected", format="%.0f"),
+        "Z-Score": st.column_config.NumberColumn("Z-Score", format="%.1f"),
+        "Check": st.column_config.TextColumn("Compared With", help="level: recent days; weekday: the same weekday in recent weeks")
+    }
+    if len(store_anomalies) > 0:
+        st.subheader(" Store Sales Anomalies")
+        st.error(f"**{len(store_anomalies)} store-days** had total sales far from the store's usual level")
+        st.dataframe(store_anomalies.head(20), use_container_width=True, hide_index=True, column_config=anomaly_columns)
+    if len(pair_anomalies) > 0:
+        st.subheader(" Product Sales Anomalies")
+        st.warning(f"**{len(pair_anomalies)} product-days** had sales far from the product's usual level in its store")
+        st.dataframe(pair_anomalies.head(20), use_container_width=True, hide_index=True, column_config=anomaly_columns)
+    if len(store_anomalies) == 0 and len(pair_anomalies) == 0:
+        st.success(" No unusual daily sales in the selected range")
+    st.caption(f"Flagged when a day is more than {Z_THRESHOLD:g} standard deviations from the series' recent level or its weekday level")
+    
+    # Email/SMS digests of current alerts: only queued here, sent by a background dispatcher
+    if NOTIFIER.recipients() and last_day == DETECTOR.through:
+        NOTIFIER.notify(
+            reorder_alerts(recommendations, last_day)
+            + anomaly_alerts(store_anomalies, last_day)
+            + anomaly_alerts(pair_anomalies, last_day)
+        )
     
     # Identify underperforming stores
-    avg_sales = store_performance['Units Sold'].mean()
-    underperforming_stores = store_performance[store_performance['Units Sold'] < avg_sales * 0.8]
+    underperforming_stores = shards.underperforming_stores() if shards is not None else analytics.underperforming_stores(df)
     
     if len(underperforming_stores) > 0:
         st.subheader(" Underperforming Stores")
@@ -176,22 +315,15 @@ def show_alerts(df):
     # Category Alerts
     st.header(" Category Performance Alerts")
     
-    category_performance = df.groupby('Category').agg({
-        'Units Sold': 'sum',
-        'Inventory Level': 'mean',
-        'Units Ordered': 'sum'
-    }).reset_index()
-    category_performance['Demand vs Supply'] = category_performance['Units Ordered'] - category_performance['Units Sold']
-    
     # Categories with high demand but low sales (potential stockouts)
-    stockout_risk = category_performance[category_performance['Demand vs Supply'] > category_performance['Demand vs Supply'].quantile(0.75)]
+    stockout_risk = shards.stockout_risk() if shards is not None else analytics.stockout_risk(df)
     
     if len(stockout_risk) > 0:
         st.subheader(" Potential Stockout Risk")
         st.error(f"**{len(stockout_risk)} categories** show high demand relative to sales (potential stockouts)")
         
         st.dataframe(
-            stockout_risk.sort_values('Demand vs Supply', ascending=False),
+            stockout_risk,
             use_container_width=True,
             hide_index=True
         )
@@ -203,16 +335,16 @@ def show_alerts(df):
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        st.metric("Low Stock Items", len(low_stock) if len(low_stock) > 0 else 0)
+        st.metric("Reorders Needed", len(recommendations))
     
     with col2:
-        st.metric("High Demand Items", len(high_demand) if len(high_demand) > 0 else 0)
+        st.metric("High Demand Items", high_demand_count)
     
     with col3:
-        st.metric("Pricing Alerts", len(high_discount_low_sales) + len(competitor_price_diff))
+        st.metric("Pricing Alerts", discount_alert_count + competitor_alert_count + sensitive_count)
     
     with col4:
-        st.metric("Store Alerts", len(underperforming_stores) if len(underperforming_stores) > 0 else 0)
+        st.metric("Store Alerts", len(underperforming_stores) + len(store_anomalies))
     
     # Filter options
     st.markdown("---")
@@ -235,11 +367,7 @@ def show_alerts(df):
         )
     
     if selected_category or selected_region:
-        filtered_df = df.copy()
-        if selected_category:
-            filtered_df = filtered_df[filtered_df['Category'].isin(selected_category)]
-        if selected_region:
-            filtered_df = filtered_df[filtered_df['Region'].isin(selected_region)]
+        filtered_df = analytics.filter_records(df, categories=selected_category, regions=selected_region)
         
         st.info(f"Showing alerts for {len(filtered_df)} filtered records")
         st.dataframe(filtered_df.head(20), use_container_width=True)
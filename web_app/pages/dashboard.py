@@ -1,9 +1,109 @@
 # web_app/pages/dashboard.py
-import streamlit as st
-import pandas as pd
 import numpy as np
-import plotly.express as px
-import plotly.graph_objects as go
+import streamlit as st
+import analytics
+import demand_model
+import elasticity
+import forecasting
+import sharded
+from forecast_table import FORECASTS, INTERVAL, add_overlay
+from startup import lazy_import
+from utils import data_key, leaderboards, price_elasticities, range_sketches, shard_summary, approximation_note
+from figure_cache import lazy, plotly_chart
+
+# Plotly is imported when the first chart is drawn, not when the page loads
+px = lazy_import('plotly.express')
+
+# Analytics results behind each part of the page. Only the selected
+# visualization section is drawn on a rerun, and its results are only
+# computed when one of its charts is missing from the figure cache.
+SECTION_DATA = {
+    'metrics': {'kpis': analytics.kpis},
+    'insights': {'insights': analytics.business_insights},
+    ' Sales Overview': {
+        'category_sales': analytics.category_sales,
+        'category_avg': analytics.category_average_sales,
+    },
+    ' Store & Region': {
+        'region_sales': analytics.region_sales,
+        'store_sales': analytics.store_sales,
+        'region_category_pivot': analytics.region_category_matrix,
+    },
+    ' Time Trends': {
+        'daily_sales': analytics.daily_sales,
+        'monthly_sales': analytics.monthly_sales,
+        'seasonal_sales': analytics.seasonal_sales,
+    },
+    ' Inventory': {'sample_df': analytics.inventory_sample},
+    ' Demand Patterns': {'demand_breakdown': analytics.demand_breakdown},
+    # Model-driven; results are cached per product and model version instead
+    ' What-if Scenarios': {},
+}
+
+# Computations that use the merged sketches in approximate mode
+APPROXIMATE = {'kpis', 'demand_breakdown'}
+
+def _compute(name, func, df, sketches=None, shards=None):
+    if sketches is not None and name in APPROXIMATE:
+        return func(df, sketches=sketches)
+    if func.__name__ in sharded.COMPUTATIONS:
+        summary = shards()
+        if summary is not None:
+            return summary.compute(func.__name__)
+    return func(df)
+
+def _compute_section(section, df, sketches=None, shards=None):
+    # Shard summaries give the same results as the analytics functions, so they share the cache
+    shards = shards or (lambda: None)
+    return {name: _compute(name, func, df, sketches, shards) for name, func in SECTION_DATA[section].items()}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _cached_section(section, key, approximate, _df, _sketches, _shards):
+    return _compute_section(section, _df, _sketches, _shards)
+
+def section_data(section, df, sketches=None):
+    """Results for one part of the page, computed once per data version, date range and mode"""
+    shards = lazy(shard_summary, df)
+    key = data_key(df)
+    if key is None:
+        return _compute_section(section, df, sketches, shards)
+    return _cached_section(section, key, sketches is not None, df, sketches, shards)
+
+@st.fragment
+def prediction_tool():
+    """Sidebar demand predictor; its widgets rerun only this fragment, not the charts"""
+    st.header(" Demand Prediction Tool")
+    st.markdown("**Enter product details to predict demand:**")
+    
+    category = st.selectbox("Product Category", ["Electronics", "Clothing", "Groceries", "Toys", "Furniture"])
+    price = st.slider("Price ($)", 10.0, 100.0, 55.0)
+    discount = st.slider("Discount (%)", 0, 20, 10)
+    inventory = st.slider("Current Inventory Level", 50, 500, 200)
+    region = st.selectbox("Region", ["North", "South", "East", "West"])
+    weather = st.selectbox("Weather Condition", ["Sunny", "Rainy", "Cloudy", "Snowy"])
+    holiday = st.checkbox("Holiday/Promotion Period")
+    season = st.selectbox("Season", ["Spring", "Summer", "Autumn", "Winter"])
+    
+    # Display style per predicted demand level
+    demand_styles = {
+        "HIGH": ("#000000", "🟢"),
+        "MEDIUM": ("#000000", "🟡"),
+        "LOW": ("#000000", "🔴")
+    }
+    
+    # Predict button
+    if st.button(" Predict Demand", use_container_width=True):
+        demand, factors = analytics.predict_demand(category, price, discount, inventory, holiday)
+        color, emoji = demand_styles[demand]
+        st.markdown(f"""
+        <div style='padding: 15px; border-radius: 10px; background-color: {color}; margin-top: 20px;'>
+            <h3 style='text-align: center; margin: 0;'>{emoji} Predicted Demand: {demand}</h3>
+        </div>
+        """, unsafe_allow_html=True)
+        if factors:
+            st.markdown("**Key Factors:**")
+            for factor in factors:
+                st.markdown(f"• {factor}")
 
 def show_dashboard(df):
     """Display the main dashboard with visualizations"""
@@ -23,58 +123,9 @@ def show_dashboard(df):
     </div>
     """, unsafe_allow_html=True)
     
-    # Sidebar for predictions
-    st.sidebar.header(" Demand Prediction Tool")
-    st.sidebar.markdown("**Enter product details to predict demand:**")
-    
-    category = st.sidebar.selectbox("Product Category", ["Electronics", "Clothing", "Groceries", "Toys", "Furniture"])
-    price = st.sidebar.slider("Price ($)", 10.0, 100.0, 55.0)
-    discount = st.sidebar.slider("Discount (%)", 0, 20, 10)
-    inventory = st.sidebar.slider("Current Inventory Level", 50, 500, 200)
-    region = st.sidebar.selectbox("Region", ["North", "South", "East", "West"])
-    weather = st.sidebar.selectbox("Weather Condition", ["Sunny", "Rainy", "Cloudy", "Snowy"])
-    holiday = st.sidebar.checkbox("Holiday/Promotion Period")
-    season = st.sidebar.selectbox("Season", ["Spring", "Summer", "Autumn", "Winter"])
-    
-    # Prediction function
-    def predict_demand():
-        score = 0
-        factors = []
-        if price < 40: 
-            score += 2
-            factors.append("✓ Competitive pricing attracts more customers")
-        if discount > 15: 
-            score += 2
-            factors.append("✓ Strong discount driving high demand")
-        if holiday: 
-            score += 1
-            factors.append("✓ Holiday/promotion period increases sales")
-        if category in ["Electronics", "Toys"]: 
-            score += 1
-            factors.append("✓ Popular category with high demand")
-        if inventory < 150:
-            score += 1
-            factors.append("✓ Low inventory may indicate high demand")
-        
-        if score >= 4: 
-            return "HIGH", "#000000", "🟢", factors
-        elif score >= 2: 
-            return "MEDIUM", "#000000", "🟡", factors
-        else: 
-            return "LOW", "#000000", "🔴", factors
-    
-    # Predict button
-    if st.sidebar.button(" Predict Demand", use_container_width=True):
-        demand, color, emoji, factors = predict_demand()
-        st.sidebar.markdown(f"""
-        <div style='padding: 15px; border-radius: 10px; background-color: {color}; margin-top: 20px;'>
-            <h3 style='text-align: center; margin: 0;'>{emoji} Predicted Demand: {demand}</h3>
-        </div>
-        """, unsafe_allow_html=True)
-        if factors:
-            st.sidebar.markdown("**Key Factors:**")
-            for factor in factors:
-                st.sidebar.markdown(f"• {factor}")
+    # Sidebar for predictions (a fragment, so slider changes skip the charts)
+    with st.sidebar:
+        prediction_tool()
     
     st.sidebar.markdown("---")
     st.sidebar.info(" **Tip:** Lower prices and higher discounts typically increase demand.")
@@ -82,34 +133,77 @@ def show_dashboard(df):
     # Key Metrics Section
     st.header(" Key Business Metrics")
     col1, col2, col3, col4 = st.columns(4)
+    sketches = range_sketches(df)
+    metrics = section_data('metrics', df, sketches)['kpis']
     
     with col1:
-        total_sales = df['Units Sold'].sum()
-        st.metric("Total Units Sold", f"{total_sales:,}", help="Total number of products sold")
+        st.metric("Total Units Sold", f"{metrics['total_units_sold']:,}", help="Total number of products sold")
     
     with col2:
-        avg_daily_sales = df.groupby('Date')['Units Sold'].sum().mean()
-        st.metric("Average Daily Sales", f"{avg_daily_sales:,.0f}", help="Average units sold per day")
+        st.metric("Average Daily Sales", f"{metrics['avg_daily_sales']:,.0f}", help="Average units sold per day")
     
     with col3:
-        total_revenue = (df['Units Sold'] * df['Price'] * (1 - df['Discount']/100)).sum()
-        st.metric("Total Revenue", f"${total_revenue:,.0f}", help="Total revenue (after discounts)")
+        st.metric("Total Revenue", f"${metrics['total_revenue']:,.0f}", help="Total revenue (after discounts)")
     
     with col4:
-        unique_products = df['Product ID'].nunique()
-        st.metric("Total Products", f"{unique_products}", help="Number of unique products")
+        st.metric("Total Products", f"{metrics['unique_products']}", help="Number of unique products")
+        if sketches is not None:
+            st.caption(approximation_note(sketches))
     
     st.markdown("---")
     
     # Visualization Section
     st.header(" Data Visualizations & Insights")
     
-    # Tabs for different visualization categories
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([" Sales Overview", " Store & Region", " Time Trends", " Inventory", " Demand Patterns"])
+    # One section at a time: unlike tabs, only the selected one is computed and drawn
+    section = st.radio(
+        "Section",
+        list(SECTIONS.keys()),
+        horizontal=True,
+        key='dashboard_section',
+        label_visibility='collapsed'
+    )
+    SECTIONS[section](df, lazy(section_data, section, df, sketches), sketches)
     
-    with tab1:
-        st.subheader("Sales Distribution by Category")
-        category_sales = df.groupby('Category')['Units Sold'].sum().reset_index()
+    # Summary Insights
+    st.markdown("---")
+    st.header(" Key Business Insights")
+    
+    insight_col1, insight_col2 = st.columns(2)
+    # Whole-dataset rankings come from the leaderboards, kept current as data is appended
+    boards = leaderboards(df)
+    insights = boards.insights() if boards is not None else section_data('insights', df)['insights']
+    
+    with insight_col1:
+        st.subheader(" Top Performing Categories")
+        top_categories = insights['top_categories']
+        for i, (cat, sales) in enumerate(top_categories.items(), 1):
+            st.write(f"{i}. **{cat}**: {sales:,} units sold")
+        
+        st.subheader(" Best Performing Regions")
+        top_regions = insights['top_regions']
+        for i, (region, sales) in enumerate(top_regions.items(), 1):
+            st.write(f"{i}. **{region}**: {sales:,} units sold")
+    
+    with insight_col2:
+        st.subheader(" Seasonal Insights")
+        seasonal_avg = insights['seasonal_avg']
+        best_season = insights['best_season']
+        worst_season = insights['worst_season']
+        st.write(f"**Best Season**: {best_season} (Avg: {seasonal_avg[best_season]:.0f} units/day)")
+        st.write(f"**Slowest Season**: {worst_season} (Avg: {seasonal_avg[worst_season]:.0f} units/day)")
+        
+        st.subheader(" Pricing Insights")
+        st.write(f"**Average Price**: ${insights['avg_price']:.2f}")
+        st.write(f"**Average Discount**: {insights['avg_discount']:.1f}%")
+        st.write(f"**Products with Discount**: {insights['discounted_share']:.1f}%")
+
+
+def _sales_overview(df, data, sketches):
+    """Category sales pie and average sales bar"""
+    st.subheader("Sales Distribution by Category")
+    def build_pie():
+        category_sales = data()['category_sales']
         fig_pie = px.pie(
             category_sales, 
             values='Units Sold', 
@@ -118,17 +212,19 @@ def show_dashboard(df):
             color_discrete_sequence=px.colors.qualitative.Set3
         )
         fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_pie, use_container_width=True)
-        
-        st.markdown("""
-        <div class="info-box">
-            <strong> What this tells you:</strong> This shows which product categories contribute most to your total sales. 
-            Use this to identify best-performing categories and allocate inventory accordingly.
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.subheader("Average Sales per Category")
-        category_avg = df.groupby('Category')['Units Sold'].mean().reset_index().sort_values('Units Sold', ascending=False)
+        return fig_pie
+    plotly_chart('dashboard.category_pie', data_key(df), build_pie)
+    
+    st.markdown("""
+    <div class="info-box">
+        <strong> What this tells you:</strong> This shows which product categories contribute most to your total sales. 
+        Use this to identify best-performing categories and allocate inventory accordingly.
+    </div>
+    """, unsafe_allow_html=True)
+    
+    st.subheader("Average Sales per Category")
+    def build_bar():
+        category_avg = data()['category_avg']
         fig_bar = px.bar(
             category_avg,
             x='Category',
@@ -139,11 +235,15 @@ def show_dashboard(df):
             text='Units Sold'
         )
         fig_bar.update_traces(texttemplate='%{text:.0f}', textposition='outside')
-        st.plotly_chart(fig_bar, use_container_width=True)
-    
-    with tab2:
-        st.subheader("Sales Performance by Region")
-        region_sales = df.groupby('Region')['Units Sold'].sum().reset_index()
+        return fig_bar
+    plotly_chart('dashboard.category_avg', data_key(df), build_bar)
+
+
+def _store_region(df, data, sketches):
+    """Region pie, store bars and region/category heatmap"""
+    st.subheader("Sales Performance by Region")
+    def build_region_pie():
+        region_sales = data()['region_sales']
         fig_region_pie = px.pie(
             region_sales,
             values='Units Sold',
@@ -152,10 +252,12 @@ def show_dashboard(df):
             color_discrete_sequence=px.colors.qualitative.Pastel
         )
         fig_region_pie.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_region_pie, use_container_width=True)
-        
-        st.subheader("Store Performance Comparison")
-        store_sales = df.groupby('Store ID')['Units Sold'].sum().reset_index().sort_values('Units Sold', ascending=False)
+        return fig_region_pie
+    plotly_chart('dashboard.region_pie', data_key(df), build_region_pie)
+    
+    st.subheader("Store Performance Comparison")
+    def build_store():
+        store_sales = data()['store_sales']
         fig_store = px.bar(
             store_sales,
             x='Store ID',
@@ -166,11 +268,12 @@ def show_dashboard(df):
             text='Units Sold'
         )
         fig_store.update_traces(texttemplate='%{text:,}', textposition='outside')
-        st.plotly_chart(fig_store, use_container_width=True)
-        
-        st.subheader("Sales Heatmap: Region vs Category")
-        region_category = df.groupby(['Region', 'Category'])['Units Sold'].sum().reset_index()
-        region_category_pivot = region_category.pivot(index='Category', columns='Region', values='Units Sold')
+        return fig_store
+    plotly_chart('dashboard.store', data_key(df), build_store)
+    
+    st.subheader("Sales Heatmap: Region vs Category")
+    def build_heatmap():
+        region_category_pivot = data()['region_category_pivot']
         fig_heatmap = px.imshow(
             region_category_pivot,
             labels=dict(x="Region", y="Category", color="Units Sold"),
@@ -178,11 +281,17 @@ def show_dashboard(df):
             color_continuous_scale='YlOrRd',
             aspect="auto"
         )
-        st.plotly_chart(fig_heatmap, use_container_width=True)
-    
-    with tab3:
-        st.subheader("Sales Trends Over Time")
-        daily_sales = df.groupby('Date')['Units Sold'].sum().reset_index()
+        return fig_heatmap
+    plotly_chart('dashboard.heatmap', data_key(df), build_heatmap)
+
+
+def _time_trends(df, data, sketches):
+    """Daily, monthly and seasonal sales"""
+    st.subheader("Sales Trends Over Time")
+    # Stored forward forecasts continue the line when the range ends on the latest day
+    forecasts = FORECASTS.for_frame(df)
+    def build_line():
+        daily_sales = data()['daily_sales']
         fig_line = px.line(
             daily_sales,
             x='Date',
@@ -191,10 +300,19 @@ def show_dashboard(df):
             markers=True
         )
         fig_line.update_traces(line_color='#1f77b4', line_width=2)
-        st.plotly_chart(fig_line, use_container_width=True)
-        
-        df['Month'] = df['Date'].dt.to_period('M').astype(str)
-        monthly_sales = df.groupby('Month')['Units Sold'].sum().reset_index()
+        if forecasts is not None:
+            add_overlay(fig_line, forecasts.total())
+        return fig_line
+    plotly_chart('dashboard.daily_line', data_key(df), build_line,
+                 params=(forecasts.meta['built_at'] if forecasts is not None else None,))
+    if forecasts is not None:
+        st.caption(
+            f"Dashed: forecast for the {len(forecasts.dates)} days after {forecasts.through:%Y-%m-%d}, "
+            f"with an {INTERVAL:.0%} interval combining those of all store/product pairs"
+        )
+    
+    def build_monthly():
+        monthly_sales = data()['monthly_sales']
         fig_monthly = px.bar(
             monthly_sales,
             x='Month',
@@ -206,10 +324,12 @@ def show_dashboard(df):
         )
         fig_monthly.update_traces(texttemplate='%{text:,}', textposition='outside')
         fig_monthly.update_xaxes(tickangle=45)
-        st.plotly_chart(fig_monthly, use_container_width=True)
-        
-        st.subheader("Seasonal Sales Patterns")
-        seasonal_sales = df.groupby('Seasonality')['Units Sold'].sum().reset_index()
+        return fig_monthly
+    plotly_chart('dashboard.monthly', data_key(df), build_monthly)
+    
+    st.subheader("Seasonal Sales Patterns")
+    def build_seasonal():
+        seasonal_sales = data()['seasonal_sales']
         fig_seasonal = px.bar(
             seasonal_sales,
             x='Seasonality',
@@ -225,10 +345,14 @@ def show_dashboard(df):
             text='Units Sold'
         )
         fig_seasonal.update_traces(texttemplate='%{text:,}', textposition='outside')
-        st.plotly_chart(fig_seasonal, use_container_width=True)
-    
-    with tab4:
-        st.subheader("Inventory Level Analysis")
+        return fig_seasonal
+    plotly_chart('dashboard.seasonal', data_key(df), build_seasonal)
+
+
+def _inventory(df, data, sketches):
+    """Inventory histogram and inventory/sales scatter"""
+    st.subheader("Inventory Level Analysis")
+    def build_inv_hist():
         fig_inv_hist = px.histogram(
             df,
             x='Inventory Level',
@@ -236,10 +360,12 @@ def show_dashboard(df):
             title="Distribution of Inventory Levels",
             color_discrete_sequence=['#FF6B6B']
         )
-        st.plotly_chart(fig_inv_hist, use_container_width=True)
-        
-        st.subheader("Inventory Level vs Sales Relationship")
-        sample_df = df.sample(min(5000, len(df)))
+        return fig_inv_hist
+    plotly_chart('dashboard.inv_hist', data_key(df), build_inv_hist)
+    
+    st.subheader("Inventory Level vs Sales Relationship")
+    def build_scatter():
+        sample_df = data()['sample_df']
         fig_scatter = px.scatter(
             sample_df,
             x='Inventory Level',
@@ -249,14 +375,15 @@ def show_dashboard(df):
             hover_data=['Product ID', 'Discount'],
             title="How does inventory level relate to sales?",
         )
-        st.plotly_chart(fig_scatter, use_container_width=True)
-    
-    with tab5:
-        st.subheader("Demand Level Distribution")
-        df['Demand_Level'] = pd.qcut(df['Units Ordered'], q=3, labels=['Low', 'Medium', 'High'])
-        demand_dist = df['Demand_Level'].value_counts().reset_index()
-        demand_dist.columns = ['Demand Level', 'Count']
-        
+        return fig_scatter
+    plotly_chart('dashboard.scatter', data_key(df), build_scatter)
+
+
+def _demand_patterns(df, data, sketches):
+    """Demand level pie and per-category bars"""
+    st.subheader("Demand Level Distribution")
+    def build_demand_pie():
+        demand_dist, _ = data()['demand_breakdown']
         fig_demand_pie = px.pie(
             demand_dist,
             values='Count',
@@ -270,12 +397,16 @@ def show_dashboard(df):
             }
         )
         fig_demand_pie.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig_demand_pie, use_container_width=True)
-        
-        st.subheader("Demand Levels by Category")
-        demand_category = pd.crosstab(df['Category'], df['Demand_Level'])
+        return fig_demand_pie
+    plotly_chart('dashboard.demand_pie', data_key(df), build_demand_pie, params=(sketches is not None,))
+    if sketches is not None:
+        st.caption(f"Level boundaries: {approximation_note(sketches, 'quantile')}")
+    
+    st.subheader("Demand Levels by Category")
+    def build_demand_cat():
+        _, demand_category = data()['demand_breakdown']
         fig_demand_cat = px.bar(
-            demand_category.reset_index().melt(id_vars='Category', var_name='Demand Level', value_name='Count'),
+            demand_category,
             x='Category',
             y='Count',
             color='Demand Level',
@@ -287,36 +418,137 @@ def show_dashboard(df):
             },
             barmode='group'
         )
-        st.plotly_chart(fig_demand_cat, use_container_width=True)
-    
-    # Summary Insights
-    st.markdown("---")
-    st.header(" Key Business Insights")
-    
-    insight_col1, insight_col2 = st.columns(2)
-    
-    with insight_col1:
-        st.subheader(" Top Performing Categories")
-        top_categories = df.groupby('Category')['Units Sold'].sum().sort_values(ascending=False).head(3)
-        for i, (cat, sales) in enumerate(top_categories.items(), 1):
-            st.write(f"{i}. **{cat}**: {sales:,} units sold")
-        
-        st.subheader(" Best Performing Regions")
-        top_regions = df.groupby('Region')['Units Sold'].sum().sort_values(ascending=False)
-        for i, (region, sales) in enumerate(top_regions.items(), 1):
-            st.write(f"{i}. **{region}**: {sales:,} units sold")
-    
-    with insight_col2:
-        st.subheader(" Seasonal Insights")
-        seasonal_avg = df.groupby('Seasonality')['Units Sold'].mean()
-        best_season = seasonal_avg.idxmax()
-        worst_season = seasonal_avg.idxmin()
-        st.write(f"**Best Season**: {best_season} (Avg: {seasonal_avg[best_season]:.0f} units/day)")
-        st.write(f"**Slowest Season**: {worst_season} (Avg: {seasonal_avg[worst_season]:.0f} units/day)")
-        
-        st.subheader(" Pricing Insights")
-        avg_price = df['Price'].mean()
-        avg_discount = df['Discount'].mean()
-        st.write(f"**Average Price**: ${avg_price:.2f}")
-        st.write(f"**Average Discount**: {avg_discount:.1f}%")
-        st.write(f"**Products with Discount**: {(df['Discount'] > 0).sum() / len(df) * 100:.1f}%")
\ No newline at end of file
+        return fig_demand_cat
+    plotly_chart('dashboard.demand_cat', data_key(df), build_demand_cat, params=(sketches is not None,))
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _scenario_model(key, model, _df):
+    return demand_model.load_or_train(_df, key, model)
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def _scenario_results(version, store, product, prices, discounts, holidays, weathers, _ensemble, _df):
+    return demand_model.scenario_grid(_ensemble, _df, store, product, prices, discounts, holidays, weathers)
+
+@st.fragment
+def _scenarios(df, data, sketches):
+    """Demand and revenue response to price and discount for one store/product"""
+    st.subheader("What-if Price & Discount Scenarios")
+    # The model is trained and keyed on the full dataset, whatever date range is shown;
+    # the view only supplies the store/product choices and the elasticity cross-check
+    base = st.session_state.get('df')
+    key = data_key(base) if base is not None else None
+    if key is None or data_key(df) is None:
+        st.warning("Scenarios need data loaded from the dataset.")
+        return
+
+    pairs = forecasting.feature_set(df, demand_model.HORIZON).keys
+    stores = sorted({store for store, _ in pairs})
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        store = st.selectbox("Store", stores, key='scenario_store')
+    with col2:
+        product = st.selectbox("Product", sorted(p for s, p in pairs if s == store), key='scenario_product')
+    with col3:
+        models = list(forecasting.ESTIMATORS)
+        model = st.selectbox("Model", models, index=models.index(demand_model.DEFAULT_MODEL), key='scenario_model')
+
+    col1, col2 = st.columns(2)
+    with col1:
+        low, high = st.slider("Price range ($)", 1.0, 200.0, (10.0, 100.0), key='scenario_prices')
+        steps = st.slider("Price steps", 5, 50, 19, key='scenario_price_steps')
+    with col2:
+        discounts = st.multiselect("Discounts (%)", [0, 5, 10, 15, 20, 25, 30], [0, 5, 10, 15, 20],
+                                   key='scenario_discounts')
+        sweep_holiday = st.checkbox("Compare holiday/promotion vs regular days", key='scenario_holiday')
+        sweep_weather = st.checkbox("Compare weather conditions", key='scenario_weather')
+    if not discounts:
+        st.info("Select at least one discount.")
+        return
+
+    try:
+        with st.spinner(f"Preparing {model} demand model..."):
+            ensemble, meta = _scenario_model(key, model, base)
+    except ValueError as error:
+        st.info(f"Not enough history for the demand model: {error}")
+        return
+    prices = tuple(np.round(np.linspace(low, high, steps), 2).tolist())
+    holidays = (0, 1) if sweep_holiday else None
+    weathers = tuple(meta['levels']['Weather Condition']) if sweep_weather else None
+    results = _scenario_results(meta['version'], store, product, prices, tuple(sorted(discounts)),
+                                holidays, weathers, ensemble, base)
+    trained = (f"updated from {meta['parent']} on {meta['trained_rows']:,} recent rows" if meta.get('mode') == 'update'
+               else f"trained on {meta['trained_rows']:,} rows")
+    st.caption(f"{len(results):,} scenarios for the day after {meta['trained_through'][:10]} · "
+               f"model {model} {meta['version']} {trained}")
+
+    best = results.loc[results['Revenue'].idxmax()]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Best Price", f"${best['Price']:.2f}", f"{best['Discount']:.0f}% discount", delta_color='off')
+    col2.metric("Predicted Demand", f"{best['Demand']:.0f} units")
+    col3.metric("Predicted Revenue", f"${best['Revenue']:,.0f}")
+
+    # Cross-check with the pair's log-log elasticity model, moved from its latest price and discount
+    latest = df[(df['Store ID'] == store) & (df['Product ID'] == product)].iloc[-1]
+    estimates = price_elasticities(df, by_region=True)
+    selected = estimates[(estimates['Product ID'] == product) & (estimates['Region'] == latest['Region'])]
+    estimate = selected.iloc[0] if len(selected) > 0 else None
+    if estimate is None or not np.isfinite(estimate['Price Elasticity']):
+        st.caption(f"No elasticity estimate for {product} in {latest['Region']} in the selected date range")
+    else:
+        ratio = elasticity.demand_ratio(estimate, best['Price'], best['Discount'], latest['Price'], latest['Discount'])
+        st.caption(
+            f"Elasticity model for {product} in {latest['Region']}: price elasticity "
+            f"{estimate['Price Elasticity']:+.2f} (±{estimate['Price Elasticity SE']:.2f}), "
+            f"{estimate['Discount Effect'] * 100:+.1f}% units per discount point; at the best price it expects "
+            f"{ratio - 1:+.0%} units vs the latest ${latest['Price']:.2f} with {latest['Discount']:.0f}% discount"
+        )
+
+    # One price x discount surface per holiday/weather combination
+    view = results
+    if sweep_holiday:
+        holiday = st.radio("Day type", [0, 1], horizontal=True, key='scenario_view_holiday',
+                           format_func=lambda value: "Holiday/promotion" if value else "Regular")
+        view = view[view['Holiday/Promotion'] == holiday]
+    if sweep_weather:
+        weather = st.radio("Weather", list(weathers), horizontal=True, key='scenario_view_weather')
+        view = view[view['Weather Condition'] == weather]
+    params = (model, store, product, prices, tuple(sorted(discounts)), holidays, weathers,
+              view['Holiday/Promotion'].iloc[0], view['Weather Condition'].iloc[0])
+
+    col1, col2 = st.columns(2)
+    for column, metric, scale in ((col1, 'Demand', 'Blues'), (col2, 'Revenue', 'Greens')):
+        def build_surface(metric=metric, scale=scale):
+            surface = view.pivot(index='Discount', columns='Price', values=metric)
+            fig = px.imshow(
+                surface,
+                aspect='auto',
+                origin='lower',
+                color_continuous_scale=scale,
+                labels={'x': 'Price ($)', 'y': 'Discount (%)', 'color': metric},
+                title=f"Predicted {metric.lower()} by price and discount",
+            )
+            return fig
+        with column:
+            plotly_chart(f'dashboard.scenario_{metric.lower()}', key, build_surface, params=params)
+
+    st.markdown("**Top scenarios by revenue**")
+    st.dataframe(
+        results.nlargest(10, 'Revenue'),
+        column_config={
+            'Price': st.column_config.NumberColumn(format="$%.2f"),
+            'Discount': st.column_config.NumberColumn(format="%d%%"),
+            'Demand': st.column_config.NumberColumn(format="%.0f"),
+            'Revenue': st.column_config.NumberColumn(format="$%.0f"),
+        },
+        hide_index=True,
+        use_container_width=True,
+    )
+
+SECTIONS = {
+    ' Sales Overview': _sales_overview,
+    ' Store & Region': _store_region,
+    ' Time Trends': _time_trends,
+    ' Inventory': _inventory,
+    ' Demand Patterns': _demand_patterns,
+    ' What-if Scenarios': _scenarios,
+}
@@ -1,7 +1,12 @@
 # web_app/pages/products.py
 import streamlit as st
-import pandas as pd
-import plotly.express as px
+import analytics
+from startup import lazy_import
+from utils import data_key, shard_summary
+from figure_cache import lazy, plotly_chart
+from forecast_table import FORECASTS, add_overlay
+
+px = lazy_import('plotly.express')
 
 def show_products(df):
     """Display products list and inventory management page"""
@@ -46,14 +51,15 @@ def show_products(df):
         )
     
     # Apply filters
-    filtered_df = df.copy()
-    
-    if selected_categories:
-        filtered_df = filtered_df[filtered_df['Category'].isin(selected_categories)]
-    if selected_regions:
-        filtered_df = filtered_df[filtered_df['Region'].isin(selected_regions)]
-    if selected_stores:
-        filtered_df = filtered_df[filtered_df['Store ID'].isin(selected_stores)]
+    filtered_df = analytics.filter_records(
+        df,
+        categories=selected_categories,
+        regions=selected_regions,
+        stores=selected_stores
+    )
+    # Charts below are cached per data version and filter selection
+    chart_data = data_key(df)
+    filters = (selected_categories, selected_regions, selected_stores)
     
     st.markdown("---")
     
@@ -61,50 +67,29 @@ def show_products(df):
     st.header("📊 Product Summary")
     
     summary_col1, summary_col2, summary_col3, summary_col4 = st.columns(4)
+    # With parallel aggregation on, totals and per-category/store rollups come from store shards
+    shards = shard_summary(df, selected_categories, selected_regions, selected_stores)
+    totals = shards.product_totals() if shards is not None else analytics.product_totals(filtered_df)
     
     with summary_col1:
-        unique_products = filtered_df['Product ID'].nunique()
-        st.metric("Total Products", unique_products)
+        st.metric("Total Products", totals['unique_products'])
     
     with summary_col2:
-        total_inventory = filtered_df['Inventory Level'].sum()
-        st.metric("Total Inventory", f"{total_inventory:,}")
+        st.metric("Total Inventory", f"{totals['total_inventory']:,}")
     
     with summary_col3:
-        avg_price = filtered_df['Price'].mean()
-        st.metric("Average Price", f"${avg_price:.2f}")
+        st.metric("Average Price", f"${totals['avg_price']:.2f}")
     
     with summary_col4:
-        total_sales = filtered_df['Units Sold'].sum()
-        st.metric("Total Sales", f"{total_sales:,}")
+        st.metric("Total Sales", f"{totals['total_sales']:,}")
     
     st.markdown("---")
     
     # Product Details Table
     st.header("📋 Product Details")
     
-    # Create aggregated product view
-    product_summary = filtered_df.groupby(['Product ID', 'Category']).agg({
-        'Inventory Level': 'mean',
-        'Units Sold': 'sum',
-        'Units Ordered': 'sum',
-        'Price': 'mean',
-        'Discount': 'mean',
-        'Store ID': 'nunique',
-        'Region': lambda x: ', '.join(x.unique()[:3])  # Show first 3 regions
-    }).reset_index()
-    
-    product_summary.columns = [
-        'Product ID', 'Category', 'Avg Inventory', 'Total Units Sold', 
-        'Total Units Ordered', 'Avg Price', 'Avg Discount', 'Stores', 'Regions'
-    ]
-    
-    # Add demand level
-    product_summary['Demand Level'] = pd.qcut(
-        product_summary['Total Units Ordered'], 
-        q=3, 
-        labels=['Low', 'Medium', 'High']
-    )
+    # Create aggregated product view with demand level
+    product_summary = analytics.product_summary(filtered_df)
     
     # Sort options
     sort_col1, sort_col2 = st.columns(2)
@@ -156,99 +141,95 @@ def show_products(df):
     with chart_tab1:
         st.subheader("Product Performance by Category")
         
-        category_stats = filtered_df.groupby('Category').agg({
-            'Units Sold': 'sum',
-            'Inventory Level': 'mean',
-            'Price': 'mean'
-        }).reset_index()
+        category_stats = lazy(shards.category_stats) if shards is not None else lazy(analytics.category_stats, filtered_df)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            fig_sales = px.bar(
-                category_stats,
-                x='Category',
-                y='Units Sold',
-                title="Total Sales by Category",
-                color='Units Sold',
-                color_continuous_scale='Blues',
-                text='Units Sold'
-            )
-            fig_sales.update_traces(texttemplate='%{text:,}', textposition='outside')
-            st.plotly_chart(fig_sales, use_container_width=True)
+            def build_sales():
+                fig_sales = px.bar(
+                    category_stats(),
+                    x='Category',
+                    y='Units Sold',
+                    title="Total Sales by Category",
+                    color='Units Sold',
+                    color_continuous_scale='Blues',
+                    text='Units Sold'
+                )
+                fig_sales.update_traces(texttemplate='%{text:,}', textposition='outside')
+                return fig_sales
+            plotly_chart('products.sales', chart_data, build_sales, params=filters)
         
         with col2:
-            fig_inv = px.bar(
-                category_stats,
-                x='Category',
-                y='Inventory Level',
-                title="Average Inventory by Category",
-                color='Inventory Level',
-                color_continuous_scale='Greens',
-                text='Inventory Level'
-            )
-            fig_inv.update_traces(texttemplate='%{text:.0f}', textposition='outside')
-            st.plotly_chart(fig_inv, use_container_width=True)
+            def build_inv():
+                fig_inv = px.bar(
+                    category_stats(),
+                    x='Category',
+                    y='Inventory Level',
+                    title="Average Inventory by Category",
+                    color='Inventory Level',
+                    color_continuous_scale='Greens',
+                    text='Inventory Level'
+                )
+                fig_inv.update_traces(texttemplate='%{text:.0f}', textposition='outside')
+                return fig_inv
+            plotly_chart('products.inv', chart_data, build_inv, params=filters)
     
     with chart_tab2:
         st.subheader("Product Performance by Store")
         
-        store_stats = filtered_df.groupby('Store ID').agg({
-            'Units Sold': 'sum',
-            'Product ID': 'nunique',
-            'Inventory Level': 'mean'
-        }).reset_index()
-        store_stats.columns = ['Store ID', 'Total Sales', 'Unique Products', 'Avg Inventory']
+        store_stats = lazy(shards.store_stats) if shards is not None else lazy(analytics.store_stats, filtered_df)
         
         col1, col2 = st.columns(2)
         
         with col1:
-            fig_store_sales = px.bar(
-                store_stats,
-                x='Store ID',
-                y='Total Sales',
-                title="Total Sales by Store",
-                color='Total Sales',
-                color_continuous_scale='Purples',
-                text='Total Sales'
-            )
-            fig_store_sales.update_traces(texttemplate='%{text:,}', textposition='outside')
-            st.plotly_chart(fig_store_sales, use_container_width=True)
+            def build_store_sales():
+                fig_store_sales = px.bar(
+                    store_stats(),
+                    x='Store ID',
+                    y='Total Sales',
+                    title="Total Sales by Store",
+                    color='Total Sales',
+                    color_continuous_scale='Purples',
+                    text='Total Sales'
+                )
+                fig_store_sales.update_traces(texttemplate='%{text:,}', textposition='outside')
+                return fig_store_sales
+            plotly_chart('products.store_sales', chart_data, build_store_sales, params=filters)
         
         with col2:
-            fig_store_products = px.bar(
-                store_stats,
-                x='Store ID',
-                y='Unique Products',
-                title="Number of Products by Store",
-                color='Unique Products',
-                color_continuous_scale='Oranges',
-                text='Unique Products'
-            )
-            fig_store_products.update_traces(texttemplate='%{text:.0f}', textposition='outside')
-            st.plotly_chart(fig_store_products, use_container_width=True)
+            def build_store_products():
+                fig_store_products = px.bar(
+                    store_stats(),
+                    x='Store ID',
+                    y='Unique Products',
+                    title="Number of Products by Store",
+                    color='Unique Products',
+                    color_continuous_scale='Oranges',
+                    text='Unique Products'
+                )
+                fig_store_products.update_traces(texttemplate='%{text:.0f}', textposition='outside')
+                return fig_store_products
+            plotly_chart('products.store_products', chart_data, build_store_products, params=filters)
     
     with chart_tab3:
         st.subheader("Price Analysis")
         
-        price_analysis = filtered_df.groupby('Category').agg({
-            'Price': ['mean', 'min', 'max'],
-            'Discount': 'mean',
-            'Units Sold': 'sum'
-        }).reset_index()
-        price_analysis.columns = ['Category', 'Avg Price', 'Min Price', 'Max Price', 'Avg Discount', 'Total Sales']
+        price_analysis = shards.price_analysis() if shards is not None else analytics.price_analysis(filtered_df)
         
-        fig_price_range = px.scatter(
-            price_analysis,
-            x='Avg Price',
-            y='Total Sales',
-            size='Avg Discount',
-            color='Category',
-            hover_data=['Min Price', 'Max Price'],
-            title="Price vs Sales Performance",
-            labels={'Avg Price': 'Average Price ($)', 'Total Sales': 'Total Units Sold'}
-        )
-        st.plotly_chart(fig_price_range, use_container_width=True)
+        def build_price_range():
+            fig_price_range = px.scatter(
+                price_analysis,
+                x='Avg Price',
+                y='Total Sales',
+                size='Avg Discount',
+                color='Category',
+                hover_data=['Min Price', 'Max Price'],
+                title="Price vs Sales Performance",
+                labels={'Avg Price': 'Average Price ($)', 'Total Sales': 'Total Units Sold'}
+            )
+            return fig_price_range
+        plotly_chart('products.price_range', chart_data, build_price_range, params=filters)
         
         st.dataframe(
             price_analysis,
@@ -267,42 +248,46 @@ def show_products(df):
     )
     
     if selected_product:
-        product_details = filtered_df[filtered_df['Product ID'] == selected_product]
+        product_details = analytics.product_records(filtered_df, selected_product)
+        detail = analytics.product_detail(product_details)
         
         detail_col1, detail_col2 = st.columns(2)
         
         with detail_col1:
             st.subheader("Product Information")
             st.write(f"**Product ID**: {selected_product}")
-            st.write(f"**Category**: {product_details['Category'].iloc[0]}")
-            st.write(f"**Average Price**: ${product_details['Price'].mean():.2f}")
-            st.write(f"**Average Discount**: {product_details['Discount'].mean():.1f}%")
-            st.write(f"**Available in**: {product_details['Store ID'].nunique()} stores")
-            st.write(f"**Regions**: {', '.join(product_details['Region'].unique())}")
+            st.write(f"**Category**: {detail['category']}")
+            st.write(f"**Average Price**: ${detail['avg_price']:.2f}")
+            st.write(f"**Average Discount**: {detail['avg_discount']:.1f}%")
+            st.write(f"**Available in**: {detail['store_count']} stores")
+            st.write(f"**Regions**: {', '.join(detail['regions'])}")
         
         with detail_col2:
             st.subheader("Performance Metrics")
-            st.write(f"**Total Units Sold**: {product_details['Units Sold'].sum():,}")
-            st.write(f"**Total Units Ordered**: {product_details['Units Ordered'].sum():,}")
-            st.write(f"**Average Inventory**: {product_details['Inventory Level'].mean():.0f}")
-            st.write(f"**Total Revenue**: ${(product_details['Units Sold'] * product_details['Price'] * (1 - product_details['Discount']/100)).sum():,.2f}")
+            st.write(f"**Total Units Sold**: {detail['total_units_sold']:,}")
+            st.write(f"**Total Units Ordered**: {detail['total_units_ordered']:,}")
+            st.write(f"**Average Inventory**: {detail['avg_inventory']:.0f}")
+            st.write(f"**Total Revenue**: ${detail['total_revenue']:,.2f}")
         
         # Product timeline
         st.subheader("Sales Timeline")
-        product_timeline = product_details.groupby('Date').agg({
-            'Units Sold': 'sum',
-            'Inventory Level': 'mean',
-            'Price': 'mean'
-        }).reset_index().sort_values('Date')
+        product_timeline = lazy(analytics.product_timeline, product_details)
+        forecasts = FORECASTS.for_frame(df)
         
-        fig_timeline = px.line(
-            product_timeline,
-            x='Date',
-            y='Units Sold',
-            title=f"Sales Over Time for {selected_product}",
-            markers=True
-        )
-        st.plotly_chart(fig_timeline, use_container_width=True)
+        def build_timeline():
+            fig_timeline = px.line(
+                product_timeline(),
+                x='Date',
+                y='Units Sold',
+                title=f"Sales Over Time for {selected_product}",
+                markers=True
+            )
+            if forecasts is not None:
+                rows = forecasts.rows(stores=product_details['Store ID'].unique(), products=[selected_product])
+                add_overlay(fig_timeline, forecasts.total(rows))
+            return fig_timeline
+        plotly_chart('products.timeline', chart_data, build_timeline,
+                     params=filters + (selected_product, forecasts.meta['built_at'] if forecasts is not None else None))
         
         # Product details table
         st.subheader("All Records for This Product")
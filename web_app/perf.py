@@ -0,0 +1,170 @@
+# web_app/perf.py
+# In-process instrumentation for hot paths. Code wraps work in
+# `with span('name', rows=n):` (or decorates it with @timed) and every run
+# records wall time, rows processed and the peak memory growth while it ran.
+# The last WINDOW samples per span are kept in memory for the whole server
+# process, so the Admin page sees timings from every session.
+import collections
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+WINDOW = 500
+
+_lock = threading.Lock()
+_samples = collections.defaultdict(lambda: collections.deque(maxlen=WINDOW))
+_local = threading.local()
+
+
+def enable_memory_tracing():
+    """Measure memory with tracemalloc instead of the RSS high-water mark.
+
+    Gives per-span allocation peaks, at the cost of slower allocations.
+    Enabled by the app when RETAIL_TRACE_MEMORY=1.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def memory_mode():
+    return 'tracemalloc' if tracemalloc.is_tracing() else 'rss-peak'
+
+
+def _rss_peak_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def span(name, rows=None):
+    """Time a block of work and record it under `name`.
+
+    Yields a dict; set its 'rows' key inside the block when the row count
+    is only known afterwards. The memory figure is the growth of the peak
+    over the span: the tracemalloc peak when tracing is enabled, otherwise
+    the process RSS high-water mark (which only moves on new peaks).
+    Under concurrent sessions tracemalloc peaks are approximate because
+    the peak counter is process-wide.
+    """
+    stack = _stack()
+    frame = {'peak': 0}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            # Keep the parent's peak so far before resetting the shared counter
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['start'] = current
+    else:
+        frame['start'] = _rss_peak_bytes()
+    stack.append(frame)
+
+    record = {'rows': rows}
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - started
+        stack.pop()
+        if tracing and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame['peak'])
+            memory_delta = max(0, peak - frame['start'])
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        else:
+            memory_delta = _rss_peak_bytes() - frame['start']
+        record_sample(name, elapsed, record['rows'], memory_delta)
+
+
+def timed(name=None):
+    """Decorator recording a span per call; rows default to len() of the first argument"""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = None
+            if args and hasattr(args[0], '__len__'):
+                rows = len(args[0])
+            with span(span_name, rows=rows):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_sample(name, seconds, rows=None, memory_delta=0):
+    sample = {
+        'span': name,
+        'ts': time.time(),
+        'seconds': seconds,
+        'rows': rows,
+        'memory_delta_bytes': int(memory_delta),
+        'thread': threading.current_thread().name,
+    }
+    with _lock:
+        _samples[name].append(sample)
+    log_path = os.environ.get('RETAIL_PERF_LOG')
+    if log_path:
+        with open(log_path, 'a') as f:
+            f.write(json.dumps(sample) + '\n')
+
+
+def samples(name=None):
+    """Recorded samples, oldest first, for one span or all of them"""
+    with _lock:
+        if name is not None:
+            return list(_samples.get(name, []))
+        return [sample for window in _samples.values() for sample in window]
+
+
+def summary():
+    """Per-span count, p50/p95/p99 wall time, rows and memory, slowest p95 first"""
+    with _lock:
+        windows = {name: list(window) for name, window in _samples.items()}
+    rows = []
+    for name, window in windows.items():
+        if not window:
+            continue
+        seconds = np.array([sample['seconds'] for sample in window])
+        memory = np.array([sample['memory_delta_bytes'] for sample in window])
+        row_counts = [sample['rows'] for sample in window if sample['rows'] is not None]
+        p50, p95, p99 = np.percentile(seconds, [50, 95, 99])
+        rows.append({
+            'span': name,
+            'count': len(window),
+            'p50_ms': p50 * 1000,
+            'p95_ms': p95 * 1000,
+            'p99_ms': p99 * 1000,
+            'max_ms': seconds.max() * 1000,
+            'avg_rows': float(np.mean(row_counts)) if row_counts else None,
+            'peak_memory_mb': memory.max() / 1e6,
+            'last_seen': window[-1]['ts'],
+        })
+    return sorted(rows, key=lambda row: row['p95_ms'], reverse=True)
+
+
+def export_jsonl(name=None):
+    """All recorded samples as JSON lines, ready for a log shipper"""
+    return ''.join(json.dumps(sample) + '\n' for sample in samples(name))
+
+
+def reset():
+    with _lock:
+        _samples.clear()
@@ -0,0 +1,195 @@
+# web_app/profiler.py
+# Low-overhead sampling profiler for a running server. A background thread
+# periodically reads the Python stacks of the app's script threads (one per
+# browser session) and counts identical stacks. Results are offered as a
+# collapsed-stack file (flamegraph.pl / speedscope format) and a table of
+# the hottest functions. The sampler measures its own cost and backs off
+# its sampling interval to stay under a fixed share of wall time.
+import collections
+import os
+import sys
+import threading
+import time
+
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame):
+    """Stack from the outermost call to `frame`, as a tuple of labels"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return tuple(reversed(labels))
+
+
+class SamplingProfiler:
+    """Process-wide stack sampler started and stopped from the Admin page.
+
+    A capture ends after a number of seconds, after a number of completed
+    script runs (across all sessions), or when stopped explicitly.
+    """
+
+    def __init__(self, interval=0.005, max_overhead=0.02, thread_prefix='ScriptRunner'):
+        self.base_interval = interval
+        self.max_overhead = max_overhead
+        self.thread_prefix = thread_prefix
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._all_threads = False
+        self._reset_state()
+
+    def _reset_state(self):
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.interval = self.base_interval
+        self.sampling_seconds = 0.0
+        self.started_at = None
+        self.stopped_at = None
+        self.deadline = None
+        self.reruns_left = None
+        self._starting_thread = None
+
+    # ------------------------------------------------------------------ #
+    # Control
+    # ------------------------------------------------------------------ #
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds=None, reruns=None, interval=None, all_threads=False):
+        """Begin a new capture, discarding the previous one"""
+        with self._lock:
+            if self.running:
+                return False
+            self._reset_state()
+            if interval is not None:
+                self.base_interval = self.interval = interval
+            self.started_at = time.time()
+            self.deadline = None if seconds is None else time.perf_counter() + seconds
+            self.reruns_left = reruns
+            # The run that pressed "start" should not count towards `reruns`
+            self._starting_thread = threading.get_ident()
+            self._all_threads = all_threads
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=1)
+
+    def note_rerun(self):
+        """Called at the end of every script run; ends rerun-bounded captures"""
+        with self._lock:
+            if self.reruns_left is None or not self.running:
+                return
+            if self._starting_thread == threading.get_ident():
+                self._starting_thread = None
+                return
+            self.reruns_left -= 1
+            if self.reruns_left <= 0:
+                self._stop.set()
+
+    # ------------------------------------------------------------------ #
+    # Sampling loop
+    # ------------------------------------------------------------------ #
+    def _sampled_threads(self):
+        own = threading.get_ident()
+        if self._all_threads:
+            return {ident for ident in sys._current_frames() if ident != own}
+        return {
+            thread.ident for thread in threading.enumerate()
+            if thread.name.startswith(self.thread_prefix) and thread.ident != own
+        }
+
+    def _run(self):
+        loop_started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                if self.deadline is not None and time.perf_counter() >= self.deadline:
+                    break
+                # CPU time of this thread, so waiting for the GIL is not counted as overhead
+                sample_started = time.thread_time()
+                wanted = self._sampled_threads()
+                frames = sys._current_frames()
+                for ident in wanted:
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self.stacks[_collapse(frame)] += 1
+                        self.samples += 1
+                del frames
+                self.sampling_seconds += time.thread_time() - sample_started
+
+                # Back off when the sampler's own cost exceeds its budget and
+                # return towards the requested interval once it is well below it
+                elapsed = time.perf_counter() - loop_started
+                if elapsed > 0.25:
+                    overhead = self.sampling_seconds / elapsed
+                    if overhead > self.max_overhead:
+                        self.interval = min(self.interval * 1.5, 0.5)
+                    elif overhead < self.max_overhead / 2 and self.interval > self.base_interval:
+                        self.interval = max(self.base_interval, self.interval / 1.2)
+                self._stop.wait(self.interval)
+        finally:
+            self.stopped_at = time.time()
+
+    # ------------------------------------------------------------------ #
+    # Results
+    # ------------------------------------------------------------------ #
+    def status(self):
+        end = time.time() if self.running or self.stopped_at is None else self.stopped_at
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            'running': self.running,
+            'samples': self.samples,
+            'distinct_stacks': len(self.stacks),
+            'elapsed_seconds': elapsed,
+            'interval_ms': self.interval * 1000,
+            'overhead_pct': self.sampling_seconds / elapsed * 100 if elapsed > 0 else 0.0,
+            'overhead_budget_pct': self.max_overhead * 100,
+            'reruns_left': self.reruns_left,
+        }
+
+    def collapsed(self):
+        """Collapsed stacks ('outer;...;inner count' per line) for flamegraph tools"""
+        stacks = dict(self.stacks)
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(stacks.items()))
+
+    def top_functions(self, limit=25):
+        """Functions by self samples (leaf of the stack) and total samples (anywhere on it)"""
+        stacks = dict(self.stacks)
+        total = sum(stacks.values())
+        self_counts = collections.Counter()
+        total_counts = collections.Counter()
+        for stack, count in stacks.items():
+            if not stack:
+                continue
+            self_counts[stack[-1]] += count
+            for label in set(stack):
+                total_counts[label] += count
+        rows = [
+            {
+                'function': label,
+                'self_samples': self_counts[label],
+                'total_samples': count,
+                'self_pct': self_counts[label] / total * 100 if total else 0.0,
+                'total_pct': count / total * 100 if total else 0.0,
+            }
+            for label, count in total_counts.items()
+        ]
+        rows.sort(key=lambda row: (row['self_samples'], row['total_samples']), reverse=True)
+        return rows[:limit]
+
+
+# One profiler per server process, shared by every session
+PROFILER = SamplingProfiler()
@@ -0,0 +1,289 @@
+# web_app/series_store.py
+# Column store of the dataset laid out by series: every column is one
+# contiguous .npy file with rows sorted by (Store ID, Product ID, Date), and
+# offsets.npy marks where each store/product series starts. Worker
+# processes attach to a store by its path and memory-map the files, so a
+# series is a slice of pages shared through the OS page cache rather than a
+# pickled piece of the frame sent to every worker.
+#
+#   python series_store.py --scale 1m --jobs 4      # attach vs pickled-frame comparison
+#
+# Text columns are stored as int16 codes with their labels in meta.json.
+# No streamlit import, like analytics.
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from datastore import frame_checksum, frame_version
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERIES_DIR = os.path.join(ROOT_DIR, 'data', 'series')
+META_FILE = 'meta.json'
+
+NUMERIC = ['Units Sold', 'Units Ordered', 'Price', 'Discount', 'Inventory Level',
+           'Competitor Pricing', 'Holiday/Promotion', 'Demand Forecast']
+CATEGORICAL = ['Category', 'Region', 'Weather Condition', 'Seasonality']
+# Stores kept under SERIES_DIR; older ones are removed when a new one is built
+MAX_STORES = 4
+
+# Stores already attached in this process, by path
+_ATTACHED = {}
+
+
+def _file_name(column):
+    return column.lower().replace(' ', '_').replace('/', '_') + '.npy'
+
+
+class SeriesStore:
+    """Read-only, memory-mapped view of a store directory"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.stores = np.load(os.path.join(path, 'stores.npy'))
+        self.products = np.load(os.path.join(path, 'products.npy'))
+        self.levels = self.meta['levels']
+        self._columns = {'Date': np.load(os.path.join(path, 'date.npy'), mmap_mode='r')}
+        for column in self.meta['columns']:
+            self._columns[column] = np.load(os.path.join(path, _file_name(column)), mmap_mode='r')
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, column):
+        """Whole memory-mapped column, in series order"""
+        return self._columns[column]
+
+    @property
+    def n_rows(self):
+        return int(self.offsets[-1])
+
+    def index(self, store, product):
+        """Position of a store/product series, or None"""
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(zip(self.stores.tolist(), self.products.tolist()))}
+        return self._index.get((store, product))
+
+    def rows(self, i):
+        """Row slice of series `i`"""
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def series(self, i, columns=None):
+        """Views (no copy) of the columns of series `i`, with 'Date'"""
+        rows = self.rows(i)
+        return {column: self._columns[column][rows] for column in ['Date'] + list(columns or self.meta['columns'])}
+
+    def frame(self, i, columns=None):
+        """Series `i` as a DataFrame (copied), text columns decoded"""
+        data = self.series(i, columns)
+        df = pd.DataFrame({column: np.asarray(values) for column, values in data.items()})
+        for column in CATEGORICAL:
+            if column in df:
+                df[column] = np.asarray(self.levels[column], dtype=object)[df[column]]
+        df.insert(1, 'Store ID', self.stores[i])
+        df.insert(2, 'Product ID', self.products[i])
+        return df
+
+    @classmethod
+    def build(cls, df, path):
+        """Write `df` as a store at `path`, replacing any store already there"""
+        stores, store_codes = np.unique(df['Store ID'].to_numpy(dtype=str), return_inverse=True)
+        products, product_codes = np.unique(df['Product ID'].to_numpy(dtype=str), return_inverse=True)
+        dates = df['Date'].to_numpy().astype('datetime64[D]')
+        order = np.lexsort((dates, product_codes, store_codes))
+        series_codes = (store_codes * len(products) + product_codes)[order]
+        starts = np.flatnonzero(np.r_[True, series_codes[1:] != series_codes[:-1]]) if len(order) else np.array([], int)
+        offsets = np.append(starts, len(order)).astype(np.int64)
+        first = series_codes[starts]
+
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        np.save(os.path.join(tmp_path, 'offsets.npy'), offsets)
+        np.save(os.path.join(tmp_path, 'stores.npy'), stores[first // len(products)] if len(products) else stores)
+        np.save(os.path.join(tmp_path, 'products.npy'), products[first % len(products)] if len(products) else products)
+        np.save(os.path.join(tmp_path, 'date.npy'), dates[order])
+        columns, levels = [], {}
+        for column in NUMERIC + CATEGORICAL:
+            if column not in df:
+                continue
+            if column in CATEGORICAL:
+                codes, labels = pd.factorize(df[column], sort=True)
+                values = codes.astype(np.int16)
+                levels[column] = [str(label) for label in labels]
+            else:
+                values = df[column].to_numpy()
+            np.save(os.path.join(tmp_path, _file_name(column)), values[order])
+            columns.append(column)
+        meta = {
+            'columns': columns,
+            'levels': levels,
+            'rows': int(len(order)),
+            'series': int(len(starts)),
+            'first_date': str(dates.min()) if len(dates) else None,
+            'last_date': str(dates.max()) if len(dates) else None,
+        }
+        with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=1)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+
+def store_key(df):
+    """Name of the store for a frame: its data version and the rows it covers"""
+    version = frame_version(df) or frame_checksum(df)
+    first, last = (str(df['Date'].iloc[0]), str(df['Date'].iloc[-1])) if len(df) else ('', '')
+    return hashlib.sha1(f"{version}:{first}:{last}:{len(df)}".encode()).hexdigest()[:16]
+
+
+def for_frame(df, root=SERIES_DIR):
+    """Store holding the rows of `df`, built on first use"""
+    path = os.path.join(root, store_key(df))
+    if not os.path.exists(os.path.join(path, META_FILE)):
+        os.makedirs(root, exist_ok=True)
+        SeriesStore.build(df, path)
+        existing = sorted(
+            (entry for entry in os.scandir(root) if entry.is_dir() and not entry.name.endswith('.tmp')),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in existing[:-MAX_STORES]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return attach(path)
+
+
+def attach(path):
+    """The store at `path`, opened once per process"""
+    store = _ATTACHED.get(path)
+    if store is None:
+        store = _ATTACHED[path] = SeriesStore(path)
+    return store
+
+
+def _run_chunk(path, func, lo, hi, kwargs):
+    return func(attach(path), lo, hi, **kwargs)
+
+
+def map_series(store, func, jobs=-1, chunks=None, ranges=None, **kwargs):
+    """Results of `func(store, lo, hi, **kwargs)` over contiguous ranges of series.
+
+    The ranges are `chunks` equal splits unless given as (lo, hi) pairs.
+    Each joblib worker receives only the store path and a range, and
+    attaches to the memory-mapped files itself. `func` must be a
+    module-level function; results come back in range order.
+    """
+    if ranges is None:
+        if chunks is None:
+            chunks = 4 * (os.cpu_count() or 1)
+        bounds = np.unique(np.linspace(0, len(store), max(1, chunks) + 1).astype(int))
+        ranges = zip(bounds[:-1], bounds[1:])
+    return Parallel(n_jobs=jobs)(
+        delayed(_run_chunk)(store.path, func, int(lo), int(hi), kwargs)
+        for lo, hi in ranges
+    )
+
+
+def demand_profile(store, lo, hi, season=7):
+    """Per-series days, mean and standard deviation of Units Sold and the seasonal-naive WAPE.
+
+    Works on the contiguous block of series lo..hi at once: sums are
+    reduceat over the block and lagged differences are masked where the
+    lag crosses into the previous series.
+    """
+    rows = slice(int(store.offsets[lo]), int(store.offsets[hi]))
+    units = np.asarray(store['Units Sold'][rows], dtype=np.float64)
+    dates = store['Date'][rows]
+    lengths = np.diff(store.offsets[lo:hi + 1])
+    series = np.repeat(np.arange(hi - lo), lengths)
+    starts = store.offsets[lo:hi] - store.offsets[lo]
+
+    mean = np.add.reduceat(units, starts) / lengths
+    variance = np.add.reduceat(units ** 2, starts) / lengths - mean ** 2
+    same = series[season:] == series[:-season]
+    error = np.bincount(series[season:][same], np.abs(units[season:] - units[:-season])[same], minlength=hi - lo)
+    actual = np.bincount(series[season:][same], units[season:][same], minlength=hi - lo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wape = np.where(actual > 0, error / actual * 100, np.nan)
+    return pd.DataFrame({
+        'Store ID': store.stores[lo:hi],
+        'Product ID': store.products[lo:hi],
+        'Days': lengths,
+        'First Date': dates[starts],
+        'Last Date': dates[starts + lengths - 1],
+        'Mean Units': mean,
+        'Std Units': np.sqrt(np.maximum(variance, 0)),
+        'Seasonal Naive WAPE': wape,
+    })
+
+
+def _frame_profile(part, season=7):
+    """demand_profile computed from a pickled slice of the frame, for comparison"""
+    part = part.sort_values(['Store ID', 'Product ID', 'Date'])
+    grouped = part.groupby(['Store ID', 'Product ID'], sort=True)
+    units = part['Units Sold'].astype(np.float64)
+    lagged = grouped['Units Sold'].shift(season)
+    valid = lagged.notna()
+    profile = grouped['Units Sold'].agg(['size', 'mean', lambda values: values.std(ddof=0)])
+    error = (units - lagged).abs()[valid].groupby([part['Store ID'], part['Product ID']]).sum()
+    actual = units[valid].groupby([part['Store ID'], part['Product ID']]).sum()
+    profile['wape'] = error / actual * 100
+    return profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a series store and compare attaching with pickling the frame")
+    parser.add_argument('--scale', help="Benchmark dataset (10k, 100k, 1m, ...) instead of the app data")
+    parser.add_argument('--jobs', type=int, default=-1, help="Parallel workers (-1 = all cores)")
+    parser.add_argument('--chunks', type=int, help="Series ranges handed out (default: 4 per core)")
+    args = parser.parse_args(argv)
+
+    if args.scale:
+        import benchmark
+        df = benchmark.ensure_dataset(args.scale, benchmark.SCALES[args.scale]).read()
+    else:
+        from utils import open_dataset
+        df = open_dataset().read()
+
+    started = time.perf_counter()
+    store = for_frame(df)
+    build_seconds = time.perf_counter() - started
+    size = sum(entry.stat().st_size for entry in os.scandir(store.path))
+    print(f"{store.n_rows:,} rows, {len(store):,} series in {store.path} ({size / 1e6:.1f} MB, {build_seconds:.2f}s)")
+
+    started = time.perf_counter()
+    attached = pd.concat(map_series(store, demand_profile, args.jobs, args.chunks), ignore_index=True)
+    attach_seconds = time.perf_counter() - started
+
+    # The same work with each worker sent its rows of the frame
+    chunks = args.chunks or 4 * (os.cpu_count() or 1)
+    groups = pd.factorize(df['Store ID'].astype(str) + '\x1f' + df['Product ID'].astype(str), sort=True)[0]
+    parts = [df[groups % chunks == chunk] for chunk in range(chunks)]
+    payload = sum(len(pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL)) for part in parts)
+    started = time.perf_counter()
+    pickled = Parallel(n_jobs=args.jobs)(delayed(_frame_profile)(part) for part in parts)
+    pickle_seconds = time.perf_counter() - started
+
+    expected = pd.concat(pickled).sort_index()
+    matches = np.allclose(attached['Mean Units'], expected['mean']) and np.allclose(
+        attached['Seasonal Naive WAPE'], expected['wape'], equal_nan=True)
+    print(f"{'':<16} {'sent to workers':>16} {'wall s':>8}")
+    print(f"{'attached store':<16} {len(store.path) * chunks / 1e3:>13.1f} kB {attach_seconds:>8.2f}")
+    print(f"{'pickled frame':<16} {payload / 1e6:>13.1f} MB {pickle_seconds:>8.2f}")
+    print(f"Profiles match: {matches}")
+    return 0 if matches else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
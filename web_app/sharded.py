@@ -0,0 +1,472 @@
+# web_app/sharded.py
+# Map-reduce aggregation over store shards. The rows of a series store
+# (series_store.py, sorted by Store ID) are split into contiguous shards of
+# whole stores with about equal row counts. Each shard runs in a worker
+# process that attaches to the memory-mapped columns, applies the date range
+# and filters, and returns small partial aggregates: sums and counts per
+# category, region, store, day and season, store x product presence bits
+# and value histograms of the integer alert columns. Partials are merged by
+# adding (min/max/or for the others) into a ShardSummary, whose methods
+# return the same results as the analytics functions of the same name.
+#
+#   python sharded.py --scale 1m --jobs 4     # timings and a check against analytics
+#
+# Quantiles are exact: Inventory Level and Units Ordered are integers, so
+# merged histograms give the same linear interpolation as pandas.
+# No streamlit import, like analytics.
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import series_store
+from perf import span
+
+# Worker processes for the shards (-1 = all cores)
+SHARD_JOBS = int(os.environ.get('RETAIL_SHARD_JOBS', -1))
+
+# Computations a ShardSummary answers, by analytics function name
+COMPUTATIONS = (
+    'kpis', 'category_sales', 'category_average_sales', 'region_sales', 'store_sales',
+    'region_category_matrix', 'daily_sales', 'monthly_sales', 'seasonal_sales', 'business_insights',
+    'alert_thresholds', 'underperforming_stores', 'stockout_risk',
+    'product_totals', 'category_stats', 'store_stats', 'price_analysis',
+)
+HISTOGRAM_COLUMNS = ('Inventory Level', 'Units Ordered')
+
+
+def shard_ranges(store, shards):
+    """(lo, hi) series ranges of whole stores, cut where the row count is closest to an equal split"""
+    starts = np.flatnonzero(np.r_[True, store.stores[1:] != store.stores[:-1]]) if len(store) else np.array([0])
+    store_bounds = np.append(starts, len(store))
+    rows_before = store.offsets[store_bounds]
+    targets = np.linspace(0, store.n_rows, max(1, shards) + 1)[1:-1]
+    cuts = store_bounds[np.searchsorted(rows_before, targets)]
+    bounds = np.unique(np.concatenate([[0], cuts, [len(store)]]))
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def _codes(labels, selected):
+    return np.flatnonzero(np.isin(np.asarray(labels, dtype=object), list(selected)))
+
+
+def _histogram(values):
+    if len(values) == 0:
+        return (0, np.zeros(0, dtype=np.int64))
+    low = int(values.min())
+    return (low, np.bincount(values - low))
+
+
+def _merge_histograms(a, b):
+    low = min(a[0], b[0]) if len(a[1]) and len(b[1]) else (a[0] if len(a[1]) else b[0])
+    size = max(a[0] + len(a[1]), b[0] + len(b[1])) - low
+    counts = np.zeros(max(size, 0), dtype=np.int64)
+    for offset, part in (a, b):
+        if len(part):
+            counts[offset - low:offset - low + len(part)] += part
+    return (low, counts)
+
+
+def shard_partials(store, lo, hi, first=None, last=None, categories=None, regions=None, stores=None):
+    """Partial aggregates of the rows of series lo..hi between day numbers `first` and `last`.
+
+    `categories`, `regions` and `stores` are code arrays to keep (None = all).
+    """
+    store_levels = np.unique(store.stores)
+    product_levels = np.unique(store.products)
+    levels = store.levels
+    n_category, n_region = len(levels['Category']), len(levels['Region'])
+    n_season, n_store, n_product = len(levels['Seasonality']), len(store_levels), len(product_levels)
+    day0 = np.datetime64(store.meta['first_date'], 'D').astype(np.int64)
+    n_days = int(np.datetime64(store.meta['last_date'], 'D').astype(np.int64) - day0 + 1)
+
+    rows = slice(int(store.offsets[lo]), int(store.offsets[hi]))
+    lengths = np.diff(store.offsets[lo:hi + 1])
+    row_store = np.repeat(np.searchsorted(store_levels, store.stores[lo:hi]), lengths)
+    row_product = np.repeat(np.searchsorted(product_levels, store.products[lo:hi]), lengths)
+    day = store['Date'][rows].astype(np.int64) - day0
+    category = store['Category'][rows].astype(np.intp)
+    region = store['Region'][rows].astype(np.intp)
+
+    keep = np.ones(len(day), dtype=bool)
+    if first is not None:
+        keep &= day >= first - day0
+    if last is not None:
+        keep &= day <= last - day0
+    if categories is not None:
+        keep &= np.isin(category, categories)
+    if regions is not None:
+        keep &= np.isin(region, regions)
+    if stores is not None:
+        keep &= np.isin(row_store, stores)
+
+    def column(name):
+        return np.asarray(store[name][rows])[keep]
+
+    day, category, region = day[keep], category[keep], region[keep]
+    row_store, row_product = row_store[keep], row_product[keep]
+    season = column('Seasonality').astype(np.intp)
+    units = column('Units Sold').astype(np.float64)
+    price = column('Price').astype(np.float64)
+    discount = column('Discount').astype(np.float64)
+    inventory = column('Inventory Level').astype(np.float64)
+    ordered = column('Units Ordered').astype(np.float64)
+
+    price_min = np.full(n_category, np.inf)
+    price_max = np.full(n_category, -np.inf)
+    for code in np.unique(category):
+        in_category = price[category == code]
+        price_min[code], price_max[code] = in_category.min(), in_category.max()
+
+    def by(codes, weights=None, size=None):
+        return np.bincount(codes, weights, minlength=size)
+
+    partials = {
+        'rows': len(units),
+        'units': units.sum(),
+        'revenue': (units * price * (1 - discount / 100)).sum(),
+        'price': price.sum(),
+        'discount': discount.sum(),
+        'discounted': int((discount > 0).sum()),
+        'inventory': inventory.sum(),
+        'category_rows': by(category, size=n_category),
+        'category_units': by(category, units, n_category),
+        'category_inventory': by(category, inventory, n_category),
+        'category_ordered': by(category, ordered, n_category),
+        'category_price': by(category, price, n_category),
+        'category_discount': by(category, discount, n_category),
+        'category_price_min': price_min,
+        'category_price_max': price_max,
+        'region_rows': by(region, size=n_region),
+        'region_units': by(region, units, n_region),
+        'region_category_rows': by(region * n_category + category, size=n_region * n_category),
+        'region_category_units': by(region * n_category + category, units, n_region * n_category),
+        'store_rows': by(row_store, size=n_store),
+        'store_units': by(row_store, units, n_store),
+        'store_inventory': by(row_store, inventory, n_store),
+        'store_products': by(row_store * n_product + row_product, size=n_store * n_product) > 0,
+        'day_rows': by(day, size=n_days),
+        'day_units': by(day, units, n_days),
+        'season_rows': by(season, size=n_season),
+        'season_units': by(season, units, n_season),
+        'histograms': {},
+    }
+    for name in HISTOGRAM_COLUMNS:
+        values = column(name)
+        if values.dtype.kind in 'iu':
+            partials['histograms'][name] = _histogram(values.astype(np.int64))
+    return partials
+
+
+def merge(a, b):
+    """Combine the partials of two shards"""
+    merged = {}
+    for name, value in a.items():
+        other = b[name]
+        if name == 'histograms':
+            merged[name] = {
+                column: _merge_histograms(value[column], other[column])
+                for column in value.keys() & other.keys()
+            }
+        elif name.endswith('_min'):
+            merged[name] = np.minimum(value, other)
+        elif name.endswith('_max'):
+            merged[name] = np.maximum(value, other)
+        elif name == 'store_products':
+            merged[name] = value | other
+        else:
+            merged[name] = value + other
+    return merged
+
+
+def _histogram_quantile(histogram, q):
+    """pandas' linear-interpolation quantile of the values behind a histogram"""
+    low, counts = histogram
+    n = int(counts.sum())
+    if n == 0:
+        return np.nan
+    cumulative = np.cumsum(counts)
+    position = q * (n - 1)
+    below, above = int(np.floor(position)), int(np.ceil(position))
+    lower = low + int(np.searchsorted(cumulative, below, side='right'))
+    upper = low + int(np.searchsorted(cumulative, above, side='right'))
+    return lower + (upper - lower) * (position - below)
+
+
+class ShardSummary:
+    """Merged shard partials, answering the analytics computations listed in COMPUTATIONS"""
+
+    def __init__(self, partials, store):
+        self.partials = partials
+        self.categories = np.asarray(store.levels['Category'], dtype=object)
+        self.regions = np.asarray(store.levels['Region'], dtype=object)
+        self.seasons = np.asarray(store.levels['Seasonality'], dtype=object)
+        self.stores = np.unique(store.stores).astype(object)
+        self.products = np.unique(store.products).astype(object)
+        self.first_date = np.datetime64(store.meta['first_date'], 'D')
+        self.units_dtype = store['Units Sold'].dtype
+        self.ordered_dtype = store['Units Ordered'].dtype
+        self.inventory_dtype = store['Inventory Level'].dtype
+
+    def __len__(self):
+        return self.partials['rows']
+
+    def compute(self, name):
+        return getattr(self, name)()
+
+    # Grouped totals keep the integer dtype of integer columns, like pandas
+    def _units(self, values):
+        return values.astype(self.units_dtype)
+
+    def _grouped(self, key, labels, name, values, rows):
+        present = rows > 0
+        return pd.DataFrame({key: labels[present], name: values[present]})
+
+    # ------------------------------------------------------------------ #
+    # Dashboard
+    # ------------------------------------------------------------------ #
+    def kpis(self):
+        p = self.partials
+        return {
+            'total_units_sold': self._units(np.asarray(p['units'])).item(),
+            'avg_daily_sales': p['day_units'][p['day_rows'] > 0].mean(),
+            'total_revenue': p['revenue'],
+            'unique_products': int(p['store_products'].reshape(len(self.stores), -1).any(axis=0).sum()),
+        }
+
+    def category_sales(self):
+        p = self.partials
+        return self._grouped('Category', self.categories, 'Units Sold',
+                             self._units(p['category_units']), p['category_rows'])
+
+    def category_average_sales(self):
+        p = self.partials
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = p['category_units'] / p['category_rows']
+        result = self._grouped('Category', self.categories, 'Units Sold', mean, p['category_rows'])
+        return result.sort_values('Units Sold', ascending=False)
+
+    def region_sales(self):
+        p = self.partials
+        return self._grouped('Region', self.regions, 'Units Sold', self._units(p['region_units']), p['region_rows'])
+
+    def store_sales(self):
+        p = self.partials
+        result = self._grouped('Store ID', self.stores, 'Units Sold', self._units(p['store_units']), p['store_rows'])
+        return result.sort_values('Units Sold', ascending=False)
+
+    def region_category_matrix(self):
+        p = self.partials
+        regions = np.repeat(self.regions, len(self.categories))
+        categories = np.tile(self.categories, len(self.regions))
+        present = p['region_category_rows'] > 0
+        long = pd.DataFrame({
+            'Region': regions[present],
+            'Category': categories[present],
+            'Units Sold': self._units(p['region_category_units'][present]),
+        })
+        return long.pivot(index='Category', columns='Region', values='Units Sold')
+
+    def _days(self):
+        p = self.partials
+        present = p['day_rows'] > 0
+        dates = (self.first_date + np.flatnonzero(present)).astype('datetime64[ns]')
+        return dates, self._units(p['day_units'][present])
+
+    def daily_sales(self):
+        dates, units = self._days()
+        return pd.DataFrame({'Date': dates, 'Units Sold': units})
+
+    def monthly_sales(self):
+        dates, units = self._days()
+        months = pd.Series(pd.DatetimeIndex(dates).to_period('M').astype(str), name='Month')
+        return pd.Series(units).groupby(months).sum().rename('Units Sold').reset_index()
+
+    def seasonal_sales(self):
+        p = self.partials
+        return self._grouped('Seasonality', self.seasons, 'Units Sold', self._units(p['season_units']), p['season_rows'])
+
+    def business_insights(self):
+        p = self.partials
+        present = p['season_rows'] > 0
+        seasonal_avg = pd.Series(
+            p['season_units'][present] / p['season_rows'][present],
+            index=pd.Index(self.seasons[present], name='Seasonality'), name='Units Sold',
+        )
+        categories = self.category_sales().set_index('Category')['Units Sold']
+        regions = self.region_sales().set_index('Region')['Units Sold']
+        return {
+            'top_categories': categories.sort_values(ascending=False).head(3),
+            'top_regions': regions.sort_values(ascending=False),
+            'seasonal_avg': seasonal_avg,
+            'best_season': seasonal_avg.idxmax(),
+            'worst_season': seasonal_avg.idxmin(),
+            'avg_price': p['price'] / p['rows'],
+            'avg_discount': p['discount'] / p['rows'],
+            'discounted_share': p['discounted'] / p['rows'] * 100,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Alerts
+    # ------------------------------------------------------------------ #
+    def alert_thresholds(self):
+        """Exact thresholds from the merged histograms; None when a column is not integer"""
+        histograms = self.partials['histograms']
+        if not all(name in histograms for name in HISTOGRAM_COLUMNS):
+            return None
+        return {
+            'low_stock': _histogram_quantile(histograms['Inventory Level'], 0.2),
+            'high_demand': _histogram_quantile(histograms['Units Ordered'], 0.8),
+        }
+
+    def underperforming_stores(self, ratio=0.8):
+        p = self.partials
+        present = p['store_rows'] > 0
+        performance = pd.DataFrame({
+            'Store ID': self.stores[present],
+            'Units Sold': self._units(p['store_units'][present]),
+            'Inventory Level': p['store_inventory'][present] / p['store_rows'][present],
+        }).sort_values('Units Sold')
+        return performance[performance['Units Sold'] < performance['Units Sold'].mean() * ratio]
+
+    def stockout_risk(self):
+        p = self.partials
+        present = p['category_rows'] > 0
+        performance = pd.DataFrame({
+            'Category': self.categories[present],
+            'Units Sold': self._units(p['category_units'][present]),
+            'Inventory Level': p['category_inventory'][present] / p['category_rows'][present],
+            'Units Ordered': p['category_ordered'][present].astype(self.ordered_dtype),
+        })
+        performance['Demand vs Supply'] = performance['Units Ordered'] - performance['Units Sold']
+        gap = performance['Demand vs Supply']
+        return performance[gap > gap.quantile(0.75)].sort_values('Demand vs Supply', ascending=False)
+
+    # ------------------------------------------------------------------ #
+    # Products
+    # ------------------------------------------------------------------ #
+    def product_totals(self):
+        p = self.partials
+        return {
+            'unique_products': int(p['store_products'].reshape(len(self.stores), -1).any(axis=0).sum()),
+            'total_inventory': np.asarray(p['inventory']).astype(self.inventory_dtype).item(),
+            'avg_price': p['price'] / p['rows'] if p['rows'] else np.nan,
+            'total_sales': self._units(np.asarray(p['units'])).item(),
+        }
+
+    def category_stats(self):
+        p = self.partials
+        present = p['category_rows'] > 0
+        rows = p['category_rows'][present]
+        return pd.DataFrame({
+            'Category': self.categories[present],
+            'Units Sold': self._units(p['category_units'][present]),
+            'Inventory Level': p['category_inventory'][present] / rows,
+            'Price': p['category_price'][present] / rows,
+        })
+
+    def store_stats(self):
+        p = self.partials
+        present = p['store_rows'] > 0
+        return pd.DataFrame({
+            'Store ID': self.stores[present],
+            'Total Sales': self._units(p['store_units'][present]),
+            'Unique Products': p['store_products'].reshape(len(self.stores), -1).sum(axis=1)[present],
+            'Avg Inventory': p['store_inventory'][present] / p['store_rows'][present],
+        })
+
+    def price_analysis(self):
+        p = self.partials
+        present = p['category_rows'] > 0
+        rows = p['category_rows'][present]
+        return pd.DataFrame({
+            'Category': self.categories[present],
+            'Avg Price': p['category_price'][present] / rows,
+            'Min Price': p['category_price_min'][present],
+            'Max Price': p['category_price_max'][present],
+            'Avg Discount': p['category_discount'][present] / rows,
+            'Total Sales': self._units(p['category_units'][present]),
+        })
+
+
+def summarize(store, start=None, end=None, categories=(), regions=(), stores=(), jobs=SHARD_JOBS, shards=None):
+    """ShardSummary of the rows of `store` between `start` and `end` matching the filters (empty = all)"""
+    if shards is None:
+        shards = jobs if jobs > 0 else (os.cpu_count() or 1)
+    kwargs = {
+        'first': None if start is None else np.datetime64(pd.Timestamp(start).date(), 'D').astype(np.int64),
+        'last': None if end is None else np.datetime64(pd.Timestamp(end).date(), 'D').astype(np.int64),
+        'categories': _codes(store.levels['Category'], categories) if categories else None,
+        'regions': _codes(store.levels['Region'], regions) if regions else None,
+        'stores': _codes(np.unique(store.stores), stores) if stores else None,
+    }
+    with span('sharded.summarize', rows=store.n_rows):
+        ranges = shard_ranges(store, shards)
+        results = series_store.map_series(store, shard_partials, jobs=jobs if len(ranges) > 1 else 1,
+                                          ranges=ranges, **kwargs)
+        partials = results[0]
+        for other in results[1:]:
+            partials = merge(partials, other)
+    return ShardSummary(partials, store)
+
+
+def _compare(expected, actual):
+    if isinstance(expected, dict):
+        return all(_compare(expected[key], actual[key]) for key in expected)
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                      check_dtype=False, check_names=False, rtol=1e-9)
+        return True
+    if isinstance(expected, pd.Series):
+        pd.testing.assert_series_equal(expected, actual, check_dtype=False, check_names=False, rtol=1e-9)
+        return True
+    if isinstance(expected, str):
+        return expected == actual
+    return np.isclose(expected, actual, rtol=1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time sharded aggregation against single-process analytics")
+    parser.add_argument('--scale', help="Benchmark dataset (10k, 100k, 1m, ...) instead of the app data")
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, os.cpu_count() or 1], help="Worker counts to time")
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.scale:
+        import benchmark
+        df = benchmark.ensure_dataset(args.scale, benchmark.SCALES[args.scale]).read()
+    else:
+        from utils import open_dataset
+        df = open_dataset().read()
+    store = series_store.for_frame(df)
+
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        expected = {name: getattr(analytics, name)(df) for name in COMPUTATIONS}
+    pandas_seconds = (time.perf_counter() - started) / args.repeat
+    print(f"{len(df):,} rows, {len(np.unique(store.stores))} stores")
+    print(f"{'mode':<22} {'seconds':>8} {'speedup':>8}")
+    print(f"{'pandas, 1 process':<22} {pandas_seconds:>8.3f} {1:>8.2f}")
+
+    failed = False
+    for jobs in args.jobs:
+        summarize(store, jobs=jobs)  # start the workers
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            summary = summarize(store, jobs=jobs)
+            actual = {name: summary.compute(name) for name in COMPUTATIONS}
+        seconds = (time.perf_counter() - started) / args.repeat
+        print(f"{f'sharded, {jobs} jobs':<22} {seconds:>8.3f} {pandas_seconds / seconds:>8.2f}")
+        for name in COMPUTATIONS:
+            if not _compare(expected[name], actual[name]):
+                print(f"  {name} differs from analytics.{name}")
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
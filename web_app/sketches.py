@@ -0,0 +1,217 @@
+# web_app/sketches.py
+# Mergeable sketches for approximate statistics on very large datasets:
+# HyperLogLog for distinct counts and KLL for quantiles. Both are small and
+# fixed-size, are built once per partition when it is written, and combine
+# by merging, so a date range's statistics never touch its rows.
+#
+# Error bounds:
+#   HyperLogLog, 2**p registers: relative standard error 1.04 / sqrt(2**p)
+#   KLL with parameter k: normalized rank error about 2.296 / k**0.9723
+#   (99% confidence)
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+HLL_PRECISION = 12
+KLL_K = 200
+
+
+def _bit_length(values):
+    """Bit length of each uint64, computed exactly through 32-bit halves"""
+    hi = (values >> np.uint64(32)).astype(np.float64)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(hi > 0, np.frexp(hi)[1] + 32, np.frexp(lo)[1])
+
+
+class HyperLogLog:
+    """Distinct-count estimate from 2**p one-byte registers"""
+
+    def __init__(self, p=HLL_PRECISION, registers=None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(self.m)
+
+    def update(self, values):
+        # Registers only depend on the set of values, so hash each distinct value once
+        hashes = pd.util.hash_array(np.asarray(pd.unique(np.asarray(values))))
+        if len(hashes) == 0:
+            return self
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.intp)
+        # The sentinel bit caps the rank at 64 - p + 1
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        rank = (65 - _bit_length(rest)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.m * np.log(self.m / zeros)
+        return float(estimate)
+
+
+class KLL:
+    """Quantile sketch keeping a few hundred weighted samples in compacted levels"""
+
+    def __init__(self, k=KLL_K, levels=None, n=0, seed=None):
+        self.k = k
+        self.levels = [np.empty(0)] if levels is None else levels
+        self.n = n
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def rank_error(self):
+        return 2.296 / self.k ** 0.9723
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compact(self, level):
+        items = np.sort(self.levels[level])
+        # An odd item out stays behind so the promoted weight is exact
+        keep = items[:1] if len(items) % 2 else items[:0]
+        items = items[len(keep):]
+        if level + 1 == len(self.levels):
+            self.levels.append(np.empty(0))
+        offset = self._rng.integers(2)
+        self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[offset::2]])
+        self.levels[level] = keep
+
+    def _compress(self):
+        while True:
+            for level in range(len(self.levels)):
+                if len(self.levels[level]) > self._capacity(level):
+                    self._compact(level)
+                    break
+            else:
+                return
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        depth = max(len(self.levels), len(other.levels))
+        levels = [
+            np.concatenate([
+                self.levels[h] if h < len(self.levels) else np.empty(0),
+                other.levels[h] if h < len(other.levels) else np.empty(0),
+            ])
+            for h in range(depth)
+        ]
+        merged = KLL(min(self.k, other.k), levels, self.n + other.n)
+        merged._compress()
+        return merged
+
+    def quantile(self, q):
+        if self.n == 0:
+            return float('nan')
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+        return float(items[order][min(position, len(items) - 1)])
+
+
+class ColumnSketches:
+    """HyperLogLogs for the text columns and KLLs for the numeric columns of a frame"""
+
+    def __init__(self, distinct=None, quantiles=None):
+        self.distinct_sketches = distinct or {}
+        self.quantile_sketches = quantiles or {}
+
+    @classmethod
+    def from_frame(cls, df):
+        distinct, quantiles = {}, {}
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                continue
+            if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+                quantiles[column] = KLL().update(series.to_numpy(dtype=np.float64, na_value=np.nan))
+            else:
+                distinct[column] = HyperLogLog().update(series.dropna().to_numpy())
+        return cls(distinct, quantiles)
+
+    def merge(self, other):
+        def combine(mine, theirs):
+            merged = dict(mine)
+            for column, sketch in theirs.items():
+                merged[column] = merged[column].merge(sketch) if column in merged else sketch
+            return merged
+        return ColumnSketches(
+            combine(self.distinct_sketches, other.distinct_sketches),
+            combine(self.quantile_sketches, other.quantile_sketches),
+        )
+
+    def distinct(self, column):
+        """Estimated number of distinct values, rounded"""
+        return int(round(self.distinct_sketches[column].count()))
+
+    def quantile(self, column, q):
+        return self.quantile_sketches[column].quantile(q)
+
+    @property
+    def distinct_error(self):
+        """Relative standard error of distinct counts"""
+        return 1.04 / np.sqrt(1 << HLL_PRECISION)
+
+    @property
+    def rank_error(self):
+        """Normalized rank error of quantiles (99% confidence)"""
+        return 2.296 / KLL_K ** 0.9723
+
+    # ------------------------------------------------------------------ #
+    # Storage (.npz, no pickled objects)
+    # ------------------------------------------------------------------ #
+    def save(self, path, **meta):
+        header = {
+            'distinct': list(self.distinct_sketches),
+            'quantiles': {
+                column: {'k': sketch.k, 'n': sketch.n, 'sizes': [len(level) for level in sketch.levels]}
+                for column, sketch in self.quantile_sketches.items()
+            },
+            'meta': meta,
+        }
+        arrays = {'header': np.array(json.dumps(header))}
+        for i, sketch in enumerate(self.distinct_sketches.values()):
+            arrays[f'hll_{i}'] = sketch.registers
+        for i, sketch in enumerate(self.quantile_sketches.values()):
+            # All levels in one array; the header records where each ends
+            arrays[f'kll_{i}'] = np.concatenate(sketch.levels)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Sketches and the metadata saved with them"""
+        with np.load(path, allow_pickle=False) as arrays:
+            header = json.loads(str(arrays['header']))
+            distinct = {
+                column: HyperLogLog(registers=arrays[f'hll_{i}'].copy())
+                for i, column in enumerate(header['distinct'])
+            }
+            quantiles = {
+                column: KLL(info['k'], np.split(arrays[f'kll_{i}'], np.cumsum(info['sizes'])[:-1]), info['n'])
+                for i, (column, info) in enumerate(header['quantiles'].items())
+            }
+        return cls(distinct, quantiles), header['meta']
@@ -0,0 +1,167 @@
+# web_app/startup.py
+# Cold-start helpers: lazy heavy imports, background pre-warming and an
+# `-X importtime` report (`python startup.py` from the web_app directory).
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+
+# Modules that are only needed once a chart or model is actually used
+HEAVY_MODULES = [
+    'plotly.express',
+    'plotly.graph_objects',
+    'sklearn',
+    'xgboost',
+    'matplotlib',
+    'seaborn',
+]
+
+# Modules imported on the way to the first rendered page
+APP_MODULES = ['streamlit', 'utils', 'pages.dashboard', 'pages.alerts', 'pages.products', 'pages.admin']
+
+_lock = threading.Lock()
+_import_timings = {}
+_prewarm_thread = None
+
+
+def timed_import(name):
+    """Import a module, recording the import time the first time it is loaded"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    with _lock:
+        _import_timings.setdefault(name, {
+            'seconds': elapsed,
+            'thread': threading.current_thread().name,
+        })
+    return module
+
+
+def import_timings():
+    """Import times recorded by timed_import in this process"""
+    with _lock:
+        return dict(_import_timings)
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """Return a proxy that defers `import name` until it is first used"""
+    return LazyModule(name)
+
+
+def prewarm(modules=None):
+    """Import heavy modules in a background thread, once per process.
+
+    Called after the first page has been sent to the browser so later pages
+    and features find their libraries already loaded. Modules that are not
+    installed are skipped.
+    """
+    global _prewarm_thread
+    modules = list(HEAVY_MODULES if modules is None else modules)
+
+    def run():
+        for name in modules:
+            try:
+                timed_import(name)
+            except Exception:
+                # Optional dependency missing or broken; the feature using it will report it
+                pass
+
+    with _lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=run, name='import-prewarm', daemon=True)
+            _prewarm_thread.start()
+        return _prewarm_thread
+
+
+def prewarm_enabled():
+    """Pre-warming is on unless RETAIL_PREWARM_IMPORTS=0"""
+    return os.environ.get('RETAIL_PREWARM_IMPORTS', '1') != '0'
+
+
+def parse_importtime(output):
+    """Parse `python -X importtime` stderr into (module, self_us, cumulative_us) rows"""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # Header line
+            continue
+        rows.append((fields[2].strip(), self_us, cumulative_us))
+    return rows
+
+
+def import_time_report(modules=None):
+    """Measure import cost per module in a fresh interpreter.
+
+    Each requested top-level module is imported in one `-X importtime`
+    subprocess run from the web_app directory, so the numbers reflect a
+    cold server process. Returns rows sorted by cumulative time.
+    """
+    modules = list(APP_MODULES + HEAVY_MODULES if modules is None else modules)
+    code = '\n'.join(
+        f'try:\n    import {name}\nexcept Exception:\n    pass' for name in modules
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    rows = parse_importtime(result.stderr)
+    return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report per-module import time for the web app")
+    parser.add_argument('modules', nargs='*', help="Modules to import (default: app pages and heavy libraries)")
+    parser.add_argument('--all', action='store_true', help="Include every transitively imported module")
+    parser.add_argument('--top', type=int, default=25, help="Number of rows to print with --all")
+    args = parser.parse_args(argv)
+
+    rows = import_time_report(args.modules or None)
+    requested = set(args.modules or APP_MODULES + HEAVY_MODULES)
+    if args.all:
+        rows = rows[:args.top]
+    else:
+        rows = [row for row in rows if row[0] in requested]
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in rows:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
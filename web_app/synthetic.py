@@ -0,0 +1,227 @@
+# web_app/synthetic.py
+# Synthetic retail inventory data with the same schema as
+# retail_store_inventory.csv, for benchmarking at scales the real export
+# does not reach. Rows are generated one calendar month at a time so very
+# large datasets never have to fit in memory at once.
+#
+# By default every label column is drawn per row with the export's
+# frequencies: any product can be sold under any category, any store in any
+# region, and every season, weather and discount turns up in every month. So
+# groupings such as (Product, Category, Region) have as many keys as in the
+# real data. The structured model (structured=True, --structured) instead
+# fixes category per product and region per store, and draws season from the
+# month and weather by season, for data whose labels make sense together.
+import argparse
+import math
+
+import numpy as np
+import pandas as pd
+
+from datastore import PartitionedDataset
+
+CATEGORIES = ['Electronics', 'Clothing', 'Groceries', 'Toys', 'Furniture']
+REGIONS = ['North', 'South', 'East', 'West']
+WEATHER_CONDITIONS = ['Sunny', 'Rainy', 'Cloudy', 'Snowy']
+SEASONS = ['Winter', 'Spring', 'Summer', 'Autumn']
+DISCOUNTS = np.array([0, 5, 10, 15, 20])
+
+# Bumped whenever the same seed and shape generate different rows, so
+# cached benchmark datasets are regenerated
+DATA_VERSION = 2
+
+# Shape of the original export: 5 stores x 20 products x 730 days
+BASE_STORES = 5
+BASE_PRODUCTS = 20
+BASE_DAYS = 730
+
+# Share of rows on a holiday/promotion and per discount. Labels are otherwise
+# uniform, as in the export; the structured model uses the second figures.
+HOLIDAY_SHARE = 0.5
+DISCOUNT_PROBABILITIES = [0.2, 0.2, 0.2, 0.2, 0.2]
+STRUCTURED_HOLIDAY_SHARE = 0.3
+STRUCTURED_DISCOUNT_PROBABILITIES = [0.3, 0.2, 0.2, 0.15, 0.15]
+
+# Relative demand by season and weather, applied on top of each product's base rate
+SEASON_EFFECT = {'Winter': 0.9, 'Spring': 1.0, 'Summer': 1.1, 'Autumn': 1.0}
+WEATHER_EFFECT = {'Sunny': 1.05, 'Rainy': 0.9, 'Cloudy': 1.0, 'Snowy': 0.8}
+WEATHER_PROBABILITIES = {
+    'Winter': [0.15, 0.2, 0.3, 0.35],
+    'Spring': [0.35, 0.35, 0.25, 0.05],
+    'Summer': [0.6, 0.15, 0.25, 0.0],
+    'Autumn': [0.3, 0.35, 0.3, 0.05],
+}
+
+
+def scale_shape(n_rows):
+    """(stores, products, days) grid holding at least `n_rows` rows.
+
+    Small scales shorten the history; large ones keep two years and add
+    stores and products in the original 1:4 ratio.
+    """
+    days = int(min(BASE_DAYS, max(30, n_rows // (BASE_STORES * BASE_PRODUCTS))))
+    series = math.ceil(n_rows / days)
+    stores = max(1, round(math.sqrt(series / 4)))
+    products = math.ceil(series / stores)
+    return stores, products, days
+
+
+def season_of(months):
+    """Season name for each calendar month number"""
+    return np.array(SEASONS)[(np.asarray(months) % 12) // 3]
+
+
+class RetailGenerator:
+    """Deterministic generator for a stores x products x days grid"""
+
+    def __init__(self, n_stores, n_products, n_days, start='2022-01-01', seed=0, structured=False):
+        self.n_stores = n_stores
+        self.n_products = n_products
+        self.dates = pd.date_range(start, periods=n_days, freq='D')
+        self.seed = seed
+        self.structured = structured
+        rng = np.random.default_rng(seed)
+
+        self.store_ids = np.array([f'S{i:03d}' for i in range(1, n_stores + 1)])
+        self.product_ids = np.array([f'P{i:04d}' for i in range(1, n_products + 1)])
+        # Fixed attributes per store and per product (region and category only in the structured model)
+        self.store_region = rng.integers(0, len(REGIONS), n_stores)
+        self.store_factor = rng.uniform(0.8, 1.2, n_stores)
+        self.product_category = rng.integers(0, len(CATEGORIES), n_products)
+        self.product_price = rng.uniform(10, 100, n_products)
+        self.product_base_demand = rng.uniform(60, 220, n_products)
+        self.product_elasticity = rng.uniform(-1.8, -0.6, n_products)
+
+    @property
+    def row_count(self):
+        return self.n_stores * self.n_products * len(self.dates)
+
+    def _frame(self, dates):
+        """All store/product rows for the given dates"""
+        rng = np.random.default_rng([self.seed, int(dates[0].value // 86_400_000_000_000)])
+        n_series = self.n_stores * self.n_products
+        n = len(dates) * n_series
+
+        date_values = np.repeat(dates.values, n_series)
+        store_idx = np.tile(np.repeat(np.arange(self.n_stores), self.n_products), len(dates))
+        product_idx = np.tile(np.arange(self.n_products), self.n_stores * len(dates))
+
+        weekday = np.repeat(dates.dayofweek.values, n_series)
+        if self.structured:
+            category, region, seasons, weather = self._structured_labels(rng, dates, store_idx, product_idx)
+            holiday = (rng.random(n) < STRUCTURED_HOLIDAY_SHARE).astype(np.int64)
+            discount = rng.choice(DISCOUNTS, size=n, p=STRUCTURED_DISCOUNT_PROBABILITIES)
+        else:
+            category = np.array(CATEGORIES)[rng.integers(0, len(CATEGORIES), n)]
+            region = np.array(REGIONS)[rng.integers(0, len(REGIONS), n)]
+            seasons = np.array(SEASONS)[rng.integers(0, len(SEASONS), n)]
+            weather = np.array(WEATHER_CONDITIONS)[rng.integers(0, len(WEATHER_CONDITIONS), n)]
+            holiday = (rng.random(n) < HOLIDAY_SHARE).astype(np.int64)
+            discount = rng.choice(DISCOUNTS, size=n, p=DISCOUNT_PROBABILITIES)
+        price = np.round(self.product_price[product_idx] * rng.uniform(0.9, 1.1, n), 2)
+        competitor = np.round(price * rng.uniform(0.85, 1.25, n), 2)
+
+        effective_price = price * (1 - discount / 100)
+        demand = (
+            self.product_base_demand[product_idx]
+            * self.store_factor[store_idx]
+            * pd.Series(seasons).map(SEASON_EFFECT).values
+            * pd.Series(weather).map(WEATHER_EFFECT).values
+            * np.where(weekday >= 5, 1.15, 1.0)
+            * np.where(holiday == 1, 1.2, 1.0)
+            * (effective_price / self.product_price[product_idx]) ** self.product_elasticity[product_idx]
+            * (competitor / price) ** 0.5
+        )
+        inventory = rng.integers(50, 500, n)
+        units_sold = np.minimum(rng.poisson(demand), inventory)
+        units_ordered = np.maximum(0, np.round(demand * rng.uniform(0.3, 1.2, n))).astype(np.int64)
+        forecast = np.round(demand * rng.normal(1.0, 0.08, n), 2)
+
+        return pd.DataFrame({
+            'Date': date_values,
+            'Store ID': self.store_ids[store_idx],
+            'Product ID': self.product_ids[product_idx],
+            'Category': category,
+            'Region': region,
+            'Inventory Level': inventory,
+            'Units Sold': units_sold.astype(np.int64),
+            'Units Ordered': units_ordered,
+            'Demand Forecast': forecast,
+            'Price': price,
+            'Discount': discount,
+            'Weather Condition': weather.astype(str),
+            'Holiday/Promotion': holiday,
+            'Competitor Pricing': competitor,
+            'Seasonality': seasons,
+        })
+
+    def _structured_labels(self, rng, dates, store_idx, product_idx):
+        """Category per product, region per store, season from the month, and one weather draw per store and day"""
+        n_series = self.n_stores * self.n_products
+        seasons = season_of(np.repeat(dates.month.values, n_series))
+        day_idx = np.repeat(np.arange(len(dates)), n_series)
+        day_seasons = season_of(dates.month.values)
+        store_weather = np.empty((len(dates), self.n_stores), dtype=object)
+        for season, probabilities in WEATHER_PROBABILITIES.items():
+            mask = day_seasons == season
+            store_weather[mask] = rng.choice(WEATHER_CONDITIONS, size=(mask.sum(), self.n_stores), p=probabilities)
+        category = np.array(CATEGORIES)[self.product_category[product_idx]]
+        region = np.array(REGIONS)[self.store_region[store_idx]]
+        return category, region, seasons, store_weather[day_idx, store_idx]
+
+    def iter_months(self):
+        """Yield the generated rows one calendar month at a time"""
+        for _, month_dates in pd.Series(self.dates).groupby(self.dates.to_period('M')):
+            yield self._frame(pd.DatetimeIndex(month_dates))
+
+    def frame(self):
+        return pd.concat(self.iter_months(), ignore_index=True)
+
+
+def generator_for(n_rows, seed=0, structured=False):
+    return RetailGenerator(*scale_shape(n_rows), seed=seed, structured=structured)
+
+
+def generate(n_rows, seed=0, structured=False):
+    """In-memory frame with exactly `n_rows` synthetic rows"""
+    return generator_for(n_rows, seed, structured).frame().head(n_rows)
+
+
+def write_partitioned(root, n_rows, seed=0, structured=False):
+    """Write about `n_rows` rows (whole days) to a partitioned dataset, month by month"""
+    generator = generator_for(n_rows, seed, structured)
+    months = generator.iter_months()
+    dataset = PartitionedDataset.from_frame(next(months), root)
+    for month in months:
+        dataset.append(month)
+    return dataset
+
+
+def write_csv(path, n_rows, seed=0, structured=False):
+    """Write about `n_rows` rows (whole days) as a flat CSV like the original export"""
+    generator = generator_for(n_rows, seed, structured)
+    for i, month in enumerate(generator.iter_months()):
+        month['Date'] = month['Date'].dt.strftime('%Y-%m-%d')
+        month.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    return generator.row_count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic retail inventory data")
+    parser.add_argument('rows', type=int, help="Approximate number of rows")
+    parser.add_argument('output', help="CSV file, or a directory for a partitioned dataset")
+    parser.add_argument('--partitioned', action='store_true', help="Write month partitions instead of a CSV")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--structured', action='store_true',
+                        help="Fixed category per product and region per store, season from the month")
+    args = parser.parse_args(argv)
+
+    if args.partitioned:
+        dataset = write_partitioned(args.output, args.rows, args.seed, args.structured)
+        print(f"Wrote {dataset.row_count:,} rows in {len(dataset.partitions)} partitions to {args.output}")
+    else:
+        rows = write_csv(args.output, args.rows, args.seed, args.structured)
+        print(f"Wrote {rows:,} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+# web_app/tree_export.py
+# Trained tree ensembles (scikit-learn random forests, XGBoost boosters)
+# flattened into contiguous NumPy node arrays, and a predictor that walks all
+# trees for all rows at once: one gather per tree level instead of a Python
+# call per node. For a single sidebar request this skips the library's
+# input validation, DMatrix construction and thread pool start-up.
+#
+#   python tree_export.py                   # parity and latency on the 100k benchmark data
+#   python tree_export.py --scale 1m --batch 10000
+#
+# Leaves point back at themselves, so every row can take `depth` steps
+# regardless of where its path ends.
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import forecasting
+
+# (rows x trees) cells walked together in predict(): small enough that the
+# per-level work arrays stay in CPU cache
+CHUNK_CELLS = 1 << 14
+
+# XGBoost objectives whose prediction is the raw margin
+IDENTITY_OBJECTIVES = {'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror'}
+
+
+class TreeEnsemble:
+    """Sum (or mean) of decision trees stored as flat node arrays.
+
+    A row at node i moves to left[i] when x[feature[i]] is below the
+    threshold (`<` for XGBoost, `<=` for scikit-learn, `strict`), to
+    right[i] otherwise, and to the missing-value branch when it is NaN.
+    The prediction is base + scale * sum of the leaf values reached.
+    """
+
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, depth,
+                 base=0.0, scale=1.0, strict=False, n_features=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.base = base
+        self.scale = scale
+        self.strict = strict
+        self.n_features = n_features
+        # Children interleaved as (left, right) so each step is a single gather
+        self._children = np.column_stack([left, right]).ravel()
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_trees(cls, trees, **kwargs):
+        """Concatenate per-tree (feature, threshold, left, right, missing_left, value) arrays.
+
+        Child indices are local to each tree and -1 at leaves.
+        """
+        offsets = np.cumsum([0] + [len(tree[0]) for tree in trees])
+        feature, threshold, left, right, missing_left, value, depth = [], [], [], [], [], [], 0
+        for offset, (f, t, l, r, m, v) in zip(offsets, trees):
+            leaf = l < 0
+            own = np.arange(len(f)) + offset
+            feature.append(np.where(leaf, 0, f))
+            threshold.append(t)
+            left.append(np.where(leaf, own, l + offset))
+            right.append(np.where(leaf, own, r + offset))
+            missing_left.append(m)
+            value.append(np.where(leaf, v, 0.0))
+            depth = max(depth, _tree_depth(l, r))
+        return cls(
+            np.concatenate(feature).astype(np.intp),
+            np.concatenate(threshold).astype(np.float64),
+            np.concatenate(left).astype(np.intp),
+            np.concatenate(right).astype(np.intp),
+            np.concatenate(missing_left).astype(bool),
+            np.concatenate(value).astype(np.float64),
+            offsets[:-1].astype(np.intp),
+            depth,
+            **kwargs,
+        )
+
+    def trees(self):
+        """Per-tree arrays in the form from_trees takes, so ensembles can be recombined"""
+        trees = []
+        for start, end in zip(self.roots, np.append(self.roots[1:], self.n_nodes)):
+            leaf = self.left[start:end] == np.arange(start, end)
+            trees.append((
+                self.feature[start:end],
+                self.threshold[start:end],
+                np.where(leaf, -1, self.left[start:end] - start),
+                np.where(leaf, -1, self.right[start:end] - start),
+                self.missing_left[start:end],
+                self.value[start:end],
+            ))
+        return trees
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        """Export a fitted RandomForestRegressor / ExtraTreesRegressor (or one decision tree)"""
+        estimators = getattr(forest, 'estimators_', [forest])
+        trees = []
+        for estimator in estimators:
+            tree = estimator.tree_
+            missing = getattr(tree, 'missing_go_to_left', None)
+            trees.append((
+                tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool),
+                tree.value[:, 0, 0],
+            ))
+        return cls.from_trees(trees, scale=1.0 / len(estimators), strict=False, n_features=forest.n_features_in_)
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """Export a fitted XGBRegressor or Booster with a single regression output"""
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        learner = json.loads(booster.save_raw('json'))['learner']
+        objective = learner['objective']['name']
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError(f"Unsupported XGBoost objective for export: {objective}")
+        params = learner['learner_model_param']
+        if int(params.get('num_target', 1)) > 1 or int(params.get('num_class', 0)) > 1:
+            raise ValueError("Only single-output XGBoost models can be exported")
+        trees = []
+        for tree in learner['gradient_booster']['model']['trees']:
+            left = np.array(tree['left_children'], dtype=np.intp)
+            trees.append((
+                np.array(tree['split_indices'], dtype=np.intp),
+                # XGBoost compares float32 inputs with float32 split values
+                np.array(tree['split_conditions'], dtype=np.float32),
+                left,
+                np.array(tree['right_children'], dtype=np.intp),
+                np.array(tree['default_left'], dtype=bool),
+                # Leaves keep their (learning-rate scaled) value in split_conditions
+                np.array(tree['split_conditions'], dtype=np.float32),
+            ))
+        return cls.from_trees(trees, base=float(params['base_score']), scale=1.0, strict=True,
+                              n_features=int(params['num_feature']))
+
+    def predict(self, X):
+        """Predictions for a 2-D array of rows (or a single 1-D row)"""
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[None, :]
+        # Both libraries compare float32 inputs; widening keeps float64 thresholds exact
+        X = X.astype(np.float32).astype(np.float64)
+        out = np.empty(len(X))
+        chunk = max(1, CHUNK_CELLS // max(1, self.n_trees))
+        for start in range(0, len(X), chunk):
+            out[start:start + chunk] = self._predict_chunk(X[start:start + chunk])
+        return out
+
+    def _predict_chunk(self, X):
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X)) * X.shape[1])[:, None]
+        has_missing = bool(np.isnan(flat).any())
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        for _ in range(self.depth):
+            x = flat.take(row_offsets + self.feature.take(node))
+            threshold = self.threshold.take(node)
+            # NaN compares False, so it goes left unless the node sends missing values right
+            goes_right = x >= threshold if self.strict else x > threshold
+            if has_missing:
+                goes_right |= np.isnan(x) & ~self.missing_left.take(node)
+            node = self._children.take(2 * node + goes_right)
+        return self.base + self.scale * self.value.take(node).sum(axis=1)
+
+    # ------------------------------------------------------------------ #
+    # Storage (.npz, no pickled objects)
+    # ------------------------------------------------------------------ #
+    def save(self, path, **meta):
+        header = {
+            'depth': self.depth, 'base': self.base, 'scale': self.scale,
+            'strict': self.strict, 'n_features': self.n_features, 'meta': meta,
+        }
+        tmp_path = path + '.tmp.npz'
+        np.savez(
+            tmp_path, header=np.array(json.dumps(header)), feature=self.feature, threshold=self.threshold,
+            left=self.left, right=self.right, missing_left=self.missing_left, value=self.value, roots=self.roots,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Ensemble and the metadata saved with it"""
+        with np.load(path, allow_pickle=False) as arrays:
+            header = json.loads(str(arrays['header']))
+            ensemble = cls(
+                arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                arrays['missing_left'], arrays['value'], arrays['roots'], header['depth'],
+                header['base'], header['scale'], header['strict'], header['n_features'],
+            )
+        return ensemble, header['meta']
+
+
+def _tree_depth(left, right):
+    """Longest root-to-leaf path of one tree given local child indices"""
+    depth = np.zeros(len(left), dtype=np.intp)
+    # Parents precede their children in both libraries' node order
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max()) if len(depth) else 0
+
+
+def export(model):
+    """TreeEnsemble for a fitted scikit-learn forest or XGBoost model"""
+    if hasattr(model, 'get_booster') or type(model).__module__.startswith('xgboost'):
+        return TreeEnsemble.from_xgboost(model)
+    if hasattr(model, 'tree_') or hasattr(model, 'estimators_'):
+        return TreeEnsemble.from_sklearn(model)
+    raise TypeError(f"Cannot export {type(model).__name__}")
+
+
+def parity(model, ensemble, X):
+    """Largest absolute and relative difference between library and exported predictions.
+
+    Relative differences are taken against max(|prediction|, 1), so
+    predictions near zero do not inflate them.
+    """
+    expected = np.asarray(model.predict(X), dtype=np.float64)
+    actual = ensemble.predict(X)
+    difference = np.abs(actual - expected)
+    return {
+        'max_abs': float(difference.max()),
+        'max_rel': float((difference / np.maximum(np.abs(expected), 1.0)).max()),
+    }
+
+
+def _latency(func, repeat):
+    """Median seconds per call"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export tree models and compare them with the library predictors")
+    parser.add_argument('--scale', default='100k', help="Benchmark dataset to train on (10k, 100k, 1m, ...)")
+    parser.add_argument('--models', nargs='+', default=list(forecasting.ESTIMATORS),
+                        choices=list(forecasting.ESTIMATORS))
+    parser.add_argument('--batch', type=int, default=10_000, help="Rows per batch for the throughput test")
+    parser.add_argument('--repeat', type=int, default=200, help="Single-row predictions timed")
+    parser.add_argument('--tolerance', type=float, default=1e-4, help="Allowed relative difference")
+    args = parser.parse_args(argv)
+
+    import benchmark
+    df = benchmark.ensure_dataset(args.scale, benchmark.SCALES[args.scale]).read()
+    features = forecasting.build_features(df)
+    rows = forecasting.training_rows(features, features.n_days)
+    batch = features.X[-args.batch:]
+    row = features.X[-1:]
+
+    failed = False
+    print(f"{'model':<14} {'trees':>6} {'nodes':>9} {'max rel diff':>13} "
+          f"{'library 1 row':>14} {'exported 1 row':>15} {'library rows/s':>15} {'exported rows/s':>16}")
+    for name in args.models:
+        model = forecasting.fit_estimator(name, features, rows)
+        ensemble = export(model)
+        check = parity(model, ensemble, batch)
+        failed |= check['max_rel'] > args.tolerance
+        library_row = _latency(lambda: model.predict(row), args.repeat)
+        exported_row = _latency(lambda: ensemble.predict(row), args.repeat)
+        library_batch = _latency(lambda: model.predict(batch), 5)
+        exported_batch = _latency(lambda: ensemble.predict(batch), 5)
+        print(f"{name:<14} {ensemble.n_trees:>6} {ensemble.n_nodes:>9,} {check['max_rel']:>13.2e} "
+              f"{library_row * 1e6:>11.0f} µs {exported_row * 1e6:>12.0f} µs "
+              f"{len(batch) / library_batch:>15,.0f} {len(batch) / exported_batch:>16,.0f}")
+    if failed:
+        print(f"\nExported predictions differ from the library by more than {args.tolerance:g}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,28 +1,168 @@
 # web_app/utils.py
 import pandas as pd
 import os
+import threading
 import streamlit as st
 
-@st.cache_data
-def load_data():
-    """Load the retail inventory data"""
+import elasticity
+import series_store
+import sharded
+from datastore import PartitionedDataset, frame_version
+from leaderboard import LEADERBOARDS
+from perf import span
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARTITION_DIR = os.path.join(ROOT_DIR, 'data', 'partitions')
+
+def find_csv():
+    """Locate the flat retail inventory CSV export"""
+    # Try to load from notebooks directory
+    csv_path = os.path.join(ROOT_DIR, 'notebooks', 'retail_store_inventory.csv')
+    if os.path.exists(csv_path):
+        return csv_path
+    # Try current directory
+    return 'retail_store_inventory.csv'
+
+# Serializes CSV re-partitioning between sessions, the API and the data watcher
+_sync_lock = threading.Lock()
+
+def open_dataset():
+    """Open the month-partitioned dataset, bringing it in line with the CSV when needed.
+
+    The first run partitions the whole CSV. After that a CSV with a new
+    modification time or size is hashed, and only the months whose rows
+    changed are rewritten (see PartitionedDataset.sync_csv).
+    """
+    csv_path = find_csv()
+    if PartitionedDataset.exists(PARTITION_DIR):
+        dataset = PartitionedDataset(PARTITION_DIR)
+        if not os.path.exists(csv_path) or dataset.source_unchanged(csv_path):
+            return dataset
+        with _sync_lock:
+            dataset = PartitionedDataset(PARTITION_DIR)
+            if not dataset.source_unchanged(csv_path):
+                with span('data.sync'):
+                    dataset.sync_csv(csv_path)
+            return dataset
+    with _sync_lock:
+        if PartitionedDataset.exists(PARTITION_DIR):
+            return PartitionedDataset(PARTITION_DIR)
+        return PartitionedDataset.from_csv(csv_path, PARTITION_DIR)
+
+@st.cache_data(max_entries=4)
+def load_data(start=None, end=None, version=None, _previous=None):
+    """Load the retail inventory data, optionally restricted to a date range.
+
+    `version` is the dataset's write counter (data_watch.WATCHER.version());
+    a new value loads the data again, reusing the unchanged months of
+    `_previous`, an earlier load of the same range.
+    """
     try:
-        # Try to load from notebooks directory
-        csv_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'notebooks', 'retail_store_inventory.csv')
-        if os.path.exists(csv_path):
-            df = pd.read_csv(csv_path)
-        else:
-            # Try current directory
-            csv_path = 'retail_store_inventory.csv'
-            df = pd.read_csv(csv_path)
-        
-        # Convert Date to datetime
-        df['Date'] = pd.to_datetime(df['Date'])
+        # Only the monthly partitions overlapping [start, end] are read.
+        # Rows come back sorted by Date, which slice_date_range relies on.
+        with span('data.load') as load_span:
+            dataset = open_dataset()
+            if _previous is None:
+                df = dataset.read(start, end)
+            else:
+                df = dataset.reread(_previous, start, end)
+            load_span['rows'] = len(df)
         return df
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return None
 
+def slice_date_range(df, start=None, end=None):
+    """Rows of a Date-sorted frame between `start` and `end` (inclusive).
+
+    The bounds are located by binary search on the sorted Date column, so
+    the result is a contiguous positional slice rather than a boolean mask.
+    """
+    dates = df['Date'].values
+    lo = 0
+    hi = len(df)
+    if start is not None:
+        lo = dates.searchsorted(pd.Timestamp(start).to_datetime64(), side='left')
+    if end is not None:
+        # Include every timestamp on the end day
+        next_day = (pd.Timestamp(end).normalize() + pd.Timedelta(days=1)).to_datetime64()
+        hi = dates.searchsorted(next_day, side='left')
+    return df.iloc[lo:hi]
+
+def data_key(df):
+    """Cache key for a Date-sorted view: its data version plus the rows it covers.
+
+    The version only covers the partitions inside the view, so keys of views
+    untouched by a data change stay valid. None when the frame does not come
+    from load_data.
+    """
+    version = frame_version(df)
+    if version is None:
+        return None
+    return (version, str(df['Date'].iloc[0]), str(df['Date'].iloc[-1]), len(df))
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _range_sketches(version, start, end):
+    return open_dataset().sketches(start, end)
+
+def range_sketches(df):
+    """Merged partition sketches for a view when approximate mode is on, else None"""
+    if not st.session_state.get('approximate_mode'):
+        return None
+    key = data_key(df)
+    if key is None:
+        return None
+    version, start, end, _ = key
+    return _range_sketches(version, start, end)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _elasticities(key, by, _df):
+    return elasticity.fit(_df, by)
+
+def price_elasticities(df, by_region=False):
+    """Elasticity estimates per product (or product and region), fitted once per data version and date range"""
+    by = ('Product ID', 'Region') if by_region else ('Product ID',)
+    key = data_key(df)
+    if key is None:
+        return elasticity.fit(df, by)
+    return _elasticities(key, by, df)
+
+@st.cache_resource(max_entries=2, show_spinner=False)
+def _series_store(key, _df):
+    return series_store.for_frame(_df)
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _shard_summary(key, categories, regions, stores, base_key, _base):
+    _, start, end, _ = key
+    return sharded.summarize(_series_store(base_key, _base), start, end, categories, regions, stores)
+
+def shard_summary(df, categories=(), regions=(), stores=()):
+    """Merged store-shard aggregates of a view when parallel aggregation is on, else None.
+
+    Shards read a series store of the session's full frame, restricted to
+    the view's dates and the given filters.
+    """
+    if not st.session_state.get('sharded_mode'):
+        return None
+    base = st.session_state.get('df')
+    key = data_key(df)
+    if key is None or base is None or data_key(base) is None:
+        return None
+    return _shard_summary(key, tuple(categories), tuple(regions), tuple(stores), data_key(base), base)
+
+def leaderboards(df):
+    """Incrementally maintained top-K boards when a view is the whole dataset, else None"""
+    if frame_version(df) is None:
+        return None
+    LEADERBOARDS.update(open_dataset())
+    return LEADERBOARDS.for_frame(df)
+
+def approximation_note(sketches, kind='distinct'):
+    """Error bound shown next to an approximate statistic"""
+    if kind == 'distinct':
+        return f"≈ HyperLogLog estimate, ±{sketches.distinct_error:.1%} (1σ)"
+    return f"≈ KLL estimate, ±{sketches.rank_error:.1%} rank error (99%)"
+
 def get_css():
     """Return custom CSS styles"""
     return """